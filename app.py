@@ -1,20 +1,91 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-import sqlite3, os, uuid
+from flask import Flask, Response, current_app, g, has_request_context, jsonify, render_template, request, redirect, url_for, session
+from flask import before_render_template, stream_template, template_rendered
+import sqlite3, os, uuid, time, json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
+from queue_policy import PRIORITIES, DEFAULT_POLICY, QUEUE_POLICIES, index_columns, order_by
+from assignment import MachineState, RECENT_JOBS, choose_machine, choose_many, explain, median
+from cycle_stats import EtaModel, add_sample, new_stat, summary
+from staffing_solver import StaffingProblem
+import consistency
+import events
+import kpi
+import line_config
+import load_planner
+import occupancy
+import outbox
+import readpool
+import stuck
+import topology
+import tracing
+from export import DATASETS, FORMATS, arrow_available, export_stream, filename as export_filename
+
+# Defaults for create_app(), overridable per app through its config argument
+DEFAULT_CONFIG = {
+    "SECRET_KEY": os.getenv("FLASK_SECRET_KEY", "dev_only_change_me"),
+    "DB_PATH": os.getenv("DB_PATH", "orders.db"),
+    # Production lines, each with its own database so their writes don't queue
+    # behind one lock: {line: db path}, e.g. LINES="north=north.db,south=south.db".
+    # Unset: a single line, "main", on DB_PATH.
+    "LINES": dict(p.split("=", 1) for p in os.getenv("LINES").split(",")) if os.getenv("LINES") else None,
+    # Queue discipline per station group, see queue_policy.QUEUE_POLICIES.
+    # cnc/edge order the Pending lanes the machines start from,
+    # tramming1/tramming2 order the Done lanes they move on.
+    "QUEUE_POLICY": {
+        "cnc": DEFAULT_POLICY,
+        "tramming1": DEFAULT_POLICY,
+        "edge": DEFAULT_POLICY,
+        "tramming2": DEFAULT_POLICY,
+    },
+    # Where ERP notifications go (http(s)://url, file:path or queue), see outbox.py.
+    # Unset: they wait in the outbox for `python outbox.py run`.
+    "OUTBOX_SINK": os.getenv("OUTBOX_SINK"),
+    # Stuck-order scan interval in seconds (0 = off, e.g. when `python stuck.py run`
+    # runs on its own) and where new alerts go besides the manager board, see stuck.py
+    "STUCK_SCAN_SECONDS": float(os.getenv("STUCK_SCAN_SECONDS", stuck.SCAN_SECONDS)),
+    "STUCK_NOTIFIER": os.getenv("STUCK_NOTIFIER"),
+    # Requests slower than this many ms are written to TRACE_FILE with their SQL,
+    # view and template spans (0 = no tracing), see tracing.py
+    "TRACE_SLOW_MS": float(os.getenv("TRACE_SLOW_MS", "500")),
+    "TRACE_FILE": os.getenv("TRACE_FILE", "traces/slow_requests.json"),
+    # Compiled templates are kept here between restarts (unset: a per-user
+    # folder in the system temp directory)
+    "JINJA_CACHE_DIR": os.getenv("JINJA_CACHE_DIR"),
+}
 
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev_only_change_me")
-DB_PATH = "orders.db"
+# Bump whenever init_db() gains a table, column or index
+SCHEMA_VERSION = 18
 
 # ----- Config -----
+# The line, in order, see topology.py. Station screens, home redirects,
+# staffing, manager columns and stuck lanes are all derived from it.
+TOPOLOGY = [
+    {"name": "preparing", "kind": "intake",   "label": "Preparing",  "next": "cnc"},
+    {"name": "cnc",       "kind": "machine",  "label": "CNC",        "next": "tramming1",
+     "stations": ["cnc1", "cnc2", "cnc3"], "capacity": 2, "topic": "cnc_finished"},
+    {"name": "tramming1", "kind": "transfer", "label": "Tramming 1", "source": "cnc", "next": "edge"},
+    {"name": "edge",      "kind": "machine",  "label": "Edge",       "next": "tramming2",
+     "stations": ["edge1", "edge2", "edge3", "edge4"],
+     "capacity": {"edge1": 5, "edge2": 4, "edge3": 3, "edge4": 3}},
+    {"name": "tramming2", "kind": "transfer", "label": "Tramming 2", "source": "edge", "next": "wrapping"},
+    {"name": "wrapping",  "kind": "slots",    "label": "Wrapping",   "next": "loading",
+     "slots": [1, 2, 3], "topic": "wrapping_finished"},
+    {"name": "loading",   "kind": "loading",  "label": "Loading"},
+]
+LINE = topology.compile(TOPOLOGY)
+
 PREPARING_STATION  = "preparing"
-CNC_STATIONS       = ["cnc1", "cnc2", "cnc3"]
+CNC_STATIONS       = LINE.stages["cnc"].stations
 TRAMMING1_STATION  = "tramming1"
 TRAMMING2_STATION  = "tramming2"
-EDGE_STATIONS      = ["edge1", "edge2", "edge3", "edge4"]
+EDGE_STATIONS      = LINE.stages["edge"].stations
 WRAPPING_STATION   = "wrapping"
 LOADING_STATION    = "loading"
 MANAGER_AREA       = "manager"
+TRANSFER_STATIONS  = [s for stage in LINE.stages.values() if stage.kind == "transfer" for s in stage.stations]
 
 # ----- Training config -----
 TRAINING_EMPLOYEES = [
@@ -30,19 +101,11 @@ TRAINING_EMPLOYEES = [
     ("jack_king",     "Jack King"),
 ]
 
+# Line stations first, e.g. "CNC 2" for cnc2, then the other skills
 TRAINING_STATIONS = [
-    ("preparing",          "Preparing"),
-    ("cnc1",               "CNC 1"),
-    ("cnc2",               "CNC 2"),
-    ("cnc3",               "CNC 3"),
-    ("tramming1",          "Tramming 1"),
-    ("edge1",              "Edge 1"),
-    ("edge2",              "Edge 2"),
-    ("edge3",              "Edge 3"),
-    ("edge4",              "Edge 4"),
-    ("tramming2",          "Tramming 2"),
-    ("wrapping",           "Wrapping"),
-    ("loading",            "Loading"),
+    (station, f"{stage.label} {station[len(stage.name):]}" if len(stage.stations) > 1 else stage.label)
+    for stage in LINE.stages.values() for station in stage.stations
+] + [
     ("forklift",           "Forklift"),
     ("extraction_system",  "Extraction system"),
     ("change_blades",      "Change blades"),
@@ -55,15 +118,7 @@ TRAINING_STATIONS = [
 STATION_LABELS = {code: label for code, label in TRAINING_STATIONS}
 
 # Stations that appear on Weekly staffing screen
-STAFFING_STATIONS = [
-    PREPARING_STATION,
-    *CNC_STATIONS,
-    TRAMMING1_STATION,
-    *EDGE_STATIONS,
-    TRAMMING2_STATION,
-    WRAPPING_STATION,
-    LOADING_STATION,
-]
+STAFFING_STATIONS = [station for stage in LINE.stages.values() for station in stage.stations]
 
 # Weekdays only, no weekend
 DAYS_OF_WEEK = [
@@ -75,36 +130,63 @@ DAYS_OF_WEEK = [
 ]
 
 # Group multiple machines into single columns in Manager view
-AREA_GROUPS = {
-    "cnc": CNC_STATIONS,
-    "edge": EDGE_STATIONS,
-}
+AREA_GROUPS = {stage.name: stage.stations for stage in topology.machine_stages(LINE)}
 
 # Columns shown on Manager screen, left to right
-MANAGER_STATIONS = [
-    PREPARING_STATION,
-    "cnc",
-    TRAMMING1_STATION,
-    "edge",
-    TRAMMING2_STATION,
-    WRAPPING_STATION,
-    LOADING_STATION,
+MANAGER_STATIONS = list(LINE.stages)
+
+# Defaults of the line settings; the ones in force are edited on the admin
+# page and read through line_settings(), see line_config.py
+CNC_CAPACITY        = LINE.stages["cnc"].capacity
+QUEUE_CAPACITY_PREP = max(CNC_CAPACITY.values())   # largest CNC lane, one figure for the benchmarks
+EDGE_CAPACITY       = LINE.stages["edge"].capacity
+WRAP_SLOTS          = LINE.stages["wrapping"].slots
+LORRY_CAPACITY      = 12          # orders of unknown size per lorry
+LORRY_VOLUME_M3     = 80.0
+LORRY_WEIGHT_KG     = 24000.0
+LORRY_FULL_FRACTION = 0.95        # volume or weight share at which a lorry may be completed
+
+# Route still ahead of an order, as (station or group, metric) segments.
+# wait = pending -> in progress (pending -> done at the tramming stations,
+# wrapping done -> loading in progress at loading), cycle = in progress -> done
+ETA_SEGMENTS = [
+    (stage.name if stage.kind == "machine" else stage.stations[0], metric)
+    for stage in LINE.stages.values()
+    for metric in {"machine": ("wait", "cycle"), "transfer": ("wait",),
+                   "slots": ("wait", "cycle"), "loading": ("wait", "cycle")}.get(stage.kind, ())
 ]
 
-QUEUE_CAPACITY_PREP = 2
-EDGE_CAPACITY       = {"edge1": 5, "edge2": 4, "edge3": 3, "edge4": 3}
-WRAP_SLOTS          = [1, 2, 3]
-LORRY_CAPACITY      = 12
+# Lanes the stuck-order scanner watches: (station, status, stats key, stats group).
+# Done orders wait for the next stage, so they are timed against its wait.
+STUCK_LANES = [
+    lane
+    for stage in topology.machine_stages(LINE) for m in stage.stations
+    for lane in [(m, "Pending", m, stage.name), (m, "In progress", m, stage.name),
+                 (m, "Done", topology.next_station(LINE, stage), None)]
+] + [
+    (WRAPPING_STATION, "Pending", WRAPPING_STATION, None),
+    (WRAPPING_STATION, "In progress", WRAPPING_STATION, None),
+    (WRAPPING_STATION, "Done", LOADING_STATION, None),
+    (LOADING_STATION, "In progress", LOADING_STATION, None),
+]
 
-# Settings keys
-KEY_LORRY1 = "lorry1_num"     # current number displayed on LEFT slot
-KEY_LORRY2 = "lorry2_num"     # current number displayed on RIGHT slot
-KEY_NEXT   = "next_lorry_num" # next number to assign to whichever slot completes next
+# Settings keys of the lorry numbers from before the lorries table, read
+# once by init_db() to open the first pair
+KEY_LORRY1 = "lorry1_num"     # number on the LEFT slot
+KEY_LORRY2 = "lorry2_num"     # number on the RIGHT slot
 
 # ----- DB init -----
-def init_db():
-    first_time = not os.path.exists(DB_PATH)
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
+def init_db(db_path):
+    conn = sqlite3.connect(db_path); c = conn.cursor()
+
+    # Schema already current, nothing to create or backfill
+    (version,) = c.execute("PRAGMA user_version").fetchone()
+    if version >= SCHEMA_VERSION:
+        conn.close()
+        return
+
+    # WAL lets long reads (exports, boards) run without blocking station writes
+    c.execute("PRAGMA journal_mode=WAL")
 
     c.execute("""
     CREATE TABLE IF NOT EXISTS orders (
@@ -117,7 +199,14 @@ def init_db():
         finished_at TEXT,
         lorry       TEXT,
         wrap_slot   INTEGER,
-        batch_id    TEXT
+        batch_id    TEXT,
+        priority    INTEGER NOT NULL DEFAULT 0,
+        due_at      TEXT,
+        est_minutes REAL,
+        lorry_id    INTEGER REFERENCES lorries(id),
+        volume_m3   REAL,
+        weight_kg   REAL,
+        route       TEXT
     )
     """)
 
@@ -179,6 +268,185 @@ def init_db():
         ON staffing_plan(station, day_of_week)
     """)
 
+    # Employees off for a weekday, the optimiser leaves them out
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS staffing_absence (
+        employee TEXT NOT NULL,
+        day_of_week TEXT NOT NULL,
+        PRIMARY KEY (employee, day_of_week)
+    )
+    """)
+
+    # Machine downtime, open while ended_at is NULL
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS downtime (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        area TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        comment TEXT,
+        started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        ended_at TEXT
+    )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_downtime_open
+        ON downtime(area, ended_at)
+    """)
+
+    # Audit trail of automatic machine assignments
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS assignment_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        area_group TEXT NOT NULL,
+        machine TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Online wait/cycle statistics per station and group, see cycle_stats.py
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS station_stats (
+        station TEXT NOT NULL,
+        metric TEXT NOT NULL,       -- 'wait' or 'cycle'
+        n INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        state TEXT NOT NULL,        -- JSON running stat with quantile sketches
+        PRIMARY KEY (station, metric)
+    )
+    """)
+
+    # Per-machine history lookups (cycle times, latest status)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_history_station_status
+        ON order_history(station, status, changed_at)
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_history_order_station
+        ON order_history(order_id, station, status)
+    """)
+
+    # Append-only order events, `orders` is their projection (see events.py)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS order_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        station TEXT,
+        actor TEXT,
+        payload TEXT NOT NULL,      -- JSON {"row": orders row after the change, "history": [...]}
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_order   ON order_events(order_id, seq)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON order_events(created_at)")
+    for op in ("UPDATE", "DELETE"):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS order_events_no_{op.lower()}
+            BEFORE {op} ON order_events
+            BEGIN SELECT RAISE(ABORT, 'order_events is append-only'); END
+        """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS order_snapshots (
+        seq INTEGER PRIMARY KEY,    -- last event included
+        created_at TEXT NOT NULL,   -- that event's time
+        orders INTEGER NOT NULL,
+        state BLOB NOT NULL         -- zlib JSON rows, events.ORDER_COLUMNS
+    )
+    """)
+
+    # ERP notifications, written with the change and sent by outbox.Dispatcher
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        key TEXT NOT NULL,          -- receivers dedupe on this
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,   -- unix seconds
+        next_attempt_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        delivered_at REAL
+    )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON outbox(next_attempt_at, id) WHERE delivered_at IS NULL
+    """)
+
+    # Lorry manifests: two open at a time (slot 1 and 2), closed when completed
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS lorries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        number INTEGER NOT NULL UNIQUE,
+        slot INTEGER,               -- 1 = left, 2 = right on the Loading screen, NULL if not known
+        capacity INTEGER NOT NULL,
+        max_volume_m3 REAL,
+        max_weight_kg REAL,
+        status TEXT NOT NULL DEFAULT 'open',    -- 'open' or 'closed'
+        opened_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        closed_at TEXT
+    )
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_lorries_open_slot ON lorries(slot) WHERE status='open'")
+
+    # Planned lorry slot for each order ready at Wrapping, NULL = waits for the next lorry (see plan_loads)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS load_plan (
+        order_id INTEGER PRIMARY KEY,
+        slot INTEGER
+    )
+    """)
+
+    # Orders over their lane's time threshold, one row per stay (see stuck.py)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stuck_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        order_number TEXT,
+        station TEXT NOT NULL,
+        status TEXT NOT NULL,
+        since TEXT NOT NULL,        -- when the order entered the lane (UTC)
+        threshold_minutes REAL NOT NULL,
+        raised_at REAL NOT NULL,    -- unix seconds
+        notified_at REAL,
+        resolved_at REAL
+    )
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stuck_stay ON stuck_alerts(order_id, station, status, since)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stuck_open ON stuck_alerts(since) WHERE resolved_at IS NULL")
+
+    # Responses to mutating requests by idempotency key, replayed on retries
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,   -- user id + ':' + client key
+        created_at REAL NOT NULL,   -- unix seconds
+        status INTEGER,             -- NULL while the request is running
+        mimetype TEXT,
+        location TEXT,
+        body BLOB
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+
+    # Manager board figures, counted as transitions happen (see kpi.py)
+    kpi.create(c)
+
+    # Export filters and keyset pagination
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_changed ON order_history(changed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_station_changed ON order_history(station, changed_at)")
+
+    # Station occupancy (see occupancy.py): an order's next history row, and
+    # the longest span per station that bounds the interval lookups
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_order ON order_history(order_id)")
+    occupancy.create(c)
+
+    # Capacities and slots editable on the admin page, versioned (see line_config.py)
+    line_config.create(c)
+    line_config.seed(c, line_config.values(LINE, LORRY_CAPACITY))
+
     # Backfill columns, safe if already exist
     for alter in [
         "ALTER TABLE orders ADD COLUMN current_station TEXT",
@@ -188,65 +456,246 @@ def init_db():
         "ALTER TABLE orders ADD COLUMN lorry TEXT",
         "ALTER TABLE orders ADD COLUMN wrap_slot INTEGER",
         "ALTER TABLE orders ADD COLUMN batch_id TEXT",
+        "ALTER TABLE orders ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE orders ADD COLUMN due_at TEXT",
+        "ALTER TABLE orders ADD COLUMN est_minutes REAL",
+        "ALTER TABLE orders ADD COLUMN lorry_id INTEGER REFERENCES lorries(id)",
+        "ALTER TABLE orders ADD COLUMN volume_m3 REAL",
+        "ALTER TABLE orders ADD COLUMN weight_kg REAL",
+        "ALTER TABLE orders ADD COLUMN route TEXT",
+        "ALTER TABLE lorries ADD COLUMN max_volume_m3 REAL",
+        "ALTER TABLE lorries ADD COLUMN max_weight_kg REAL",
+        "ALTER TABLE staffing_plan ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0",
     ]:
         try: c.execute(alter)
         except sqlite3.OperationalError: pass
 
-    # Seed accounts on first run
-    if first_time:
-        def add_user(u, pw, role, area):
-            c.execute("INSERT OR IGNORE INTO users (username,password_hash,role,area) VALUES (?,?,?,?)",
-                      (u, generate_password_hash(pw), role, area))
-        # station users
-        add_user(PREPARING_STATION, "prep123", "station", PREPARING_STATION)
-        for n in CNC_STATIONS: add_user(n, "cnc123", "station", n)
-        add_user(TRAMMING1_STATION, "tram123", "station", TRAMMING1_STATION)
-        add_user(TRAMMING2_STATION, "tram123", "station", TRAMMING2_STATION)
-        for n in EDGE_STATIONS: add_user(n, "edge123", "station", n)
-        add_user(WRAPPING_STATION, "wrap123", "station", WRAPPING_STATION)
-        add_user(LOADING_STATION,  "load123", "station", LOADING_STATION)
-        # manager user
-        add_user("manager", "manager123", "manager", MANAGER_AREA)
-
-    # Lorry numbers
-    c.execute("INSERT OR IGNORE INTO settings (key,value) VALUES (?,?)", (KEY_LORRY1, "1"))
-    c.execute("INSERT OR IGNORE INTO settings (key,value) VALUES (?,?)", (KEY_LORRY2, "2"))
-    c.execute("INSERT OR IGNORE INTO settings (key,value) VALUES (?,?)", (KEY_NEXT,   "3"))
-
-    c.execute("SELECT value FROM settings WHERE key=?", (KEY_LORRY1,)); l1 = int((c.fetchone() or ["1"])[0])
-    c.execute("SELECT value FROM settings WHERE key=?", (KEY_LORRY2,)); l2 = int((c.fetchone() or ["2"])[0])
-    c.execute("SELECT value FROM settings WHERE key=?", (KEY_NEXT,));   nx = int((c.fetchone() or ["3"])[0])
-
-    changed = False
-    if l2 == l1:
-        l2 = l1 + 1
-        c.execute("UPDATE settings SET value=? WHERE key=?", (str(l2), KEY_LORRY2)); changed = True
-    if nx <= max(l1, l2):
-        nx = max(l1, l2) + 1
-        c.execute("UPDATE settings SET value=? WHERE key=?", (str(nx), KEY_NEXT)); changed = True
-    if changed: conn.commit()
+    # Lane indexes by arrival time (FIFO lanes, in progress); the other queue
+    # disciplines get theirs from ensure_lane_indexes(). The due / est ones
+    # only filtered, their ORDER BYs still sorted.
+    c.execute("DROP INDEX IF EXISTS idx_orders_lane_due")
+    c.execute("DROP INDEX IF EXISTS idx_orders_lane_est")
+    for idx in [
+        "CREATE INDEX IF NOT EXISTS idx_orders_lane_queued   ON orders(current_station, status, queued_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_lane_finished ON orders(current_station, status, finished_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_lane_started  ON orders(current_station, status, started_at)",
+    ]:
+        c.execute(idx)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_station ON orders(current_station)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_lorry   ON orders(lorry)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_number  ON orders(order_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_lorry_load ON orders(lorry_id, status, finished_at)")
+
+    # Orders from before the event store start with an 'imported' event
+    if not c.execute("SELECT 1 FROM order_events LIMIT 1").fetchone():
+        events.import_orders(c)
+
+    # Lorries from before the manifest table: the old settings counters (if
+    # any) give the open pair, earlier labels on loaded orders become closed
+    # manifests. From here on the lorries table holds the numbers.
+    backfilled = 0
+    if not c.execute("SELECT 1 FROM lorries LIMIT 1").fetchone():
+        c.execute("SELECT key, value FROM settings WHERE key IN (?,?)", (KEY_LORRY1, KEY_LORRY2))
+        old = dict(c.fetchall())
+        l1 = int(old.get(KEY_LORRY1, 1))
+        l2 = int(old.get(KEY_LORRY2, 2))
+        if l2 == l1:
+            l2 = l1 + 1
+        c.executemany("INSERT INTO lorries (number, slot, capacity) VALUES (?,?,?)",
+                      [(l1, 1, LORRY_CAPACITY), (l2, 2, LORRY_CAPACITY)])
+        c.execute("""
+            INSERT OR IGNORE INTO lorries (number, slot, capacity, status, opened_at, closed_at)
+            SELECT CAST(substr(lorry, 7) AS INTEGER), NULL, ?, 'closed', MIN(started_at), MAX(finished_at)
+            FROM orders WHERE lorry LIKE 'Lorry %' GROUP BY lorry
+        """, (LORRY_CAPACITY,))
+        c.execute("""
+            UPDATE orders SET lorry_id = (SELECT id FROM lorries WHERE 'Lorry ' || number = orders.lorry)
+            WHERE lorry IS NOT NULL AND lorry_id IS NULL
+        """)
+        backfilled = c.rowcount
+    c.execute("UPDATE lorries SET max_volume_m3=? WHERE max_volume_m3 IS NULL", (LORRY_VOLUME_M3,))
+    c.execute("UPDATE lorries SET max_weight_kg=? WHERE max_weight_kg IS NULL", (LORRY_WEIGHT_KG,))
+
+    # Counters start from what history and the manifests already hold
+    if not c.execute("SELECT 1 FROM kpi_counters LIMIT 1").fetchone():
+        kpi.reconcile(c)
+    # Version 18: a machine's done span lasts until the transfer moves the order
+    if version < 18 or not c.execute("SELECT 1 FROM span_bounds LIMIT 1").fetchone():
+        occupancy.rebuild(c, TRANSFER_STATIONS)
+
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    # Older events don't carry lorry_id, a snapshot makes the replay start from here
+    if backfilled:
+        events.snapshot(conn)
+    conn.close()
 
+def ensure_lane_indexes(db_path, policies):
+    """
+    An index matching each configured queue discipline's ORDER BY (see
+    queue_policy.index_columns()), so the first job of every lane is an
+    index walk: Pending lanes of machine groups by queued_at, Done lanes of
+    transfer groups by finished_at. Only disciplines in use get one, since
+    each is written on every transition; FIFO uses the arrival indexes.
+    """
+    conn = sqlite3.connect(db_path); c = conn.cursor()
+    for group, policy in policies.items():
+        stage = LINE.stages.get(group)
+        if policy == "fifo" or policy not in QUEUE_POLICIES or not stage or stage.kind not in ("machine", "transfer"):
+            continue
+        arrival, suffix = ("queued_at", "") if stage.kind == "machine" else ("finished_at", "_done")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_orders_lane_{policy}{suffix} "
+                  f"ON orders(current_station, status, {index_columns(policy, arrival)})")
     conn.commit(); conn.close()
 
-def ensure_users():
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    def ensure(u, pw, role, area):
-        c.execute("INSERT OR IGNORE INTO users (username,password_hash,role,area) VALUES (?,?,?,?)",
-                  (u, generate_password_hash(pw), role, area))
-    ensure(PREPARING_STATION, "prep123", "station", PREPARING_STATION)
-    for n in CNC_STATIONS: ensure(n, "cnc123", "station", n)
-    ensure(TRAMMING1_STATION, "tram123", "station", TRAMMING1_STATION)
-    ensure(TRAMMING2_STATION, "tram123", "station", TRAMMING2_STATION)
-    for n in EDGE_STATIONS: ensure(n, "edge123", "station", n)
-    ensure(WRAPPING_STATION, "wrap123", "station", WRAPPING_STATION)
-    ensure(LOADING_STATION,  "load123", "station", LOADING_STATION)
-    ensure("manager", "manager123", "manager", MANAGER_AREA)
-    conn.commit(); conn.close()
+# Demo accounts, (username, password, role, area): one per station, the
+# password by stage, e.g. cnc123 for every CNC
+SEED_PASSWORDS = {"preparing": "prep123", "tramming1": "tram123", "tramming2": "tram123",
+                  "wrapping": "wrap123", "loading": "load123"}
+SEED_USERS = [
+    (station, SEED_PASSWORDS.get(stage.name, f"{stage.name}123"), "station", station)
+    for stage in LINE.stages.values() for station in stage.stations
+] + [
+    ("manager", "manager123", "manager", MANAGER_AREA),
+]
 
-init_db(); ensure_users()
+def ensure_users(db_path):
+    """
+    Insert any missing demo account. Password hashing is the slow part,
+    so only missing users are hashed, and each distinct password once.
+    """
+    conn = sqlite3.connect(db_path); c = conn.cursor()
+    c.execute("SELECT username FROM users")
+    existing = {r[0] for r in c.fetchall()}
+    missing = [u for u in SEED_USERS if u[0] not in existing]
+    if missing:
+        hashes = {}
+        for u, pw, role, area in missing:
+            if pw not in hashes:
+                hashes[pw] = generate_password_hash(pw)
+            c.execute("INSERT OR IGNORE INTO users (username,password_hash,role,area) VALUES (?,?,?,?)",
+                      (u, hashes[pw], role, area))
+        conn.commit()
+    conn.close()
+
+LINES_FANOUT_WORKERS = 8    # threads asking the line databases at once, see lines_view()
+
+# ----- app factory -----
+# Views register themselves here through @route and are bound in create_app(),
+# so importing this module does no work.
+ROUTES = []
+
+def route(rule, **options):
+    def decorator(f):
+        ROUTES.append((rule, f, options))
+        return f
+    return decorator
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    if app.config["JINJA_CACHE_DIR"]:
+        os.makedirs(app.config["JINJA_CACHE_DIR"], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["JINJA_CACHE_DIR"])
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view.__name__, view, **options)
+    # One screen per machine and transfer stage, all served by the station engine
+    app.extensions["routing"] = topology.compile(TOPOLOGY, app.config["QUEUE_POLICY"])
+    for stage in app.extensions["routing"].stages.values():
+        if stage.kind in STAGE_VIEWS:
+            app.add_url_rule(f"/{stage.name}", stage.endpoint, STAGE_VIEWS[stage.kind],
+                             defaults={"stage": stage.name}, methods=["GET", "POST"])
+    if app.config["TRACE_SLOW_MS"]:
+        app.extensions["traces"] = tracing.TraceFile(app.config["TRACE_FILE"])
+        app.before_request(trace_begin)
+        app.after_request(trace_status)
+        app.teardown_request(trace_end)
+        before_render_template.connect(trace_template_begin, app)
+        template_rendered.connect(trace_template_end, app)
+    app.before_request(idempotency_replay)
+    app.after_request(idempotency_store)
+    app.teardown_request(idempotency_release)
+    app.config["LINES"] = app.config["LINES"] or {"main": app.config["DB_PATH"]}
+    app.extensions["fanout"] = ThreadPoolExecutor(min(LINES_FANOUT_WORKERS, len(app.config["LINES"])),
+                                                  thread_name_prefix="lines")
+    app.extensions["outbox"], app.extensions["stuck"] = {}, {}
+    app.extensions["line_config"] = line_config.Cache()
+    for line, path in app.config["LINES"].items():
+        init_db(path)
+        ensure_lane_indexes(path, app.config["QUEUE_POLICY"])
+        ensure_users(path)
+        if app.config["OUTBOX_SINK"]:
+            app.extensions["outbox"][line] = outbox.Dispatcher(
+                path, outbox.sink_from_spec(app.config["OUTBOX_SINK"])).start()
+        if app.config["STUCK_SCAN_SECONDS"]:
+            notifier = app.config["STUCK_NOTIFIER"]
+            app.extensions["stuck"][line] = stuck.Scanner(
+                path, STUCK_LANES, outbox.sink_from_spec(notifier) if notifier else None,
+                app.config["STUCK_SCAN_SECONDS"]).start()
+    return app
 
 # ----- helpers -----
-def get_db(): return sqlite3.connect(DB_PATH)
+def current_line():
+    """
+    The production line of this request: the one signed in to, or for a
+    manager the one picked with ?line=. The first line outside a request.
+    """
+    lines = current_app.config["LINES"]
+    line = None
+    if has_request_context():
+        line = session.get("line")
+        wanted = request.args.get("line")
+        if wanted in lines and (session.get("area") or "").lower() == MANAGER_AREA:
+            line = wanted
+    return line if line in lines else next(iter(lines))
+
+def db_path(): return current_app.config["LINES"][current_line()]
+
+def get_db(): return sqlite3.connect(db_path(), factory=tracing.TracedConnection)
+
+def get_read_db():
+    """
+    A pooled read-only connection to the current line (see readpool.py), for
+    the GET-only pages; close() hands it back.
+    """
+    return readpool.pool(db_path()).get()
+
+def line_settings():
+    """
+    (settings, routing) in force on the current line: the worker's cached
+    copy, checked against the database's version once per request, see
+    line_config.py.
+    """
+    path = db_path()
+    checked = g.setdefault("line_settings", {})
+    if path not in checked:
+        conn = get_read_db()
+        checked[path] = current_app.extensions["line_config"].get(conn, path, current_app.extensions["routing"])
+        conn.close()
+    return checked[path]
+
+def routing():
+    """
+    The app's compiled line with the current line's settings (capacities,
+    slots) applied, and its lane queries, see topology.py.
+    """
+    return line_settings()[1]
+
+def lorry_capacity():
+    """Orders per lorry in force on the current line."""
+    return line_settings()[0].lorry_capacity
+
+def default_order_size():
+    """(m³, kg) counted for an order without dimensions: an equal share of a lorry."""
+    n = lorry_capacity()
+    return LORRY_VOLUME_M3 / n, LORRY_WEIGHT_KG / n
+
+def lane_order(group, arrival="queued_at"):
+    """ORDER BY for a lane, using the queue policy configured for its station group."""
+    policy = current_app.config["QUEUE_POLICY"].get(group, DEFAULT_POLICY)
+    return order_by(policy, arrival)
 
 def get_setting(key, default="1"):
     conn = get_db(); c = conn.cursor()
@@ -263,25 +712,287 @@ def set_setting(key, value):
     )
     conn.commit(); conn.close()
 
-def get_lorry_state():
-    l1 = int(get_setting(KEY_LORRY1, "1"))
-    l2 = int(get_setting(KEY_LORRY2, "2"))
-    nx = int(get_setting(KEY_NEXT,   str(max(l1, l2) + 1)))
-    if l2 == l1:
-        l2 = l1 + 1; set_setting(KEY_LORRY2, str(l2))
-    if nx <= max(l1, l2):
-        nx = max(l1, l2) + 1; set_setting(KEY_NEXT, str(nx))
-    return f"Lorry {l1}", f"Lorry {l2}", l1, l2, nx
-
-def advance_lorry(slot: int):
-    l1 = int(get_setting(KEY_LORRY1, "1"))
-    l2 = int(get_setting(KEY_LORRY2, "2"))
-    nx = int(get_setting(KEY_NEXT,   str(max(l1, l2) + 1)))
-    if slot == 1:
-        set_setting(KEY_LORRY1, str(nx))
+def open_lorries(c):
+    """{slot: (lorry id, number, capacity)} for the two lorries being loaded."""
+    c.execute("SELECT slot, id, number, capacity FROM lorries WHERE status='open'")
+    return {r[0]: r[1:] for r in c.fetchall()}
+
+def close_lorry(slot):
+    """
+    Closes a fully loaded lorry, opens the next number in its slot and queues
+    the ERP notification, in one transaction. Returns an error message, or
+    None when it was closed.
+    """
+    conn = get_db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    fill = lorry_fill(c)[slot]
+    lorry_id, number = fill["id"], fill["number"]
+    if not fill["full"] or fill["loading"]:
+        conn.rollback(); conn.close()
+        return "Lorry is not fully loaded yet."
+    c.execute("UPDATE lorries SET status='closed', closed_at=CURRENT_TIMESTAMP WHERE id=?", (lorry_id,))
+    kpi.bump(c, "closed", "")
+    c.execute("""
+        INSERT INTO lorries (number, slot, capacity, max_volume_m3, max_weight_kg)
+        SELECT MAX(number) + 1, ?, ?, ?, ? FROM lorries
+    """, (slot, lorry_capacity(), LORRY_VOLUME_M3, LORRY_WEIGHT_KG))
+    c.execute("""
+        SELECT order_number FROM orders
+        WHERE lorry_id=? AND current_station='loading' AND status='Done'
+        ORDER BY finished_at
+    """, (lorry_id,))
+    label = f"Lorry {number}"
+    outbox.enqueue(c, "lorry_completed", f"lorry_completed:{label}", {
+        "lorry": label,
+        "orders": [r[0] for r in c.fetchall()],
+        "completed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+    })
+    plan_loads(c, reset=True)
+    conn.commit(); conn.close()
+    return None
+
+# ----- Load planning -----
+def lorry_fill(c):
+    """
+    {slot: {...}} for the open lorries: id, number, max_volume, max_weight,
+    volume and weight on board or being loaded, loading (jobs in progress),
+    routes, full (may be completed).
+    """
+    c.execute("""
+        SELECT l.slot, l.id, l.number, l.capacity, l.max_volume_m3, l.max_weight_kg,
+               COUNT(o.id), SUM(COALESCE(o.volume_m3, ?)), SUM(COALESCE(o.weight_kg, ?)),
+               SUM(o.status='In progress'), json_group_array(DISTINCT o.route)
+        FROM lorries l LEFT JOIN orders o ON o.lorry_id = l.id AND o.current_station='loading'
+        WHERE l.status='open'
+        GROUP BY l.id
+    """, default_order_size())
+    fill = {}
+    for slot, lid, number, capacity, max_v, max_w, n, vol, wt, loading, routes in c.fetchall():
+        vol, wt = (vol or 0.0) if n else 0.0, (wt or 0.0) if n else 0.0
+        fill[slot] = {
+            "id": lid, "number": number, "orders": n, "loading": loading or 0,
+            "max_volume": max_v, "max_weight": max_w, "volume": vol, "weight": wt,
+            "routes": [r for r in json.loads(routes) if r],
+            "full": n >= capacity or vol >= LORRY_FULL_FRACTION * max_v or wt >= LORRY_FULL_FRACTION * max_w,
+        }
+    return fill
+
+def plan_loads(c, reset=False):
+    """
+    Re-plans the orders ready at Wrapping onto the open lorries, in the
+    caller's transaction, and stores it in load_plan. Keeps the previous
+    plan where it still fits unless reset (a lorry was swapped).
+    """
+    fill = lorry_fill(c)
+    lorries = [load_planner.Lorry(slot, f["max_volume"] - f["volume"], f["max_weight"] - f["weight"], f["routes"])
+               for slot, f in sorted(fill.items())]
+    c.execute("""
+        SELECT o.id, COALESCE(o.volume_m3, ?), COALESCE(o.weight_kg, ?), o.route, p.slot
+        FROM orders o LEFT JOIN load_plan p ON p.order_id = o.id
+        WHERE o.current_station='wrapping' AND o.status='Done'
+        ORDER BY o.finished_at, o.id
+    """, default_order_size())
+    rows = c.fetchall()
+    items = [load_planner.Item(*r[:4]) for r in rows]
+    previous = {} if reset else {r[0]: r[4] for r in rows}
+    placement = load_planner.plan(items, lorries, previous)
+    c.execute("DELETE FROM load_plan")
+    c.executemany("INSERT INTO load_plan (order_id, slot) VALUES (?,?)", placement.items())
+    return placement
+
+def lorry_manifest(c, number):
+    """A lorry by number and its orders in loading order, or None."""
+    cols = ["id", "number", "slot", "capacity", "max_volume_m3", "max_weight_kg", "status", "opened_at", "closed_at"]
+    c.execute(f"SELECT {', '.join(cols)} FROM lorries WHERE number=?", (number,))
+    row = c.fetchone()
+    if not row:
+        return None
+    lorry = dict(zip(cols, row))
+    cols = ["id", "order_number", "status", "batch_id", "started_at", "finished_at", "volume_m3", "weight_kg", "route"]
+    c.execute(f"""
+        SELECT {", ".join(cols)} FROM orders
+        WHERE lorry_id=? ORDER BY finished_at IS NULL, finished_at, id
+    """, (lorry["id"],))
+    lorry["orders"] = [dict(zip(cols, r)) for r in c.fetchall()]
+    return lorry
+
+# Auto-assignment helpers
+DOWNTIME_KINDS = ["breakdown", "maintenance", "changeover", "material_shortage", "other"]
+
+CYCLE_CACHE_SECONDS = 60
+_cycle_cache = {}   # db path -> (loaded at, {machine: median minutes})
+
+def recent_cycle_times(c):
+    """
+    Median in_progress -> done minutes over each machine's last RECENT_JOBS jobs.
+    Cached per worker for CYCLE_CACHE_SECONDS, so assignments read memory.
+    """
+    key = db_path()
+    hit = _cycle_cache.get(key)
+    if hit and time.monotonic() - hit[0] < CYCLE_CACHE_SECONDS:
+        return hit[1]
+    machines = [m for stage in topology.machine_stages(LINE) for m in stage.stations]
+    c.execute(f"""
+        SELECT station, minutes FROM (
+            SELECT d.station,
+                   (julianday(d.changed_at) - julianday(s.changed_at)) * 1440 AS minutes,
+                   ROW_NUMBER() OVER (PARTITION BY d.station ORDER BY d.changed_at DESC) AS rn
+            FROM order_history d
+            JOIN order_history s
+              ON s.order_id = d.order_id AND s.station = d.station AND s.status = 'in_progress'
+            WHERE d.status = 'done' AND d.station IN ({",".join("?" * len(machines))})
+        )
+        WHERE rn <= ?
+    """, (*machines, RECENT_JOBS))
+    samples = {}
+    for station, minutes in c.fetchall():
+        samples.setdefault(station, []).append(minutes)
+    cycles = {m: median(v) for m, v in samples.items()}
+    _cycle_cache[key] = (time.monotonic(), cycles)
+    return cycles
+
+def machine_states(c, machines, capacity_of):
+    marks = ",".join("?" * len(machines))
+    c.execute(f"""
+        SELECT current_station,
+               SUM(status='Pending'),
+               MAX(CASE WHEN status='In progress'
+                        THEN (julianday('now') - julianday(started_at)) * 1440 END)
+        FROM orders
+        WHERE current_station IN ({marks}) AND status IN ('Pending','In progress')
+        GROUP BY current_station
+    """, machines)
+    lanes = {r[0]: (r[1] or 0, r[2]) for r in c.fetchall()}
+    c.execute(f"""
+        SELECT area, MIN((julianday('now') - julianday(started_at)) * 1440)
+        FROM downtime
+        WHERE ended_at IS NULL AND area IN ({marks})
+        GROUP BY area
+    """, machines)
+    down = dict(c.fetchall())
+    cycles = recent_cycle_times(c)
+    return [
+        MachineState(m, lanes.get(m, (0, None))[0], capacity_of(m),
+                     lanes.get(m, (0, None))[1], cycles.get(m), down.get(m))
+        for m in machines
+    ]
+
+def auto_assign(c, machines, capacity_of):
+    """Returns (machine or None if all full, reasoning line)."""
+    chosen, preds = choose_machine(machine_states(c, machines, capacity_of))
+    return chosen, explain(chosen, preds)
+
+def log_assignment(order_id: int, area_group: str, machine: str, reason: str, c=None):
+    own = c is None
+    if own:
+        conn = get_db(); c = conn.cursor()
+    c.execute("INSERT INTO assignment_log (order_id, area_group, machine, reason) VALUES (?,?,?,?)",
+              (order_id, area_group, machine, reason))
+    if own:
+        conn.commit(); conn.close()
+
+# Idempotency keys: a POST carrying an Idempotency-Key header or an
+# idempotency_key form field runs once per signed-in user, retries get the
+# stored response. Keys live IDEMPOTENCY_TTL seconds, at most IDEMPOTENCY_MAX_KEYS.
+IDEMPOTENCY_TTL = 3600
+IDEMPOTENCY_MAX_KEYS = 10000
+IDEMPOTENCY_STALE = 60      # a claim left running this long is taken as abandoned
+
+def idempotency_key():
+    if request.method != "POST" or not session.get("user_id"):
+        return None
+    key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    return f"{session['user_id']}:{key[:100]}" if key else None
+
+def idempotency_replay():
+    key = idempotency_key()
+    if not key:
+        return None
+    now = time.time()
+    conn = get_db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("SELECT id, created_at, status, mimetype, location, body FROM idempotency_keys WHERE key=?", (key,))
+    row = c.fetchone()
+    if row and row[2] is None and now - row[1] > IDEMPOTENCY_STALE:
+        c.execute("DELETE FROM idempotency_keys WHERE id=?", (row[0],))
+        row = None
+    if row is None:
+        c.execute("INSERT INTO idempotency_keys (key, created_at) VALUES (?,?)", (key, now))
+        claim = c.lastrowid
+        # Cheap cleanup on each claim: expired keys by time, the oldest by id past the cap
+        c.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL,))
+        c.execute("DELETE FROM idempotency_keys WHERE id <= ?", (claim - IDEMPOTENCY_MAX_KEYS,))
+        conn.commit(); conn.close()
+        g.idempotency_claim = claim
+        return None
+    conn.close()
+    if row[2] is None:
+        return ("Already being processed, try again in a moment.", 409)
+    resp = Response(row[5], status=row[2], mimetype=row[3])
+    if row[4]:
+        resp.headers["Location"] = row[4]
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+def idempotency_store(resp):
+    claim = g.pop("idempotency_claim", None)
+    if claim is None:
+        return resp
+    conn = get_db()
+    if resp.status_code >= 500 or resp.is_streamed:
+        conn.execute("DELETE FROM idempotency_keys WHERE id=?", (claim,))
     else:
-        set_setting(KEY_LORRY2, str(nx))
-    set_setting(KEY_NEXT, str(nx + 1))
+        conn.execute("UPDATE idempotency_keys SET status=?, mimetype=?, location=?, body=? WHERE id=?",
+                     (resp.status_code, resp.mimetype, resp.headers.get("Location"), resp.get_data(), claim))
+    conn.commit(); conn.close()
+    return resp
+
+def idempotency_release(exc):
+    """The request failed before a response was stored: free the key for a retry."""
+    claim = g.pop("idempotency_claim", None)
+    if claim is not None:
+        conn = get_db()
+        conn.execute("DELETE FROM idempotency_keys WHERE id=?", (claim,))
+        conn.commit(); conn.close()
+
+# Tracing: every request is traced when TRACE_SLOW_MS is set and the slow
+# ones are written to TRACE_FILE, see tracing.py.
+def trace_begin():
+    tracing.begin(f"{request.method} {request.path}", endpoint=request.endpoint, area=session.get("area"))
+
+def trace_status(resp):
+    trace = tracing.current()
+    if trace:
+        trace.args["status"] = resp.status_code
+        if resp.is_streamed:
+            # A streamed page (the manager board) renders after teardown:
+            # the trace ends when the server has sent the last piece
+            trace.args["streamed"] = True
+            resp.call_on_close(lambda app=current_app._get_current_object(): trace_write(app, tracing.end()))
+    return resp
+
+def trace_end(exc):
+    trace = tracing.current()
+    if trace and trace.args.get("streamed"):
+        return
+    trace = tracing.end()
+    if trace and exc is not None:
+        trace.args["error"] = repr(exc)
+    trace_write(current_app, trace)
+
+def trace_write(app, trace):
+    if trace and trace.ms >= app.config["TRACE_SLOW_MS"]:
+        app.extensions["traces"].write(trace)
+
+def trace_template_begin(sender, template, context, **extra):
+    trace = tracing.current()
+    if trace:
+        trace.templates.append(time.perf_counter())
+
+def trace_template_end(sender, template, context, **extra):
+    trace = tracing.current()
+    if trace and trace.templates:
+        trace.add("render", template.name, trace.templates.pop(), time.perf_counter())
 
 def login_required(f):
     from functools import wraps
@@ -292,19 +1003,413 @@ def login_required(f):
         return f(*a, **kw)
     return wrapped
 
+def area_group(station):
+    """Manager column for a station, e.g. cnc2 -> cnc."""
+    stage = LINE.by_station.get(station)
+    return stage.name if stage and stage.kind == "machine" else station
+
 # History helpers
-def log_status(order_id: int, station: str, status: str):
-    conn = get_db(); c = conn.cursor()
-    c.execute("INSERT INTO order_history (order_id, station, status) VALUES (?,?,?)",
-              (order_id, station, status))
-    conn.commit(); conn.close()
+def log_status(order_id: int, station: str, status: str, c=None, kind=None, at=None):
+    log_many([(order_id, station, status)], c, kind, at)
 
-def log_many(pairs):
+def log_many(pairs, c=None, kind=None, at=None):
+    """
+    Logs transitions to station_stats, order_history, order_events, the
+    KPI counters and the occupancy span bounds.
+    Pass the cursor that changed `orders` (after BEGIN IMMEDIATE) to log in
+    the same transaction, the caller commits. Without one, logs on its own.
+    at: UTC time the transitions happened, if not now (synced offline actions).
+    """
     if not pairs:
         return
-    conn = get_db(); c = conn.cursor()
-    c.executemany("INSERT INTO order_history (order_id, station, status) VALUES (?,?,?)", pairs)
-    conn.commit(); conn.close()
+    own = c is None
+    if own:
+        conn = get_db(); c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+    record_stats(c, pairs, at)
+    occupancy.extend(c, pairs, at, TRANSFER_STATIONS)
+    c.executemany("INSERT INTO order_history (order_id, station, status, changed_at) "
+                  "VALUES (?,?,?,COALESCE(?, CURRENT_TIMESTAMP))", [(*p, at) for p in pairs])
+    kpi.count_transitions(c, pairs, LOADING_STATION, at)
+    snapshot_due = events.append(c, pairs, kind, session.get("username") if has_request_context() else None, at)
+    if own:
+        conn.commit(); conn.close()
+    if snapshot_due:
+        events.snapshot_in_background(db_path())
+
+def _minutes_since(c, order_id, station, status, at=None):
+    c.execute("""
+        SELECT (julianday(COALESCE(?, 'now')) - julianday(changed_at)) * 1440
+        FROM order_history
+        WHERE order_id=? AND station=? AND status=?
+        ORDER BY id DESC LIMIT 1
+    """, (at, order_id, station, status))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def record_stats(c, pairs, at=None):
+    """
+    Fold the wait/cycle span each transition closes into station_stats,
+    for the station and its group. Call before the pairs are logged.
+    """
+    for oid, station, status in pairs:
+        if status == "in_progress":
+            if station == LOADING_STATION:
+                minutes = _minutes_since(c, oid, WRAPPING_STATION, "done", at)
+            else:
+                minutes = _minutes_since(c, oid, station, "pending", at)
+            metric = "wait"
+        elif status == "done":
+            metric, minutes = "cycle", _minutes_since(c, oid, station, "in_progress", at)
+            if minutes is None:
+                metric, minutes = "wait", _minutes_since(c, oid, station, "pending", at)
+        else:
+            continue
+        if minutes is None:
+            continue
+        for key in {station, area_group(station)}:
+            c.execute("SELECT state FROM station_stats WHERE station=? AND metric=?", (key, metric))
+            row = c.fetchone()
+            stat = json.loads(row[0]) if row else new_stat()
+            add_sample(stat, max(minutes, 0.0))
+            c.execute("""
+                INSERT INTO station_stats (station, metric, n, mean, state) VALUES (?,?,?,?,?)
+                ON CONFLICT(station, metric)
+                DO UPDATE SET n=excluded.n, mean=excluded.mean, state=excluded.state
+            """, (key, metric, stat["n"], stat["mean"], json.dumps(stat)))
+
+def eta_model(c):
+    c.execute("SELECT station, metric, state FROM station_stats")
+    stats = {(st, m): summary(json.loads(state)) for st, m, state in c.fetchall()}
+    return EtaModel(ETA_SEGMENTS, stats, area_group)
+
+def eta_clock(now=None):
+    """Formats minutes from now as local HH:MM, memoised per whole minute so a board formats each once."""
+    now = now or datetime.now()
+    cache = {}
+    def fmt(minutes):
+        m = int(minutes)
+        if m not in cache:
+            t = now + timedelta(minutes=m)
+            cache[m] = t.strftime("%H:%M" if t.date() == now.date() else "%a %H:%M")
+        return cache[m]
+    return fmt
+
+def order_eta(model, station, status, elapsed, clock=None):
+    """
+    {'minutes', 'p90_minutes', 'eta', 'eta_p90'} until the order is loaded,
+    or None for completed / unknown orders.
+    """
+    rem = model.remaining(station, status, elapsed)
+    if rem is None:
+        return None
+    clock = clock or eta_clock()
+    return {
+        "minutes": round(rem[0], 1),
+        "p90_minutes": round(rem[1], 1),
+        "eta": clock(rem[0]),
+        "eta_p90": clock(rem[1]),
+    }
+
+# Minutes the order has spent in its current status, for ETAs
+ELAPSED_SQL = """(julianday('now') - julianday(
+    CASE status WHEN 'Pending' THEN queued_at WHEN 'In progress' THEN started_at ELSE finished_at END
+)) * 1440"""
+
+# ----- Transitions -----
+# One station action on one order, under the same rules as the station
+# screens, inside the caller's BEGIN IMMEDIATE transaction. Each returns
+# (ok, message). `at` is the UTC time it happened when not now (offline sync).
+# Used by the scan and sync endpoints, where the scan or tap is the confirmation.
+
+def find_order(c, order_number):
+    """(id, order_number, status, current_station) for a printed order number, or None."""
+    c.execute("""
+        SELECT id, order_number, status, current_station
+        FROM orders WHERE order_number=?
+        ORDER BY id DESC LIMIT 1
+    """, (order_number,))
+    return c.fetchone()
+
+def start_job(c, station, oid, at=None):
+    stage = LINE.by_station.get(station)
+    if stage and stage.kind == "machine":
+        sql = routing().sql[stage.name]
+        c.execute(sql["busy"], (station,))
+        if c.fetchone():
+            return False, "Finish the job In progress first."
+        c.execute(sql["first_pending"], (station,))
+        first = c.fetchone()
+        if not first or first[0] != oid:
+            return False, "Only the first Pending job can be started."
+    c.execute("""
+        UPDATE orders
+        SET status='In progress', started_at=COALESCE(?, CURRENT_TIMESTAMP)
+        WHERE id=? AND current_station=? AND status='Pending'
+    """, (at, oid, station))
+    if not c.rowcount:
+        return False, "Not Pending here."
+    log_status(oid, station, "in_progress", c, at=at)
+    return True, f"Started on {station.upper()}."
+
+def finish_job(c, station, oid, at=None):
+    """Finish at a machine (the job waits for the next transfer) or at a slots station."""
+    stage = LINE.by_station[station]
+    c.execute(f"""
+        UPDATE orders
+        SET status='Done', finished_at=COALESCE(?, CURRENT_TIMESTAMP)
+            {", wrap_slot=NULL" if stage.kind == "slots" else ""}
+        WHERE id=? AND current_station=? AND status='In progress'
+    """, (at, oid, station))
+    if not c.rowcount:
+        return False, "Not In progress here."
+    if stage.kind == "machine":
+        log_many([(oid, station, "done"), (oid, topology.next_station(LINE, stage), "pending")], c, at=at)
+    else:
+        log_status(oid, station, "done", c, at=at)
+    if stage.topic:
+        outbox.enqueue_order(c, stage.topic, oid)
+    if stage.kind == "slots":
+        plan_loads(c)
+    return True, f"Finished on {station.upper()}."
+
+def first_done(c, lane, stage):
+    """First job of a machine's Done lane, in the order the transfer `stage` moves them."""
+    c.execute(routing().sql[stage.name]["first_done"], (lane,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def transfer(c, stage, oid, src, target=None, at=None):
+    """
+    A transfer station (Tramming 1/2): the first finished job of the source
+    lane `src` on to the next stage, a machine (target: station or "auto")
+    or a slot (target: slot number, None for the first free one).
+    """
+    src_stage, nxt = routing().stages[stage.source], routing().stages[stage.next]
+    if src not in src_stage.stations:
+        return False, f"Not a {src_stage.label} lane."
+    if first_done(c, src, stage) != oid:
+        return False, f"Only the first Finished job in each {src_stage.label} lane can be moved."
+    if nxt.kind == "machine":
+        return assign_machine(c, stage, nxt, oid, src, target or "auto", at)
+    return move_to_slot(c, stage, nxt, oid, src, target, at)
+
+def assign_machine(c, stage, nxt, oid, src, target, at=None):
+    reason = None
+    if target == "auto":
+        target, reason = auto_assign(c, nxt.stations, lambda m: nxt.capacity.get(m, 0))
+        if not target:
+            return False, f"All {nxt.label} lanes are full at the moment."
+    if target not in nxt.capacity:
+        return False, f"Choose a {nxt.label} machine."
+    c.execute(routing().sql[nxt.name]["pending_count"], (target,))
+    if c.fetchone()[0] >= nxt.capacity[target]:
+        return False, f"{target.upper()} is full."
+    c.execute("""
+        UPDATE orders
+        SET current_station=?, status='Pending', queued_at=COALESCE(?, CURRENT_TIMESTAMP)
+        WHERE id=? AND current_station=? AND status='Done'
+    """, (target, at, oid, src))
+    log_many([(oid, stage.stations[0], "done"), (oid, target, "pending")], c, at=at)
+    if reason:
+        log_assignment(oid, nxt.name, target, reason, c)
+    return True, f"Assigned to {target.upper()}."
+
+def slot_occupancy(c, nxt):
+    """{slot: (order id, order number, status, queued, started)} of a slots stage."""
+    c.execute("""
+        SELECT wrap_slot, id, order_number, status,
+               datetime(queued_at,'localtime'), datetime(started_at,'localtime')
+        FROM orders
+        WHERE current_station=? AND wrap_slot IS NOT NULL AND status IN ('Pending','In progress')
+        ORDER BY wrap_slot ASC
+    """, (nxt.stations[0],))
+    return {r[0]: r[1:] for r in c.fetchall()}
+
+def move_to_slot(c, stage, nxt, oid, src, slot=None, at=None):
+    free = [s for s in nxt.slots if s not in slot_occupancy(c, nxt)]
+    if not free:
+        return False, f"All {nxt.label} slots are occupied."
+    try:
+        slot = int(slot) if slot else free[0]
+    except (TypeError, ValueError):
+        return False, f"Choose a {nxt.label} slot."
+    if slot not in free:
+        return False, f"{nxt.label} slot {slot} is occupied."
+    c.execute("""
+        UPDATE orders
+        SET current_station=?, status='Pending', queued_at=COALESCE(?, CURRENT_TIMESTAMP), wrap_slot=?
+        WHERE id=? AND current_station=? AND status='Done'
+    """, (nxt.stations[0], at, slot, oid, src))
+    log_many([(oid, stage.stations[0], "done"), (oid, nxt.stations[0], "pending")], c, at=at)
+    return True, f"Moved to {nxt.label} slot {slot}."
+
+TRANSFER_BULK_MAX = 50      # jobs one bulk transfer may move
+
+def plan_transfer(c, stage, src, oids, target=None):
+    """
+    Where a bulk transfer would put `oids`, which must be the first finished
+    jobs of the source lane `src`, checked for the whole set at once:
+    (True, [(order id, machine or slot, auto reasoning or None)]) in lane
+    order, or (False, message). target: a machine, "auto" to spread them
+    by predicted start, or (slots) nothing for the free slots in order.
+    """
+    src_stage, nxt = routing().stages[stage.source], routing().stages[stage.next]
+    if src not in src_stage.stations:
+        return False, f"Not a {src_stage.label} lane."
+    if not oids or len(oids) > TRANSFER_BULK_MAX:
+        return False, f"Select 1 to {TRANSFER_BULK_MAX} jobs to move."
+    c.execute(routing().sql[stage.name]["source_done"] + " LIMIT ?", (src, len(oids)))
+    first = [r[0] for r in c.fetchall()]
+    if sorted(first) != sorted(oids):
+        return False, f"Only the first Finished jobs in each {src_stage.label} lane can be moved, in lane order."
+    n = len(first)
+    if nxt.kind == "machine":
+        if target == "auto":
+            picks = choose_many(machine_states(c, nxt.stations, lambda m: nxt.capacity.get(m, 0)), n)
+            if picks is None:
+                return False, f"The {nxt.label} lanes don't have room for {n} more jobs at the moment."
+            return True, [(oid, m, reason) for oid, (m, reason) in zip(first, picks)]
+        if target not in nxt.capacity:
+            return False, f"Choose a {nxt.label} machine."
+        c.execute(routing().sql[nxt.name]["pending_count"], (target,))
+        room = nxt.capacity[target] - c.fetchone()[0]
+        if n > room:
+            return False, f"{target.upper()} has room for {max(room, 0)} more, not {n}."
+        return True, [(oid, target, None) for oid in first]
+    free = [s for s in nxt.slots if s not in slot_occupancy(c, nxt)]
+    if n > len(free):
+        return False, f"{len(free)} {nxt.label} slot(s) free for {n} jobs."
+    return True, [(oid, slot, None) for oid, slot in zip(first, free)]
+
+def transfer_many(c, stage, src, oids, target=None, at=None):
+    """
+    Bulk transfer: the first finished jobs `oids` of lane `src` on to the
+    next stage, see plan_transfer(), with one executemany per table. Returns
+    (ok, message); on failure the caller rolls back.
+    """
+    ok, plan = plan_transfer(c, stage, src, oids, target)
+    if not ok:
+        return False, plan
+    nxt = routing().stages[stage.next]
+    if nxt.kind == "machine":
+        c.executemany("""
+            UPDATE orders
+            SET current_station=?, status='Pending', queued_at=COALESCE(?, CURRENT_TIMESTAMP)
+            WHERE id=? AND current_station=? AND status='Done'
+        """, [(m, at, oid, src) for oid, m, _ in plan])
+        to = lambda dest: dest
+    else:
+        c.executemany("""
+            UPDATE orders
+            SET current_station=?, status='Pending', queued_at=COALESCE(?, CURRENT_TIMESTAMP), wrap_slot=?
+            WHERE id=? AND current_station=? AND status='Done'
+        """, [(nxt.stations[0], at, slot, oid, src) for oid, slot, _ in plan])
+        to = lambda dest: nxt.stations[0]
+    if c.rowcount != len(plan):
+        return False, "The jobs changed in the meantime, please try again."
+    log_many([pair for oid, dest, _ in plan
+              for pair in ((oid, stage.stations[0], "done"), (oid, to(dest), "pending"))], c, at=at)
+    c.executemany("INSERT INTO assignment_log (order_id, area_group, machine, reason) VALUES (?,?,?,?)",
+                  [(oid, nxt.name, dest, reason) for oid, dest, reason in plan if reason])
+    return True, f"Moved {len(plan)} job(s): {plan_summary(plan, nxt)}."
+
+def plan_summary(plan, nxt):
+    """'EDGE1 x3, EDGE2 x2' or 'Wrapping slot 1, 2, 4' for a transfer plan."""
+    if nxt.kind == "machine":
+        counts = {}
+        for _, m, _ in plan:
+            counts[m] = counts.get(m, 0) + 1
+        return ", ".join(f"{m.upper()} x{k}" for m, k in counts.items())
+    return f"{nxt.label} slot " + ", ".join(str(slot) for _, slot, _ in plan)
+
+def lorry_label(c, slot):
+    c.execute("SELECT number FROM lorries WHERE slot=? AND status='open'", (slot,))
+    row = c.fetchone()
+    return f"Lorry {row[0] if row else slot}"
+
+def start_loading(c, oids, slot, at=None):
+    """
+    Wrapped jobs onto lorry slot 1 or 2. Several share a batch (loaded
+    together, see finish_loading()) and must fit on the lorry together.
+    """
+    if slot not in (1, 2):
+        return False, "Choose Lorry 1 or Lorry 2."
+    batch_max = lorry_capacity()
+    if not oids or len(oids) > batch_max or len(set(oids)) != len(oids):
+        return False, f"Select 1 to {batch_max} jobs to start loading."
+    lorry_id, number, _ = open_lorries(c)[slot]
+    label = f"Lorry {number}"
+    batch = str(uuid.uuid4()) if len(oids) > 1 else None
+    if batch:
+        f = lorry_fill(c)[slot]
+        c.execute(f"""
+            SELECT SUM(COALESCE(volume_m3, ?)), SUM(COALESCE(weight_kg, ?)) FROM orders
+            WHERE id IN ({",".join("?" * len(oids))})
+        """, (*default_order_size(), *oids))
+        vol, wt = c.fetchone()
+        if f["volume"] + (vol or 0) > f["max_volume"] or f["weight"] + (wt or 0) > f["max_weight"]:
+            return False, (f"{len(oids)} jobs don't fit on {label} together: {vol or 0:.1f} m³ / {wt or 0:.0f} kg "
+                           f"for {f['max_volume'] - f['volume']:.1f} m³ / {f['max_weight'] - f['weight']:.0f} kg free.")
+    c.executemany("""
+        UPDATE orders
+        SET current_station='loading', status='In progress', started_at=COALESCE(?, CURRENT_TIMESTAMP),
+            lorry=?, lorry_id=?, batch_id=?
+        WHERE id=? AND current_station='wrapping' AND status='Done'
+    """, [(at, label, lorry_id, batch, oid) for oid in oids])
+    if c.rowcount != len(oids):
+        return False, "Not finished at Wrapping."
+    log_many([(oid, LOADING_STATION, "in_progress") for oid in oids], c, at=at)
+    plan_loads(c)
+    return True, f"Loading onto {label}."
+
+def finish_loading(c, oid, at=None):
+    """Marks a job loaded, and its batch partner with it."""
+    c.execute("SELECT batch_id FROM orders WHERE id=? AND current_station='loading' AND status='In progress'",
+              (oid,))
+    row = c.fetchone()
+    if not row:
+        return False, "Not being loaded."
+    # Only the rows this UPDATE changed are logged (and counted on the board)
+    c.execute("""
+        UPDATE orders SET status='Done', finished_at=COALESCE(?, CURRENT_TIMESTAMP)
+        WHERE (id=? OR batch_id=?) AND current_station='loading' AND status='In progress'
+        RETURNING id
+    """, (at, oid, row[0]))
+    ids = [r[0] for r in c.fetchall()]
+    log_many([(i, LOADING_STATION, "done") for i in ids], c, at=at)
+    return True, "Loaded." if len(ids) == 1 else f"Loaded, with {len(ids) - 1} other job(s) in the batch."
+
+def scan_transition(c, station, order, target=None, lorry=None):
+    """
+    The next action for a scanned order at a station: start or finish on a
+    machine or wrapping, move on from a tramming station, load or finish
+    loading. target: edge bander or wrap slot, lorry: 1 or 2.
+    """
+    oid, number, status, at = order
+    stage = LINE.by_station.get(station)
+    kind = stage.kind if stage else None
+    if kind in ("machine", "slots"):
+        if at != station:
+            return False, f"{number} is at {(at or '—').upper()}, not here."
+        if status == "Pending":
+            return start_job(c, station, oid)
+        if status == "In progress":
+            return finish_job(c, station, oid)
+        return False, f"{number} is already finished here."
+    if kind == "transfer":
+        if at in LINE.stages[stage.source].stations and status == "Done":
+            if LINE.stages[stage.next].kind == "slots" and not str(target or "").isdigit():
+                target = None
+            return transfer(c, stage, oid, at, target)
+        return False, f"{number} is not waiting at {stage.label}."
+    if station == LOADING_STATION:
+        if at == WRAPPING_STATION and status == "Done":
+            return start_loading(c, [oid], lorry)
+        if at == LOADING_STATION and status == "In progress":
+            return finish_loading(c, oid)
+        return False, f"{number} is not ready for loading."
+    return False, "Scanning is not available at this station."
 
 # Training helper, build default "not_trained" matrix then overlay DB values
 def get_training_status_matrix():
@@ -326,14 +1431,31 @@ def get_training_status_matrix():
     conn.close()
     return matrix
 
+def staffing_conflicts(plan, absent):
+    """People on two stations the same day, or planned on a day they are off."""
+    names = dict(TRAINING_EMPLOYEES)
+    days = dict(DAYS_OF_WEEK)
+    seen, problems = {}, []
+    for (station, day), emp in sorted(plan.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        who = names.get(emp, emp)
+        if (emp, day) in absent:
+            problems.append(f"{who} is off on {days.get(day, day)} but planned at {STATION_LABELS.get(station, station)}")
+        if (emp, day) in seen:
+            problems.append(f"{who} is planned at both {STATION_LABELS.get(seen[(emp, day)], seen[(emp, day)])} "
+                            f"and {STATION_LABELS.get(station, station)} on {days.get(day, day)}")
+        seen[(emp, day)] = station
+    return problems
+
 # ----- auth -----
-@app.route("/login", methods=["GET","POST"])
+@route("/login", methods=["GET","POST"])
 def login():
     error = None
     if request.method == "POST":
         username = (request.form.get("username") or "").strip().lower()
         password = request.form.get("password") or ""
-        conn = get_db(); c = conn.cursor()
+        lines = current_app.config["LINES"]
+        line = request.form.get("line") if request.form.get("line") in lines else next(iter(lines))
+        conn = sqlite3.connect(lines[line]); c = conn.cursor()
         c.execute("SELECT id, username, password_hash, role, area FROM users WHERE username=?", (username,))
         row = c.fetchone(); conn.close()
         if row and check_password_hash(row[2], password):
@@ -341,40 +1463,58 @@ def login():
             session["username"] = row[1]
             session["role"] = row[3]
             session["area"] = row[4]
+            session["line"] = line
             return redirect(url_for("home"))
         error = "Invalid username or password."
-    return render_template("login.html", error=error)
+    return render_template("login.html", error=error, lines=list(current_app.config["LINES"]))
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     session.clear()
     return redirect(url_for("login"))
 
-@app.route("/")
+@route("/")
 def home():
     if session.get("user_id"):
         area = (session.get("area") or "").lower()
-        if area == MANAGER_AREA:        return redirect(url_for("manager_view"))
-        if area == PREPARING_STATION:   return redirect(url_for("preparing_station"))
-        if area in CNC_STATIONS:        return redirect(url_for("cnc_station"))
-        if area == TRAMMING1_STATION:   return redirect(url_for("tramming1_station"))
-        if area in EDGE_STATIONS:       return redirect(url_for("edge_station"))
-        if area == TRAMMING2_STATION:   return redirect(url_for("tramming2_station"))
-        if area == WRAPPING_STATION:    return redirect(url_for("wrapping_station"))
-        if area == LOADING_STATION:     return redirect(url_for("loading_station"))
+        if area == MANAGER_AREA:
+            return redirect(url_for("manager_view"))
+        stage = LINE.by_station.get(area)
+        if stage:
+            return redirect(url_for(stage.endpoint))
     return redirect(url_for("login"))
 
 # ----- Preparing -----
-@app.route("/preparing", methods=["GET","POST"])
+@route("/preparing", methods=["GET","POST"])
 @login_required
 def preparing_station():
     if (session.get("area") or "").lower() != PREPARING_STATION:
         return ("Forbidden: not Preparing", 403)
+    capacity = routing().stages["cnc"].capacity
     conn = get_db(); c = conn.cursor()
 
     if request.method == "POST":
         order_no = (request.form.get("order_number") or "").strip()
         target_cnc = (request.form.get("target_cnc") or "").strip().lower()
+        try:
+            priority = int(request.form.get("priority") or 0)
+        except ValueError:
+            priority = 0
+        if priority not in dict(PRIORITIES):
+            priority = 0
+        due_at = (request.form.get("due_at") or "").strip() or None
+        try:
+            est_minutes = float(request.form.get("est_minutes") or 0) or None
+        except ValueError:
+            est_minutes = None
+        try:
+            volume_m3 = float(request.form.get("volume_m3") or 0) or None
+            weight_kg = float(request.form.get("weight_kg") or 0) or None
+        except ValueError:
+            volume_m3 = weight_kg = None
+        route = (request.form.get("route") or "").strip() or None
+        # The checks run in the insert's transaction, so two confirms can't overfill a queue
+        c.execute("BEGIN IMMEDIATE")
         c.execute("""
           SELECT id, order_number, status, current_station,
                  datetime(queued_at,'localtime'), datetime(started_at,'localtime'), datetime(finished_at,'localtime')
@@ -383,7 +1523,7 @@ def preparing_station():
         dup = c.fetchone()
         if dup:
             ts = dup[6] or dup[5] or dup[4] or "—"
-            conn.close()
+            conn.rollback(); conn.close()
             return render_template("confirm.html",
                 title="Order already exists",
                 message=f"Order {order_no} already exists, status: {dup[2]}, at: {dup[3].upper() if dup[3] else '—'}, time: {ts}.",
@@ -392,18 +1532,33 @@ def preparing_station():
                 post_url=None,
                 hidden_fields={}
             )
+        # auto: pick the CNC with the earliest predicted start; the confirm
+        # form then carries that CNC and the reason, and its capacity is checked again
+        auto_reason = (request.form.get("auto_reason") or "").strip() or None
+        if target_cnc == "auto":
+            target_cnc, auto_reason = auto_assign(c, CNC_STATIONS, lambda m: capacity.get(m, 0))
+            if not target_cnc:
+                conn.rollback(); conn.close()
+                return render_template("confirm.html",
+                    title="All CNC queues are full",
+                    message="All CNCs are full at the moment. Please wait.",
+                    confirm_name=None,
+                    cancel_url=url_for("preparing_station"),
+                    post_url=None,
+                    hidden_fields={}
+                )
         # capacity
         c.execute("SELECT COUNT(*) FROM orders WHERE current_station=? AND status='Pending'", (target_cnc,))
         (count_pending,) = c.fetchone()
-        if count_pending >= QUEUE_CAPACITY_PREP:
+        if count_pending >= capacity.get(target_cnc, 0):
             available = []
             for cnc in CNC_STATIONS:
                 c.execute("SELECT COUNT(*) FROM orders WHERE current_station=? AND status='Pending'", (cnc,))
                 (cnt,) = c.fetchone()
-                if cnt < QUEUE_CAPACITY_PREP:
+                if cnt < capacity[cnc]:
                     available.append(cnc.upper())
             if not available:
-                conn.close()
+                conn.rollback(); conn.close()
                 return render_template("confirm.html",
                     title="All CNC queues are full",
                     message="All CNCs are full at the moment. Please wait.",
@@ -412,7 +1567,7 @@ def preparing_station():
                     post_url=None,
                     hidden_fields={}
                 )
-            conn.close()
+            conn.rollback(); conn.close()
             return render_template("confirm.html",
                 title="Queue full",
                 message=f"{target_cnc.upper()} is full. Available: {', '.join(available)}",
@@ -423,276 +1578,79 @@ def preparing_station():
             )
         # confirm and insert
         if not request.form.get("confirm"):
-            conn.close()
+            conn.rollback(); conn.close()
             return render_template("confirm.html",
                 title="Confirm add",
-                message=f"Add order {order_no} to {target_cnc.upper()} as Pending?",
+                message=f"Add order {order_no} to {target_cnc.upper()} as Pending ({dict(PRIORITIES)[priority]} priority)?"
+                        + (f" Auto-assigned, {auto_reason}." if auto_reason else ""),
                 confirm_name="confirm",
                 cancel_url=url_for("preparing_station"),
                 post_url=url_for("preparing_station"),
-                hidden_fields={"order_number": order_no, "target_cnc": target_cnc}
+                hidden_fields={
+                    "order_number": order_no,
+                    "target_cnc": target_cnc,
+                    "auto_reason": auto_reason,
+                    "priority": priority,
+                    "due_at": due_at,
+                    "est_minutes": est_minutes,
+                    "volume_m3": volume_m3,
+                    "weight_kg": weight_kg,
+                    "route": route,
+                }
             )
+        # due_at comes from a local datetime-local input, stored as UTC like the other timestamps
         c.execute(
-            "INSERT INTO orders (order_number, status, current_station) "
-            "VALUES (?, 'Pending', ?)",
-            (order_no, target_cnc)
+            "INSERT INTO orders (order_number, status, current_station, priority, due_at, est_minutes, "
+            "volume_m3, weight_kg, route) VALUES (?, 'Pending', ?, ?, datetime(?, 'utc'), ?, ?, ?, ?)",
+            (order_no, target_cnc, priority, due_at, est_minutes, volume_m3, weight_kg, route)
         )
         oid = c.lastrowid
+        log_many([(oid, PREPARING_STATION, "done"), (oid, target_cnc, "pending")], c, kind="created")
+        if auto_reason:
+            log_assignment(oid, "cnc", target_cnc, auto_reason, c)
         conn.commit(); conn.close()
-        # history
-        log_many([(oid, PREPARING_STATION, "done"), (oid, target_cnc, "pending")])
         return redirect(url_for("preparing_station"))
 
     cnc_slots = {}
     for cnc in CNC_STATIONS:
-        c.execute("""
-            SELECT id, order_number, status, datetime(queued_at,'localtime')
+        c.execute(f"""
+            SELECT id, order_number, status, datetime(queued_at,'localtime'),
+                   priority, datetime(due_at,'localtime')
             FROM orders
             WHERE current_station=? AND status='Pending'
-            ORDER BY queued_at ASC
+            ORDER BY {lane_order("cnc")}
             LIMIT ?
-        """, (cnc, QUEUE_CAPACITY_PREP))
+        """, (cnc, capacity[cnc]))
         cnc_slots[cnc] = c.fetchall()
     conn.close()
-    return render_template("station_preparing_one.html", cnc_slots=cnc_slots, capacity=QUEUE_CAPACITY_PREP)
-
-# ----- CNC -----
-@app.route("/cnc", methods=["GET","POST"])
-@login_required
-def cnc_station():
-    area = (session.get("area") or "").lower()
-    if area not in CNC_STATIONS:
-        return ("Forbidden: not a CNC station", 403)
-    conn = get_db(); c = conn.cursor()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='Pending'
-        ORDER BY queued_at ASC
-    """, (area,))
-    pending = c.fetchall()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime'), datetime(started_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='In progress'
-        ORDER BY started_at ASC NULLS LAST, queued_at ASC
-    """, (area,))
-    inprog = c.fetchall()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime'), datetime(finished_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='Done'
-        ORDER BY finished_at ASC NULLS LAST, queued_at ASC
-    """, (area,))
-    done = c.fetchall()
-
-    if request.method == "POST":
-        action = request.form.get("action")
-        oid = request.form.get("order_id")
-        if action == "start":
-            if inprog:
-                conn.close()
-                return render_template("confirm.html",
-                    title="Cannot start",
-                    message="You already have a job In progress. Finish it before starting another.",
-                    confirm_name=None,
-                    cancel_url=url_for("cnc_station"),
-                    post_url=None,
-                    hidden_fields={}
-                )
-            first_id = pending[0][0] if pending else None
-            if str(oid) != str(first_id):
-                conn.close()
-                return render_template("confirm.html",
-                    title="Cannot start",
-                    message="You can only start the first Pending job.",
-                    confirm_name=None,
-                    cancel_url=url_for("cnc_station"),
-                    post_url=None,
-                    hidden_fields={}
-                )
-            if not request.form.get("confirm"):
-                conn.close()
-                return render_template("confirm.html",
-                    title="Confirm start",
-                    message=f"Start this job on {area.upper()}?",
-                    confirm_name="confirm",
-                    cancel_url=url_for("cnc_station"),
-                    post_url=url_for("cnc_station"),
-                    hidden_fields={"action": "start", "order_id": oid}
-                )
-            d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='In progress', started_at=CURRENT_TIMESTAMP
-                WHERE id=? AND current_station=? AND status='Pending'
-            """, (oid, area))
-            d.commit(); d.close(); conn.close()
-            log_status(int(oid), area, "in_progress")
-            return redirect(url_for("cnc_station"))
-
-        if action == "finish":
-            if not request.form.get("confirm"):
-                conn.close()
-                return render_template("confirm.html",
-                    title="Confirm finish",
-                    message="Mark this job Finished on CNC?",
-                    confirm_name="confirm",
-                    cancel_url=url_for("cnc_station"),
-                    post_url=url_for("cnc_station"),
-                    hidden_fields={"action": "finish", "order_id": oid}
-                )
-            d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='Done', finished_at=CURRENT_TIMESTAMP
-                WHERE id=? AND current_station=? AND status='In progress'
-            """, (oid, area))
-            d.commit(); d.close(); conn.close()
-            log_many([(int(oid), area, "done"), (int(oid), TRAMMING1_STATION, "pending")])
-            return redirect(url_for("cnc_station"))
-
-    conn.close()
     return render_template(
-        "station_cnc.html",
-        station=area.upper(),
-        pending=pending,
-        inprog=inprog,
-        done=done
+        "station_preparing_one.html",
+        cnc_slots=cnc_slots,
+        machines=CNC_STATIONS,
+        labels=STATION_LABELS,
+        capacities=capacity,
+        priorities=PRIORITIES
     )
 
-# ----- Tramming 1 -----
-@app.route("/tramming1", methods=["GET","POST"])
-@login_required
-def tramming1_station():
-    if (session.get("area") or "").lower() != TRAMMING1_STATION:
-        return ("Forbidden: not Tramming 1", 403)
-    conn = get_db(); c = conn.cursor()
-
-    cnc_done = {}
-    for cnc in CNC_STATIONS:
-        c.execute("""
-            SELECT id, order_number, datetime(finished_at,'localtime'), datetime(queued_at,'localtime')
-            FROM orders
-            WHERE current_station=? AND status='Done'
-            ORDER BY finished_at ASC NULLS LAST, queued_at ASC
-        """, (cnc,))
-        cnc_done[cnc] = c.fetchall()
-
-    edge_pending = {}
-    for ed in EDGE_STATIONS:
-        c.execute("""
-            SELECT id, order_number, datetime(queued_at,'localtime')
-            FROM orders
-            WHERE current_station=? AND status='Pending'
-            ORDER BY queued_at ASC
-        """, (ed,))
-        edge_pending[ed] = c.fetchall()
-
-    if request.method == "POST" and request.form.get("action") == "assign":
-        order_id = request.form.get("order_id")
-        src_cnc = request.form.get("src_cnc")
-        tgt_edge = request.form.get("tgt_edge")
-        first_id = cnc_done.get(src_cnc, [None])
-        first_id = first_id[0][0] if first_id else None
-        if str(order_id) != str(first_id):
-            conn.close()
-            return render_template("confirm.html",
-                title="Cannot assign",
-                message="Only the first Finished job in each CNC lane can be assigned.",
-                confirm_name=None,
-                cancel_url=url_for("tramming1_station"),
-                post_url=None,
-                hidden_fields={}
-            )
-        if not tgt_edge:
-            conn.close()
-            return render_template("confirm.html",
-                title="Choose Edge Bander",
-                message="Please select an Edge Bander.",
-                confirm_name=None,
-                cancel_url=url_for("tramming1_station"),
-                post_url=None,
-                hidden_fields={}
-            )
-        cap = EDGE_CAPACITY.get(tgt_edge, 0)
-        c.execute("SELECT COUNT(*) FROM orders WHERE current_station=? AND status='Pending'", (tgt_edge,))
-        (count_pending,) = c.fetchone()
-        if count_pending >= cap:
-            available = []
-            for ed in EDGE_STATIONS:
-                c.execute("SELECT COUNT(*) FROM orders WHERE current_station=? AND status='Pending'", (ed,))
-                (cnt,) = c.fetchone()
-                if cnt < EDGE_CAPACITY[ed]:
-                    available.append(ed.upper())
-            msg = f"{tgt_edge.upper()} is full ({count_pending}/{cap})."
-            if available:
-                msg += " Available: " + ", ".join(available)
-            conn.close()
-            return render_template("confirm.html",
-                title="Capacity full",
-                message=msg,
-                confirm_name=None,
-                cancel_url=url_for("tramming1_station"),
-                post_url=None,
-                hidden_fields={}
-            )
-        if not request.form.get("confirm"):
-            conn.close()
-            return render_template("confirm.html",
-                title="Confirm assignment",
-                message=f"Assign order to {tgt_edge.upper()}?",
-                confirm_name="confirm",
-                cancel_url=url_for("tramming1_station"),
-                post_url=url_for("tramming1_station"),
-                hidden_fields={"action": "assign", "order_id": order_id, "src_cnc": src_cnc, "tgt_edge": tgt_edge}
-            )
-        d = get_db(); dc = d.cursor()
-        dc.execute("""
-            UPDATE orders
-            SET current_station=?, status='Pending', queued_at=CURRENT_TIMESTAMP
-            WHERE id=? AND current_station=? AND status='Done'
-        """, (tgt_edge, order_id, src_cnc))
-        d.commit(); d.close(); conn.close()
-        log_many([(int(order_id), TRAMMING1_STATION, "done"), (int(order_id), tgt_edge, "pending")])
-        return redirect(url_for("tramming1_station"))
-
-    conn.close()
-    return render_template(
-        "station_tramming1.html",
-        cnc_done=cnc_done,
-        edge_pending=edge_pending,
-        capacities=EDGE_CAPACITY
-    )
+# ----- Station engine -----
+# One screen per machine stage (start / finish the first job of the lane) and
+# per transfer stage (move the first finished job of each source lane on),
+# bound for every such stage in TOPOLOGY by create_app() at /<stage>.
 
-# ----- Edge bander -----
-@app.route("/edge", methods=["GET","POST"])
 @login_required
-def edge_station():
+def machine_station(stage):
+    stage = routing().stages[stage]
     area = (session.get("area") or "").lower()
-    if area not in EDGE_STATIONS:
-        return ("Forbidden: not an Edge station", 403)
+    if area not in stage.stations:
+        return (f"Forbidden: not a {stage.label} station", 403)
+    sql = routing().sql[stage.name]
+    back = url_for(stage.endpoint)
     conn = get_db(); c = conn.cursor()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='Pending'
-        ORDER BY queued_at ASC
-    """, (area,))
+    c.execute(sql["pending"], (area,))
     pending = c.fetchall()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime'), datetime(started_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='In progress'
-        ORDER BY started_at ASC NULLS LAST, queued_at ASC
-    """, (area,))
+    c.execute(sql["in_progress"], (area,))
     inprog = c.fetchall()
-    c.execute("""
-        SELECT id, order_number, datetime(queued_at,'localtime'), datetime(finished_at,'localtime')
-        FROM orders
-        WHERE current_station=? AND status='Done'
-        ORDER BY finished_at ASC NULLS LAST, queued_at ASC
-    """, (area,))
+    c.execute(sql["done"], (area,))
     done = c.fetchall()
 
     if request.method == "POST":
@@ -705,7 +1663,7 @@ def edge_station():
                     title="Cannot start",
                     message="You already have a job In progress. Finish it before starting another.",
                     confirm_name=None,
-                    cancel_url=url_for("edge_station"),
+                    cancel_url=back,
                     post_url=None,
                     hidden_fields={}
                 )
@@ -716,7 +1674,7 @@ def edge_station():
                     title="Cannot start",
                     message="You can only start the first Pending job.",
                     confirm_name=None,
-                    cancel_url=url_for("edge_station"),
+                    cancel_url=back,
                     post_url=None,
                     hidden_fields={}
                 )
@@ -726,187 +1684,264 @@ def edge_station():
                     title="Confirm start",
                     message=f"Start this job on {area.upper()}?",
                     confirm_name="confirm",
-                    cancel_url=url_for("edge_station"),
-                    post_url=url_for("edge_station"),
+                    cancel_url=back,
+                    post_url=back,
                     hidden_fields={"action": "start", "order_id": oid}
                 )
             d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='In progress', started_at=CURRENT_TIMESTAMP
-                WHERE id=? AND current_station=? AND status='Pending'
-            """, (oid, area))
+            dc.execute("BEGIN IMMEDIATE")
+            start_job(dc, area, int(oid))
             d.commit(); d.close(); conn.close()
-            log_status(int(oid), area, "in_progress")
-            return redirect(url_for("edge_station"))
+            return redirect(back)
 
         if action == "finish":
             if not request.form.get("confirm"):
                 conn.close()
                 return render_template("confirm.html",
                     title="Confirm finish",
-                    message="Mark this job Finished on Edge?",
+                    message=f"Mark this job Finished on {stage.label}?",
                     confirm_name="confirm",
-                    cancel_url=url_for("edge_station"),
-                    post_url=url_for("edge_station"),
+                    cancel_url=back,
+                    post_url=back,
                     hidden_fields={"action": "finish", "order_id": oid}
                 )
             d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='Done', finished_at=CURRENT_TIMESTAMP
-                WHERE id=? AND current_station=? AND status='In progress'
-            """, (oid, area))
+            dc.execute("BEGIN IMMEDIATE")
+            finish_job(dc, area, int(oid))
             d.commit(); d.close(); conn.close()
-            log_many([(int(oid), area, "done"), (int(oid), TRAMMING2_STATION, "pending")])
-            return redirect(url_for("edge_station"))
+            return redirect(back)
 
     conn.close()
     return render_template(
-        "station_edge.html",
+        "station_machine.html",
         station=area.upper(),
-        cap=EDGE_CAPACITY.get(area, 0),
+        label=stage.label,
+        priority_labels=dict(PRIORITIES),
+        cap=stage.capacity[area],
         pending=pending,
         inprog=inprog,
         done=done
     )
 
-# ----- Tramming 2 -----
-@app.route("/tramming2", methods=["GET","POST"])
-@login_required
-def tramming2_station():
-    if (session.get("area") or "").lower() != TRAMMING2_STATION:
-        return ("Forbidden: not Tramming 2", 403)
-    conn = get_db(); c = conn.cursor()
-
-    edge_done = {}
-    for ed in EDGE_STATIONS:
-        c.execute("""
-            SELECT id, order_number, datetime(finished_at,'localtime'), datetime(queued_at,'localtime')
-            FROM orders
-            WHERE current_station=? AND status='Done'
-            ORDER BY finished_at ASC NULLS LAST, queued_at ASC
-        """, (ed,))
-        edge_done[ed] = c.fetchall()
-
-    c.execute("""
-        SELECT wrap_slot, id, order_number, status,
-               datetime(queued_at,'localtime'), datetime(started_at,'localtime')
-        FROM orders
-        WHERE current_station='wrapping'
-          AND wrap_slot IS NOT NULL
-          AND status IN ('Pending','In progress')
-        ORDER BY wrap_slot ASC
-    """)
-    wrap_occ = {r[0]: r[1:] for r in c.fetchall()}
-    all_full = len(wrap_occ) >= len(WRAP_SLOTS)
-
-    if request.method == "POST" and request.form.get("action") == "assign_wrap":
-        if all_full:
-            conn.close()
-            return render_template("confirm.html",
-                title="Wrapping full",
-                message="All Wrapping slots are occupied.",
-                confirm_name=None,
-                cancel_url=url_for("tramming2_station"),
-                post_url=None,
-                hidden_fields={}
-            )
-        order_id = request.form.get("order_id")
-        src_edge = request.form.get("src_edge")
+@login_required
+def transfer_station(stage):
+    stage = routing().stages[stage]
+    if (session.get("area") or "").lower() != stage.stations[0]:
+        return (f"Forbidden: not {stage.label}", 403)
+    src_stage, nxt = routing().stages[stage.source], routing().stages[stage.next]
+    sql = routing().sql
+    back = url_for(stage.endpoint)
+    conn = get_db(); c = conn.cursor()
+
+    source_done = {}
+    for m in src_stage.stations:
+        c.execute(sql[stage.name]["source_done"], (m,))
+        source_done[m] = c.fetchall()
+    target_pending, occupancy = {}, {}
+    if nxt.kind == "machine":
+        for m in nxt.stations:
+            c.execute(sql[nxt.name]["pending"], (m,))
+            target_pending[m] = c.fetchall()
+    else:
+        occupancy = slot_occupancy(c, nxt)
+
+    if request.method == "POST" and request.form.get("action") == "bulk":
+        # Ticked checkboxes arrive as repeated order_ids, the confirm step sends them joined
+        ids = [i for v in request.form.getlist("order_ids") for i in v.split(",") if i]
+        src = request.form.get("src")
+        target = request.form.get("target") or None
         try:
-            slot = int(request.form.get("wrap_slot") or 0)
+            oids = [int(i) for i in ids]
         except ValueError:
-            slot = 0
-        if slot not in WRAP_SLOTS:
+            oids = []
+        if not request.form.get("confirm"):
+            ok, plan = plan_transfer(c, stage, src, oids, target)
             conn.close()
+            if not ok:
+                return render_template("confirm.html",
+                    title="Cannot move",
+                    message=plan,
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
             return render_template("confirm.html",
-                title="Choose slot",
-                message="Please choose Wrapping slot 1, 2, or 3.",
-                confirm_name=None,
-                cancel_url=url_for("tramming2_station"),
-                post_url=None,
-                hidden_fields={}
+                title="Confirm bulk move",
+                message=f"Move {len(plan)} job(s) from {src.upper()}: {plan_summary(plan, nxt)}?",
+                confirm_name="confirm",
+                cancel_url=back,
+                post_url=back,
+                hidden_fields={"action": "bulk", "order_ids": ",".join(ids), "src": src, "target": target or ""}
             )
-        first_id = edge_done.get(src_edge, [None])
-        first_id = first_id[0][0] if first_id else None
-        if str(order_id) != str(first_id):
-            conn.close()
+        conn.close()
+        d = get_db(); dc = d.cursor()
+        dc.execute("BEGIN IMMEDIATE")
+        ok, message = transfer_many(dc, stage, src, oids, target)
+        if not ok:
+            d.rollback(); d.close()
             return render_template("confirm.html",
                 title="Cannot move",
-                message="Only the first Finished job in each Edge lane can be moved.",
+                message=message,
                 confirm_name=None,
-                cancel_url=url_for("tramming2_station"),
+                cancel_url=back,
                 post_url=None,
                 hidden_fields={}
             )
-        if slot in wrap_occ:
-            free = [str(s) for s in WRAP_SLOTS if s not in wrap_occ]
-            msg = f"Wrapping slot {slot} is occupied."
-            if free:
-                msg += " Available slots: " + ", ".join(free)
+        d.commit(); d.close()
+        return redirect(back)
+
+    if request.method == "POST" and request.form.get("action") in ("assign", "assign_wrap"):
+        order_id = request.form.get("order_id")
+        src = request.form.get("src")
+        target = request.form.get("target")
+        moving, moved = ("assign", "assigned") if nxt.kind == "machine" else ("move", "moved")
+        first_id = (source_done.get(src) or [[None]])[0][0]
+        if str(order_id) != str(first_id):
             conn.close()
             return render_template("confirm.html",
-                title="Slot occupied",
-                message=msg,
+                title=f"Cannot {moving}",
+                message=f"Only the first Finished job in each {src_stage.label} lane can be {moved}.",
                 confirm_name=None,
-                cancel_url=url_for("tramming2_station"),
+                cancel_url=back,
                 post_url=None,
                 hidden_fields={}
             )
+        auto_reason = (request.form.get("auto_reason") or "").strip() or None
+        if nxt.kind == "machine":
+            # auto: pick the machine with the earliest predicted start; the
+            # confirm form carries that machine, transfer() checks its capacity again
+            if target == "auto":
+                target, auto_reason = auto_assign(c, nxt.stations, lambda m: nxt.capacity.get(m, 0))
+                if not target:
+                    conn.close()
+                    return render_template("confirm.html",
+                        title="Capacity full",
+                        message=f"All {nxt.label} lanes are full at the moment. Please wait.",
+                        confirm_name=None,
+                        cancel_url=back,
+                        post_url=None,
+                        hidden_fields={}
+                    )
+            if target not in nxt.capacity:
+                conn.close()
+                return render_template("confirm.html",
+                    title=f"Choose {nxt.label}",
+                    message=f"Please select a {nxt.label} machine.",
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
+            count_pending, cap = len(target_pending[target]), nxt.capacity[target]
+            if count_pending >= cap:
+                available = [m.upper() for m in nxt.stations if len(target_pending[m]) < nxt.capacity[m]]
+                msg = f"{target.upper()} is full ({count_pending}/{cap})."
+                if available:
+                    msg += " Available: " + ", ".join(available)
+                conn.close()
+                return render_template("confirm.html",
+                    title="Capacity full",
+                    message=msg,
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
+            question = f"Assign order to {target.upper()}?" + (f" Auto-assigned, {auto_reason}." if auto_reason else "")
+        else:
+            if len(occupancy) >= len(nxt.slots):
+                conn.close()
+                return render_template("confirm.html",
+                    title=f"{nxt.label} full",
+                    message=f"All {nxt.label} slots are occupied.",
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
+            target = int(target) if str(target or "").isdigit() else None
+            if target not in nxt.slots:
+                conn.close()
+                return render_template("confirm.html",
+                    title="Choose slot",
+                    message=f"Please choose {nxt.label} slot " + ", ".join(str(s) for s in nxt.slots) + ".",
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
+            if target in occupancy:
+                free = [str(s) for s in nxt.slots if s not in occupancy]
+                msg = f"{nxt.label} slot {target} is occupied."
+                if free:
+                    msg += " Available slots: " + ", ".join(free)
+                conn.close()
+                return render_template("confirm.html",
+                    title="Slot occupied",
+                    message=msg,
+                    confirm_name=None,
+                    cancel_url=back,
+                    post_url=None,
+                    hidden_fields={}
+                )
+            question = f"Move this job to {nxt.label.upper()}, slot {target}?"
         if not request.form.get("confirm"):
             conn.close()
             return render_template("confirm.html",
-                title="Confirm move",
-                message=f"Move this job to WRAPPING, slot {slot}?",
+                title=f"Confirm {'assignment' if nxt.kind == 'machine' else 'move'}",
+                message=question,
                 confirm_name="confirm",
-                cancel_url=url_for("tramming2_station"),
-                post_url=url_for("tramming2_station"),
-                hidden_fields={
-                    "action": "assign_wrap",
-                    "order_id": order_id,
-                    "src_edge": src_edge,
-                    "wrap_slot": slot,
-                }
+                cancel_url=back,
+                post_url=back,
+                hidden_fields={"action": request.form.get("action"), "order_id": order_id,
+                               "src": src, "target": target, "auto_reason": auto_reason}
             )
         d = get_db(); dc = d.cursor()
-        dc.execute("""
-            UPDATE orders
-            SET current_station='wrapping',
-                status='Pending',
-                queued_at=CURRENT_TIMESTAMP,
-                wrap_slot=?
-            WHERE id=? AND current_station=? AND status='Done'
-        """, (slot, order_id, src_edge))
+        dc.execute("BEGIN IMMEDIATE")
+        ok, message = transfer(dc, stage, int(order_id), src, target)
+        if ok and auto_reason:
+            log_assignment(int(order_id), nxt.name, target, auto_reason, dc)
         d.commit(); d.close(); conn.close()
-        log_many([(int(order_id), TRAMMING2_STATION, "done"), (int(order_id), WRAPPING_STATION, "pending")])
-        return redirect(url_for("tramming2_station"))
+        if not ok:
+            return render_template("confirm.html",
+                title=f"Cannot {moving}",
+                message=message,
+                confirm_name=None,
+                cancel_url=back,
+                post_url=None,
+                hidden_fields={}
+            )
+        return redirect(back)
 
     conn.close()
     return render_template(
-        "station_tramming2.html",
-        edge_done=edge_done,
-        wrap_occ=wrap_occ,
-        wrap_slots=WRAP_SLOTS
+        "station_transfer.html" if nxt.kind == "machine" else "station_transfer_slots.html",
+        label=stage.label,
+        source_label=src_stage.label,
+        target_label=nxt.label,
+        sources=src_stage.stations,
+        source_done=source_done,
+        targets=nxt.stations,
+        target_pending=target_pending,
+        capacities=nxt.capacity,
+        slots=nxt.slots,
+        occupancy=occupancy,
+        labels=STATION_LABELS,
+        priority_labels=dict(PRIORITIES)
     )
 
+# Screen per stage kind, see create_app()
+STAGE_VIEWS = {"machine": machine_station, "transfer": transfer_station}
+
 # ----- Wrapping -----
-@app.route("/wrapping", methods=["GET","POST"])
+@route("/wrapping", methods=["GET","POST"])
 @login_required
 def wrapping_station():
     if (session.get("area") or "").lower() != WRAPPING_STATION:
         return ("Forbidden: not Wrapping", 403)
     conn = get_db(); c = conn.cursor()
-    c.execute("""
-        SELECT wrap_slot, id, order_number, status,
-               datetime(queued_at,'localtime'), datetime(started_at,'localtime')
-        FROM orders
-        WHERE current_station='wrapping'
-          AND wrap_slot IS NOT NULL
-          AND status IN ('Pending','In progress')
-        ORDER BY wrap_slot ASC
-    """)
-    wrap_occ = {r[0]: r[1:] for r in c.fetchall()}
+    wrap_occ = slot_occupancy(c, routing().stages[WRAPPING_STATION])
     c.execute("""
         SELECT id, order_number, datetime(finished_at,'localtime')
         FROM orders
@@ -931,13 +1966,9 @@ def wrapping_station():
                     hidden_fields={"action": "start", "order_id": oid}
                 )
             d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='In progress', started_at=CURRENT_TIMESTAMP
-                WHERE id=? AND current_station='wrapping' AND status='Pending'
-            """, (oid,))
+            dc.execute("BEGIN IMMEDIATE")
+            start_job(dc, WRAPPING_STATION, int(oid))
             d.commit(); d.close(); conn.close()
-            log_status(int(oid), WRAPPING_STATION, "in_progress")
             return redirect(url_for("wrapping_station"))
 
         if action == "finish":
@@ -952,63 +1983,70 @@ def wrapping_station():
                     hidden_fields={"action": "finish", "order_id": oid}
                 )
             d = get_db(); dc = d.cursor()
-            dc.execute("""
-                UPDATE orders
-                SET status='Done',
-                    finished_at=CURRENT_TIMESTAMP,
-                    wrap_slot=NULL
-                WHERE id=? AND current_station='wrapping' AND status='In progress'
-            """, (oid,))
+            dc.execute("BEGIN IMMEDIATE")
+            finish_job(dc, WRAPPING_STATION, int(oid))
             d.commit(); d.close(); conn.close()
-            log_status(int(oid), WRAPPING_STATION, "done")
             return redirect(url_for("wrapping_station"))
 
     conn.close()
     return render_template(
         "station_wrapping.html",
         wrap_occ=wrap_occ,
-        wrap_slots=WRAP_SLOTS,
+        wrap_slots=routing().stages[WRAPPING_STATION].slots,
         done=done
     )
 
 # ----- Loading -----
-@app.route("/loading", methods=["GET","POST"])
+@route("/loading", methods=["GET","POST"])
 @login_required
 def loading_station():
     if (session.get("area") or "").lower() != LOADING_STATION:
         return ("Forbidden: not Loading", 403)
 
-    lorry1_label, lorry2_label, l1_num, l2_num, next_num = get_lorry_state()
-
     conn = get_db(); c = conn.cursor()
+    lorries = open_lorries(c)
+    (l1_id, l1_num, _), (l2_id, l2_num, _) = lorries[1], lorries[2]
+    lorry1_label, lorry2_label = f"Lorry {l1_num}", f"Lorry {l2_num}"
 
     c.execute("""
-        SELECT id, order_number, datetime(finished_at,'localtime')
-        FROM orders
-        WHERE current_station='wrapping' AND status='Done'
-        ORDER BY finished_at ASC
-    """)
+        SELECT o.id, o.order_number, datetime(o.finished_at,'localtime'), o.route,
+               COALESCE(o.volume_m3, ?), COALESCE(o.weight_kg, ?), p.slot
+        FROM orders o LEFT JOIN load_plan p ON p.order_id = o.id
+        WHERE o.current_station='wrapping' AND o.status='Done'
+        ORDER BY o.finished_at ASC
+    """, default_order_size())
     ready = c.fetchall()
+    fill = lorry_fill(c)
+    with tracing.span("suggested pairs"):
+        items = [load_planner.Item(r[0], r[4], r[5], r[3]) for r in ready]
+        placement = {r[0]: r[6] for r in ready}
+        numbers = {r[0]: r[1] for r in ready}
+        suggested = {}
+        for slot in (1, 2):
+            ids = load_planner.next_pair(placement, items, slot)
+            suggested[slot] = {"ids": ids, "numbers": " + ".join(numbers[i] for i in ids)}
+
+    # Only the two open lorries, through idx_orders_lorry_load
+    def in_progress(lorry_id):
+        c.execute("""
+            SELECT id, order_number, datetime(started_at,'localtime'), lorry, batch_id
+            FROM orders
+            WHERE lorry_id=? AND status='In progress' AND current_station='loading'
+            ORDER BY started_at ASC
+        """, (lorry_id,))
+        return c.fetchall()
 
-    c.execute("""
-        SELECT id, order_number, datetime(started_at,'localtime'), lorry, batch_id
-        FROM orders
-        WHERE current_station='loading' AND status='In progress'
-        ORDER BY started_at ASC
-    """)
-    inprog_all = c.fetchall()
-    inprog_l1 = [r for r in inprog_all if (r[3] or "") == lorry1_label]
-    inprog_l2 = [r for r in inprog_all if (r[3] or "") == lorry2_label]
+    def loaded(lorry_id):
+        c.execute("""
+            SELECT id, order_number, datetime(finished_at,'localtime'), lorry
+            FROM orders
+            WHERE lorry_id=? AND status='Done' AND current_station='loading'
+            ORDER BY finished_at DESC
+        """, (lorry_id,))
+        return c.fetchall()
 
-    c.execute("""
-        SELECT id, order_number, datetime(finished_at,'localtime'), lorry
-        FROM orders
-        WHERE current_station='loading' AND status='Done'
-        ORDER BY finished_at DESC
-    """)
-    fin_all = c.fetchall()
-    fin_l1 = [r for r in fin_all if (r[3] or "") == lorry1_label]
-    fin_l2 = [r for r in fin_all if (r[3] or "") == lorry2_label]
+    inprog_l1, inprog_l2 = in_progress(l1_id), in_progress(l2_id)
+    fin_l1, fin_l2 = loaded(l1_id), loaded(l2_id)
     count_l1, count_l2 = len(fin_l1), len(fin_l2)
 
     if request.method == "POST":
@@ -1027,11 +2065,11 @@ def loading_station():
                     post_url=None,
                     hidden_fields={}
                 )
-            if not ids or len(ids) > 2:
+            if not ids or len(ids) > lorry_capacity():
                 conn.close()
                 return render_template("confirm.html",
                     title="Selection error",
-                    message="Select 1 or 2 jobs to start loading.",
+                    message=f"Select 1 to {lorry_capacity()} jobs to start loading.",
                     confirm_name=None,
                     cancel_url=url_for("loading_station"),
                     post_url=None,
@@ -1053,79 +2091,55 @@ def loading_station():
                     }
                 )
             d = get_db(); dc = d.cursor()
-            batch = str(uuid.uuid4()) if len(ids) > 1 else None
-            for oid in ids:
-                dc.execute("""
-                    UPDATE orders
-                    SET current_station='loading',
-                        status='In progress',
-                        started_at=CURRENT_TIMESTAMP,
-                        lorry=?,
-                        batch_id=?
-                    WHERE id=? AND current_station='wrapping' AND status='Done'
-                """, (label, batch, oid))
+            dc.execute("BEGIN IMMEDIATE")
+            try:
+                ok, message = start_loading(dc, [int(i) for i in ids], int(lorry_sel))
+            except ValueError:
+                ok, message = False, "Bad order id."
+            if not ok:
+                d.rollback(); d.close(); conn.close()
+                return render_template("confirm.html",
+                    title="Cannot start loading",
+                    message=message,
+                    confirm_name=None,
+                    cancel_url=url_for("loading_station"),
+                    post_url=None,
+                    hidden_fields={}
+                )
             d.commit(); d.close(); conn.close()
-            log_many([(int(oid), LOADING_STATION, "in_progress") for oid in ids])
             return redirect(url_for("loading_station"))
 
         if action == "finish":
             oid = request.form.get("order_id")
-            d = get_db(); dc = d.cursor()
-            dc.execute("""
-                SELECT batch_id
-                FROM orders
-                WHERE id=? AND current_station='loading' AND status='In progress'
-            """, (oid,))
-            row = dc.fetchone()
             if not request.form.get("confirm"):
-                d.close()
+                conn.close()
                 return render_template("confirm.html",
                     title="Confirm finish",
-                    message="Mark this job loaded? If it is part of a pair, both will be marked done.",
+                    message="Mark this job loaded? If it is part of a batch, the whole batch will be marked done.",
                     confirm_name="confirm",
                     cancel_url=url_for("loading_station"),
                     post_url=url_for("loading_station"),
                     hidden_fields={"action": "finish", "order_id": oid}
                 )
-            if row and row[0]:
-                batch_id = row[0]
-                dc.execute("""
-                    UPDATE orders
-                    SET status='Done', finished_at=CURRENT_TIMESTAMP
-                    WHERE batch_id=? AND current_station='loading' AND status='In progress'
-                """, (batch_id,))
-                dc.execute("""
-                    SELECT id FROM orders
-                    WHERE batch_id=? AND current_station='loading' AND status='Done'
-                """, (batch_id,))
-                ids_done = [r[0] for r in dc.fetchall()]
-                d.commit(); d.close()
-                log_many([(int(i), LOADING_STATION, "done") for i in ids_done])
-            else:
-                dc.execute("""
-                    UPDATE orders
-                    SET status='Done', finished_at=CURRENT_TIMESTAMP
-                    WHERE id=? AND current_station='loading' AND status='In progress'
-                """, (oid,))
-                d.commit(); d.close()
-                log_status(int(oid), LOADING_STATION, "done")
+            conn.close()
+            d = get_db(); dc = d.cursor()
+            dc.execute("BEGIN IMMEDIATE")
+            finish_loading(dc, int(oid))
+            d.commit(); d.close()
             return redirect(url_for("loading_station"))
 
         if action in ("complete_lorry1", "complete_lorry2"):
-            left_side = action.endswith("1")
-            fin_count = count_l1 if left_side else count_l2
-            inprog_count = len(inprog_l1) if left_side else len(inprog_l2)
-            if fin_count < LORRY_CAPACITY or inprog_count > 0:
-                conn.close()
+            conn.close()
+            error = close_lorry(1 if action.endswith("1") else 2)
+            if error:
                 return render_template("confirm.html",
                     title="Cannot complete",
-                    message="Lorry is not fully loaded yet.",
+                    message=error,
                     confirm_name=None,
                     cancel_url=url_for("loading_station"),
                     post_url=None,
                     hidden_fields={}
                 )
-            advance_lorry(1 if left_side else 2)
             return redirect(url_for("loading_station"))
 
     conn.close()
@@ -1140,11 +2154,219 @@ def loading_station():
         lorry2_label=lorry2_label,
         count_l1=count_l1,
         count_l2=count_l2,
-        capacity=LORRY_CAPACITY
+        fill=fill,
+        suggested=suggested,
+        batch_max=lorry_capacity()
     )
 
+# ----- Scan -----
+SCAN_STATIONS = [station for stage in LINE.stages.values() if stage.kind != "intake" for station in stage.stations]
+SCAN_BURST = 50     # most order numbers taken in one request
+
+@route("/scan", methods=["GET", "POST"])
+@login_required
+def scan():
+    """
+    Barcode fast path: advance orders by printed order number in one round trip.
+    POST JSON {"order_numbers": [...], "target": ..., "lorry": 1|2} or form fields
+    order_number (repeatable), target, lorry. Scans are applied in order in one
+    transaction; a scan that breaks a rule changes nothing.
+    """
+    station = (session.get("area") or "").lower()
+    if station not in SCAN_STATIONS:
+        return ("Forbidden: not a scanning station", 403)
+    if request.method == "GET":
+        conn = get_db(); c = conn.cursor()
+        lorries = [lorry_label(c, 1), lorry_label(c, 2)]
+        conn.close()
+        stage = LINE.by_station[station]
+        nxt = routing().stages[stage.next] if stage.kind == "transfer" else None
+        return render_template("scan.html", station=station, next_stage=nxt,
+                               labels=STATION_LABELS, lorries=lorries)
+
+    t0 = time.perf_counter()
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        numbers = data.get("order_numbers") or [data.get("order_number")]
+    else:
+        data = request.form
+        numbers = request.form.getlist("order_number")
+    numbers = [str(n).strip() for n in numbers if n and str(n).strip()][:SCAN_BURST]
+    target = (str(data.get("target") or "").strip().lower()) or None
+    try:
+        lorry = int(data.get("lorry") or 0) or None
+    except (TypeError, ValueError):
+        lorry = None
+
+    conn = get_db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    results = []
+    for number in numbers:
+        c.execute("SAVEPOINT scan")
+        order = find_order(c, number)
+        if order:
+            ok, message = scan_transition(c, station, order, target, lorry)
+        else:
+            ok, message = False, "Unknown order number."
+        if not ok:
+            c.execute("ROLLBACK TO scan")
+        c.execute("RELEASE scan")
+        results.append({"order_number": number, "ok": ok, "message": message})
+    conn.commit(); conn.close()
+    return jsonify(station=station, results=results, ms=round((time.perf_counter() - t0) * 1000, 1))
+
+# ----- Offline sync -----
+SYNC_MAX_ACTIONS = 1000
+
+def apply_action(c, station, fields, at=None):
+    """
+    One station-screen action from its form fields (action, order_id or
+    order_ids, target, lorry), checked against the orders as
+    they are now. Returns ('applied' | 'already' | 'conflict', message):
+    'already' when the order's history shows the action happened anyway,
+    e.g. a colleague did it while this terminal was offline.
+    """
+    action = fields.get("action")
+    try:
+        oids = [int(x) for x in str(fields.get("order_ids") or fields.get("order_id") or "").split(",") if x]
+    except ValueError:
+        return "conflict", "Bad order id."
+    if not oids:
+        return "conflict", "No order selected."
+    c.execute("SELECT current_station, status FROM orders WHERE id=?", (oids[0],))
+    row = c.fetchone()
+    if not row:
+        return "conflict", "Unknown order."
+    now_at, status = row
+    if at:
+        # Never before the order's last logged change, so its history stays in order
+        c.execute(f"SELECT MAX(changed_at) FROM order_history WHERE order_id IN ({','.join('?' * len(oids))})", oids)
+        last = c.fetchone()[0]
+        at = max(at, last) if last else at
+
+    stage = LINE.by_station.get(station)
+    kind = stage.kind if stage else None
+    if action == "start" and kind in ("machine", "slots"):
+        mark = (station, "in_progress")
+        ok, message = start_job(c, station, oids[0], at)
+    elif action == "finish" and station == LOADING_STATION:
+        mark = (station, "done")
+        ok, message = finish_loading(c, oids[0], at)
+    elif action == "finish" and kind in ("machine", "slots"):
+        mark = (station, "done")
+        ok, message = finish_job(c, station, oids[0], at)
+    elif action in ("assign", "assign_wrap") and kind == "transfer":
+        mark = (station, "done")
+        # tgt_edge / wrap_slot: actions queued by pages from before the station engine
+        target = fields.get("target") or fields.get("tgt_edge") or fields.get("wrap_slot")
+        if LINE.stages[stage.next].kind == "slots" and not str(target or "").isdigit():
+            target = None
+        if now_at in LINE.stages[stage.source].stations and status == "Done":
+            ok, message = transfer(c, stage, oids[0], now_at, target, at)
+        else:
+            ok, message = False, f"The order is at {(now_at or '—').upper()} ({status})."
+    elif action == "bulk" and kind == "transfer":
+        mark = (station, "done")
+        ok, message = transfer_many(c, stage, fields.get("src"), oids, fields.get("target") or None, at)
+    elif action == "start_batch" and station == LOADING_STATION:
+        mark = (station, "in_progress")
+        try:
+            lorry = int(fields.get("lorry") or 0)
+        except ValueError:
+            lorry = 0
+        ok, message = start_loading(c, oids, lorry, at)
+    else:
+        return "conflict", "This action needs a connection, please redo it."
+    if ok:
+        return "applied", message
+    c.execute("SELECT 1 FROM order_history WHERE order_id=? AND station=? AND status=? LIMIT 1", (oids[0], *mark))
+    if c.fetchone():
+        return "already", f"Already recorded, the order is now at {(now_at or '—').upper()} ({status})."
+    return "conflict", message
+
+@route("/ping")
+def ping():
+    """Connectivity check for the station pages' auto-refresh and offline queue."""
+    return ("", 204)
+
+@route("/sync", methods=["POST"])
+@login_required
+def sync():
+    """
+    Applies actions a station page queued while offline.
+    JSON {"sent_at": client ms, "actions": [{"id", "at": client ms, "fields": {...}}, ...]}.
+    Actions run in client time order in one transaction, each under its own
+    savepoint. Client times are shifted by the client/server clock offset
+    measured with sent_at and recorded as when the transitions happened.
+    """
+    station = (session.get("area") or "").lower()
+    if station not in SCAN_STATIONS:
+        return ("Forbidden: not a station terminal", 403)
+    t0 = time.perf_counter()
+    data = request.get_json(silent=True) or {}
+    actions = data.get("actions") or []
+    if len(actions) > SYNC_MAX_ACTIONS:
+        return (f"At most {SYNC_MAX_ACTIONS} actions per sync", 413)
+    now = time.time()
+    try:
+        offset = now - float(data["sent_at"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        offset = 0.0
+
+    conn = get_db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    results, counts = [], {"applied": 0, "already": 0, "conflict": 0}
+    for a in sorted(actions, key=lambda a: a.get("at") or 0):
+        at = None
+        if a.get("at"):
+            at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(min(now, float(a["at"]) / 1000 + offset)))
+        c.execute("SAVEPOINT sync_action")
+        status, message = apply_action(c, station, a.get("fields") or {}, at)
+        if status != "applied":
+            c.execute("ROLLBACK TO sync_action")
+        c.execute("RELEASE sync_action")
+        counts[status] += 1
+        results.append({"id": a.get("id"), "status": status, "message": message})
+    conn.commit(); conn.close()
+    return jsonify(results=results, ms=round((time.perf_counter() - t0) * 1000, 1), **counts)
+
+# ====== Downtime log ======
+@route("/manager/downtime", methods=["GET", "POST"])
+@login_required
+def downtime():
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+
+    conn = get_db(); conn.row_factory = sqlite3.Row; c = conn.cursor()
+
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "start":
+            area = (request.form.get("area") or "").strip().lower()
+            kind = (request.form.get("kind") or "").strip()
+            if area in STAFFING_STATIONS and kind in DOWNTIME_KINDS:
+                c.execute("INSERT INTO downtime (area, kind, comment) VALUES (?,?,?)",
+                          (area, kind, (request.form.get("comment") or "").strip() or None))
+        elif action == "end":
+            c.execute("UPDATE downtime SET ended_at=CURRENT_TIMESTAMP WHERE id=? AND ended_at IS NULL",
+                      (request.form.get("id"),))
+        conn.commit(); conn.close()
+        return redirect(url_for("downtime"))
+
+    c.execute("""
+        SELECT id, area, kind, comment,
+               datetime(started_at,'localtime') AS started_at,
+               datetime(ended_at,'localtime') AS ended_at
+        FROM downtime
+        ORDER BY ended_at IS NOT NULL, started_at DESC
+        LIMIT 200
+    """)
+    rows = c.fetchall()
+    conn.close()
+    return render_template("downtime.html", rows=rows, areas=STAFFING_STATIONS, kinds=DOWNTIME_KINDS)
+
 # ====== Manager training matrix screen ======
-@app.route("/manager/training", methods=["GET", "POST"])
+@route("/manager/training", methods=["GET", "POST"])
 @login_required
 def manager_training():
     if (session.get("area") or "").lower() != MANAGER_AREA:
@@ -1181,7 +2403,7 @@ def manager_training():
     )
 
 # ====== Weekly staffing screen ======
-@app.route("/manager/weekly_staffing", methods=["GET", "POST"])
+@route("/manager/weekly_staffing", methods=["GET", "POST"])
 @login_required
 def weekly_staffing():
     if (session.get("area") or "").lower() != MANAGER_AREA:
@@ -1190,37 +2412,71 @@ def weekly_staffing():
     conn = get_db(); c = conn.cursor()
 
     if request.method == "POST":
-        # Save weekly assignments, one employee per station per weekday
+        # Read the grid: one employee per station per weekday, pins and absences
+        plan, pins, absent = {}, {}, set()
         for station in STAFFING_STATIONS:
             for day_code, day_label in DAYS_OF_WEEK:
-                field_name = f"assign_{station}_{day_code}"
-                val = (request.form.get(field_name) or "").strip()
-                if not val:
-                    # Empty selection, remove any existing assignment
-                    c.execute(
-                        "DELETE FROM staffing_plan WHERE station=? AND day_of_week=?",
-                        (station, day_code)
-                    )
-                else:
-                    # Upsert
-                    c.execute("""
-                        INSERT INTO staffing_plan (station, day_of_week, employee)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(station, day_of_week)
-                        DO UPDATE SET employee = excluded.employee
-                    """, (station, day_code, val))
+                val = (request.form.get(f"assign_{station}_{day_code}") or "").strip()
+                if val:
+                    plan[(station, day_code)] = val
+                    if request.form.get(f"pin_{station}_{day_code}"):
+                        pins[(station, day_code)] = val
+        for emp_key, emp_label in TRAINING_EMPLOYEES:
+            for day_code, day_label in DAYS_OF_WEEK:
+                if request.form.get(f"absent_{emp_key}_{day_code}"):
+                    absent.add((emp_key, day_code))
+
+        # Optimise the whole week, or only the day whose cell/absence changed
+        solve_day = request.form.get("optimise_day")
+        if solve_day and solve_day not in dict(DAYS_OF_WEEK):
+            problems = [f"Unknown day {solve_day!r}"]
+        elif request.form.get("action") == "optimise" or solve_day:
+            problem = StaffingProblem(
+                STAFFING_STATIONS,
+                [e for e, _ in TRAINING_EMPLOYEES],
+                [d for d, _ in DAYS_OF_WEEK],
+                get_training_status_matrix(),
+                pins, absent
+            )
+            problems = problem.conflicts()
+            if not problems:
+                plan = problem.resolve_day(plan, solve_day) if solve_day else problem.solve_week(plan)
+        else:
+            problems = staffing_conflicts(plan, absent)
+        if problems:
+            conn.close()
+            return render_template("confirm.html",
+                title="Plan not saved",
+                message=" ".join(p + "." for p in problems),
+                confirm_name=None,
+                cancel_url=url_for("weekly_staffing"),
+                post_url=None,
+                hidden_fields={}
+            )
+
+        c.execute("DELETE FROM staffing_plan")
+        c.executemany(
+            "INSERT INTO staffing_plan (station, day_of_week, employee, pinned) VALUES (?,?,?,?)",
+            [(st, day, emp, int((st, day) in pins)) for (st, day), emp in plan.items() if emp]
+        )
+        c.execute("DELETE FROM staffing_absence")
+        c.executemany("INSERT INTO staffing_absence (employee, day_of_week) VALUES (?,?)", sorted(absent))
         conn.commit()
         conn.close()
         return redirect(url_for("weekly_staffing"))
 
     # GET, load existing plan into dict[(station, day_code)] = employee_key
-    c.execute("SELECT station, day_of_week, employee FROM staffing_plan")
+    c.execute("SELECT station, day_of_week, employee, pinned FROM staffing_plan")
     rows = c.fetchall()
+    c.execute("SELECT employee, day_of_week FROM staffing_absence")
+    absent = set(c.fetchall())
     conn.close()
 
-    plan = {}
-    for station, day_code, emp in rows:
+    plan, pinned = {}, set()
+    for station, day_code, emp, pin in rows:
         plan[(station, day_code)] = emp
+        if pin:
+            pinned.add((station, day_code))
 
     # Training matrix for colour coding
     matrix = get_training_status_matrix()
@@ -1233,178 +2489,51 @@ def weekly_staffing():
         days=DAYS_OF_WEEK,
         employees=TRAINING_EMPLOYEES,
         training_matrix=matrix,
-        plan=plan
+        plan=plan,
+        pinned=pinned,
+        absent=absent
     )
 
 # ====== Manager view with search + grouped columns + lorry labels ======
-@app.route("/manager")
+@route("/manager")
 @login_required
 def manager_view():
     if (session.get("area") or "").lower() != MANAGER_AREA:
         return ("Forbidden: not Manager", 403)
 
     q = (request.args.get("q") or "").strip()
+    kpi_window = request.args.get("kpi") if request.args.get("kpi") in kpi.WINDOWS else "all"
 
-    conn = get_db(); c = conn.cursor()
+    conn = get_read_db(); c = conn.cursor()
+    c.execute("BEGIN")     # one read transaction: every figure on the board is from the same moment
 
-    # Orders list
-    c.execute("SELECT id, order_number FROM orders ORDER BY id DESC")
-    orders_rows = c.fetchall()
-    order_ids = [r[0] for r in orders_rows]
-    id_to_order = {r[0]: r[1] for r in orders_rows}
+    # The top of the page; the order rows are read and rendered while it streams, see board_rows()
+    with tracing.span("board top"):
+        model, clock = eta_model(c), eta_clock()
+        path = db_path()
+        active = board_rows(conn, path, "NOT (current_station='loading' AND status='Done')", model, clock)
+        completed = board_rows(conn, path, "current_station='loading' AND status='Done'")
 
-    # Latest history per (order, station)
-    c.execute("""
-        WITH latest AS (
-            SELECT order_id, station, MAX(changed_at) AS latest_ts
-            FROM order_history
-            GROUP BY order_id, station
-        )
-        SELECT h.order_id, h.station, h.status, h.changed_at
-        FROM order_history h
-        JOIN latest l
-          ON l.order_id = h.order_id
-         AND l.station = h.station
-         AND l.latest_ts = h.changed_at
-    """)
-    hist_rows = c.fetchall()
-
-    # Build raw map then consolidate CNC and EDGE
-    per_order_raw = {}
-    for oid, station, status, ts in hist_rows:
-        per_order_raw.setdefault(oid, {})[station] = {"status": status, "ts": ts}
-
-    # Also pull a raw lookup of the orders table, including lorry label
-    cur = get_db().cursor()
-    cur.execute("""
-      SELECT id, current_station, status,
-             datetime(finished_at,'localtime'),
-             datetime(queued_at,'localtime'),
-             datetime(started_at,'localtime'),
-             lorry
-      FROM orders
-    """)
-    raw = {
-        r[0]: {
-            "cur": r[1], "st": r[2],
-            "fin": r[3], "qts": r[4], "sts": r[5],
-            "lr":  r[6]
-        } for r in cur.fetchall()
-    }
-    cur.connection.close()
-
-    def pick_latest(items):
-        return max(items, key=lambda x: (x[2] or "")) if items else None
-
-    per_order = {}
-    for oid, station_map in per_order_raw.items():
-        per_order[oid] = {}
-        # simple stations
-        for st in [
-            PREPARING_STATION,
-            TRAMMING1_STATION,
-            TRAMMING2_STATION,
-            WRAPPING_STATION,
-            LOADING_STATION,
-        ]:
-            if st in station_map:
-                per_order[oid][st] = {
-                    "status": station_map[st]["status"],
-                    "ts": station_map[st]["ts"],
-                }
-        # CNC consolidated
-        cnc_cells = [
-            (m, station_map[m]["status"], station_map[m]["ts"])
-            for m in AREA_GROUPS["cnc"]
-            if m in station_map
-        ]
-        latest_cnc = pick_latest(cnc_cells)
-        if latest_cnc:
-            mname, st_status, st_ts = latest_cnc
-            per_order[oid]["cnc"] = {
-                "status": st_status,
-                "ts": st_ts,
-                "machine": mname.upper(),
-            }
-        # EDGE consolidated
-        edge_cells = [
-            (m, station_map[m]["status"], station_map[m]["ts"])
-            for m in AREA_GROUPS["edge"]
-            if m in station_map
-        ]
-        latest_edge = pick_latest(edge_cells)
-        if latest_edge:
-            mname, st_status, st_ts = latest_edge
-            per_order[oid]["edge"] = {
-                "status": st_status,
-                "ts": st_ts,
-                "machine": mname.upper(),
-            }
-        # Attach lorry name to LOADING cell if present in orders row
-        lr = raw.get(oid, {}).get("lr")
-        if lr and LOADING_STATION in per_order[oid]:
-            per_order[oid][LOADING_STATION]["machine"] = lr.upper()
-
-    # Fallback to orders table for completion detection
-    active_ids, completed_ids = [], []
-    for oid in order_ids:
-        hist_loading = (per_order.get(oid, {}) or {}).get(LOADING_STATION)
-        order_row = raw.get(oid, {})
-        if hist_loading and hist_loading["status"] == "done":
-            completed_ids.append(oid)
-        elif order_row.get("cur") == LOADING_STATION and order_row.get("st") == "Done":
-            per_order.setdefault(oid, {})[LOADING_STATION] = {
-                "status": "done",
-                "ts": order_row.get("fin") or "—",
-                "machine": (order_row.get("lr") or "").upper() or None,
-            }
-            completed_ids.append(oid)
-        else:
-            active_ids.append(oid)
+        # KPIs, from the counters (see kpi.py)
+        lorries = open_lorries(c)
+        l1_label, l2_label = f"Lorry {lorries[1][1]}", f"Lorry {lorries[2][1]}"
+        counts = kpi.read(c, kpi_window, [lorries[1][0], lorries[2][0]])
+        lorries_completed_total = counts["closed"].get("", 0)
+        orders_fully_done = counts["done"].get(LOADING_STATION, 0)
+        per_area_done = {st: counts["done"].get(st, 0) for st in STAFFING_STATIONS}
 
-    # KPIs
-    l1_label, l2_label, l1n, l2n, nextn = get_lorry_state()
-    lorries_completed_total = max(0, nextn - 3)
-    c.execute("""
-        SELECT COUNT(*)
-        FROM orders
-        WHERE current_station='loading' AND status='Done'
-    """)
-    (orders_fully_done,) = c.fetchone()
-
-    per_area_done = {}
-    for st in [
-        PREPARING_STATION,
-        *CNC_STATIONS,
-        TRAMMING1_STATION,
-        *EDGE_STATIONS,
-        TRAMMING2_STATION,
-        WRAPPING_STATION,
-        LOADING_STATION,
-    ]:
-        c.execute("""
-            SELECT COUNT(*)
-            FROM order_history
-            WHERE station=? AND status='done'
-        """, (st,))
-        per_area_done[st] = (c.fetchone() or [0])[0]
-
-    def lorry_progress(label):
-        c2 = get_db().cursor()
-        c2.execute("""
-            SELECT COUNT(*)
-            FROM orders
-            WHERE current_station='loading'
-              AND status='Done'
-              AND lorry=?
-        """, (label,))
-        (cnt_done,) = c2.fetchone()
-        c2.connection.close()
-        pct = int(min(100, round((cnt_done / LORRY_CAPACITY) * 100))) if LORRY_CAPACITY else 0
-        return cnt_done, pct
-
-    l1_done, l1_pct = lorry_progress(l1_label)
-    l2_done, l2_pct = lorry_progress(l2_label)
+        fill = lorry_fill(c)
+
+        def lorry_progress(slot):
+            cnt_done = counts["lorry"].get(str(lorries[slot][0]), 0)
+            f = fill[slot]
+            pct = int(min(100, round(max(f["volume"] / f["max_volume"], f["weight"] / f["max_weight"]) * 100)))
+            return cnt_done, pct
+
+        l1_done, l1_pct = lorry_progress(1)
+        l2_done, l2_pct = lorry_progress(2)
+
+        stuck_orders = stuck.open_alerts(conn)
 
     # Search handling
     search_mode = bool(q)
@@ -1412,22 +2541,22 @@ def manager_view():
     search_oid = None
     search_onum = None
     search_current_line = None
+    search_first_seen = search_cells = search_eta = None
 
     def human_group(station_code):
         s = (station_code or "").lower()
-        if s in AREA_GROUPS.get("cnc", []):
-            return "CNC", f" ({s.upper()})"
-        if s in AREA_GROUPS.get("edge", []):
-            return "EDGE", f" ({s.upper()})"
+        if area_group(s) != s:
+            return area_group(s).upper(), f" ({s.upper()})"
         return (s.upper() if s else "UNKNOWN"), ""
 
     if search_mode:
-        c.execute("""
+        c.execute(f"""
             SELECT id, order_number, current_station, status,
                    datetime(queued_at,'localtime'),
                    datetime(started_at,'localtime'),
                    datetime(finished_at,'localtime'),
-                   lorry
+                   lorry,
+                   {ELAPSED_SQL}
             FROM orders
             WHERE lower(order_number) = lower(?)
             LIMIT 1
@@ -1444,7 +2573,10 @@ def manager_view():
                 sts,
                 fts,
                 lorry_lbl,
+                elapsed,
             ) = row
+            cells = board_cells(c, search_oid, cur_st, cur_status, fts, lorry_lbl)
+            search_eta = order_eta(model, cur_st, cur_status, elapsed, clock)
 
             label, machine_hint = human_group(cur_st)
             lorry_hint = ""
@@ -1483,7 +2615,6 @@ def manager_view():
                     f"(done) at {when}"
                 )
             else:
-                cells = per_order.get(search_oid, {})
                 latest = None
                 for st_code, cell in cells.items():
                     if (not latest) or (cell["ts"] > latest["ts"]):
@@ -1502,20 +2633,14 @@ def manager_view():
                     search_current_line = "Current location: —"
 
             # Ensure minimal cell present for current station if history is missing
-            if search_oid not in per_order:
-                per_order[search_oid] = {}
             if cur_st:
-                key = (
-                    "cnc"
-                    if cur_st in AREA_GROUPS["cnc"]
-                    else ("edge" if cur_st in AREA_GROUPS["edge"] else cur_st)
-                )
+                key = area_group(cur_st)
                 ts_guess = (
                     qts
                     if cur_status == "Pending"
                     else (sts if cur_status == "In progress" else (fts or "—"))
                 )
-                per_order[search_oid][key] = {
+                cells[key] = {
                     "status": cur_status.replace(" ", "_").lower(),
                     "ts": ts_guess,
                     "machine": (
@@ -1527,15 +2652,12 @@ def manager_view():
                     ),
                 }
 
-    conn.close()
-
-    active = [(oid, id_to_order.get(oid, f"#{oid}")) for oid in active_ids]
-    completed = [(oid, id_to_order.get(oid, f"#{oid}")) for oid in completed_ids]
+            search_first_seen = (cells.get(MANAGER_STATIONS[0]) or {}).get("ts")
+            search_cells = board_row_html(cells)
 
-    return render_template(
+    response = Response(board_chunks(stream_template(
         "manager.html",
         stations=MANAGER_STATIONS,
-        per_order=per_order,
         active_orders=active,
         completed_orders=completed,
         lorry1_label=l1_label,
@@ -1544,20 +2666,451 @@ def manager_view():
         l2_done=l2_done,
         l1_pct=l1_pct,
         l2_pct=l2_pct,
-        lorry_capacity=LORRY_CAPACITY,
+        lorry_capacity=lorry_capacity(),
         lorries_completed_total=lorries_completed_total,
         orders_fully_done=orders_fully_done,
         per_area_done=per_area_done,
+        kpi_window=kpi_window,
+        kpi_windows=kpi.WINDOWS,
         q=q,
         search_mode=search_mode,
         search_found=search_found,
         search_oid=search_oid,
         search_onum=search_onum,
         search_current_line=search_current_line,
+        search_first_seen=search_first_seen,
+        search_cells=search_cells,
+        search_eta=search_eta,
+        stuck_orders=stuck_orders,
+        line=current_line(),
+        lines=list(current_app.config["LINES"]),
+    )), mimetype="text/html")
+    # The rows are read from the connection while the response streams
+    response.call_on_close(conn.close)
+    return response
+
+# ----- Board rendering -----
+# The board is streamed: the top of the page is sent as soon as the KPIs are
+# read, and the order rows are read, consolidated and rendered one at a time
+# while the page streams, so the first rows paint however large the board
+# is. Each order's station cells are cached per worker under the order's
+# version: a row that hasn't changed since the last refresh is neither read
+# from history nor rendered again.
+BOARD_ROW_CACHE_MAX = 200000    # cached rows per worker before the cache starts over
+BOARD_STREAM_BYTES = 16384      # streamed output is sent in pieces of about this size
+
+_board_rows = {}    # (db path, order id) -> (version, cells html, first seen)
+
+BOARD_ORDERS_SQL = f"""
+    SELECT id, order_number, current_station, status, datetime(finished_at,'localtime'), lorry,
+           {ELAPSED_SQL}, (SELECT MAX(id) FROM order_history WHERE order_id = orders.id)
+    FROM orders
+    WHERE {{where}}
+    ORDER BY id DESC
+"""
+
+def board_cells(c, oid, current, status, finished, lorry):
+    """
+    An order's board cells {column: {status, ts, machine}}: its latest
+    history row per station, CNC and edge consolidated to the latest machine
+    of the group, and the orders row for a completion history doesn't show.
+    """
+    c.execute("SELECT station, status, changed_at FROM order_history WHERE order_id=? ORDER BY changed_at, id",
+              (oid,))
+    latest = {station: {"status": st, "ts": ts} for station, st, ts in c.fetchall()}
+    cells = {st: latest[st] for st in MANAGER_STATIONS if st not in AREA_GROUPS and st in latest}
+    for group, machines in AREA_GROUPS.items():
+        seen = [(m, latest[m]) for m in machines if m in latest]
+        if seen:
+            machine, cell = max(seen, key=lambda x: x[1]["ts"] or "")
+            cells[group] = {**cell, "machine": machine.upper()}
+    if lorry and LOADING_STATION in cells:
+        cells[LOADING_STATION]["machine"] = lorry.upper()
+    if current == LOADING_STATION and status == "Done" and cells.get(LOADING_STATION, {}).get("status") != "done":
+        cells[LOADING_STATION] = {"status": "done", "ts": finished or "—", "machine": (lorry or "").upper() or None}
+    return cells
+
+def board_row_html(cells):
+    return Markup(current_app.jinja_env.get_template("_board_row.html").render(stations=MANAGER_STATIONS, cells=cells))
+
+def board_rows(conn, path, where, model=None, clock=None):
+    """
+    Yields (order number, first seen, ETA or None, cells html) for the
+    orders matching `where`, newest first, as manager.html iterates it.
+    ETAs only with an EtaModel.
+    """
+    c, hc = conn.cursor(), conn.cursor()
+    c.execute(BOARD_ORDERS_SQL.format(where=where))
+    while True:
+        rows = c.fetchmany(500)
+        if not rows:
+            break
+        for oid, number, current, status, finished, lorry, elapsed, last in rows:
+            version = (last, current, status, lorry)
+            hit = _board_rows.get((path, oid))
+            if hit and hit[0] == version:
+                html, first_seen = hit[1], hit[2]
+            else:
+                cells = board_cells(hc, oid, current, status, finished, lorry)
+                html, first_seen = board_row_html(cells), (cells.get(MANAGER_STATIONS[0]) or {}).get("ts")
+                if len(_board_rows) >= BOARD_ROW_CACHE_MAX:
+                    _board_rows.clear()
+                _board_rows[(path, oid)] = (version, html, first_seen)
+            eta = order_eta(model, current, status, elapsed, clock) if model else None
+            yield number, first_seen, eta, html
+
+def board_chunks(pieces):
+    """A stream_template() output's many small pieces joined into BOARD_STREAM_BYTES writes."""
+    buf, size = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= BOARD_STREAM_BYTES:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+# ----- All lines -----
+# Each line is its own database, so the cross-line board asks every shard at
+# once on the app's fan-out pool and merges what comes back.
+LINES_SEARCH_LIMIT = 20     # matches per line
+
+def line_overview(line, path, q=None):
+    """WIP per manager column, loaded today, open lorries, stuck alerts and order matches for one line."""
+    t0 = time.perf_counter()
+    conn = readpool.pool(path).get()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN")     # one read transaction, the figures agree with each other
+        c.execute("""
+            SELECT current_station, COUNT(*) FROM orders
+            WHERE NOT (current_station='loading' AND status='Done')
+            GROUP BY current_station
+        """)
+        wip = {}
+        for station, n in c.fetchall():
+            wip[area_group(station)] = wip.get(area_group(station), 0) + n
+        c.execute("""
+            SELECT COUNT(*) FROM orders
+            WHERE current_station='loading' AND status='Done' AND finished_at >= date('now')
+        """)
+        loaded_today = c.fetchone()[0]
+        c.execute("""
+            SELECT l.number, COUNT(o.id) FROM lorries l
+            LEFT JOIN orders o ON o.lorry_id = l.id AND o.status='Done'
+            WHERE l.status='open' GROUP BY l.id ORDER BY l.slot
+        """)
+        lorries = c.fetchall()
+        c.execute("SELECT COUNT(*) FROM stuck_alerts WHERE resolved_at IS NULL")
+        stuck_count = c.fetchone()[0]
+        matches = []
+        if q:
+            c.execute("""
+                SELECT order_number, current_station, status,
+                       datetime(COALESCE(finished_at, started_at, queued_at),'localtime')
+                FROM orders WHERE order_number LIKE ? ORDER BY order_number LIMIT ?
+            """, (q + "%", LINES_SEARCH_LIMIT))
+            matches = [(line, *r) for r in c.fetchall()]
+    finally:
+        conn.close()
+    return {"line": line, "wip": wip, "loaded_today": loaded_today, "lorries": lorries,
+            "stuck": stuck_count, "matches": matches, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+@route("/lines")
+@login_required
+def lines_view():
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    q = (request.args.get("q") or "").strip()
+    t0 = time.perf_counter()
+    lines = current_app.config["LINES"]
+    futures = [current_app.extensions["fanout"].submit(line_overview, line, path, q) for line, path in lines.items()]
+    boards = [f.result() for f in futures]
+    totals = {col: sum(b["wip"].get(col, 0) for b in boards) for col in MANAGER_STATIONS}
+    return render_template(
+        "lines.html",
+        stations=MANAGER_STATIONS,
+        boards=boards,
+        totals=totals,
+        loaded_today=sum(b["loaded_today"] for b in boards),
+        stuck_total=sum(b["stuck"] for b in boards),
+        matches=sorted(m for b in boards for m in b["matches"]),
+        q=q,
+        ms=round((time.perf_counter() - t0) * 1000, 1),
+    )
+
+# ====== Profiling ======
+PROFILE_SECONDS = 10
+PROFILE_MAX_SECONDS = 60
+
+@route("/manager/profile")
+@login_required
+def manager_profile():
+    """
+    Runs the sampling profiler for ?seconds=N over the requests being served
+    (?threads=all for every thread) and returns the folded stacks, ready for
+    flamegraph.pl or speedscope. Needs TRACE_SLOW_MS set, as only traced
+    requests are sampled otherwise.
+    """
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    try:
+        seconds = min(max(float(request.args.get("seconds", PROFILE_SECONDS)), 0.1), PROFILE_MAX_SECONDS)
+    except ValueError:
+        return ("seconds must be a number", 400)
+    result = tracing.profile(seconds, all_threads=request.args.get("threads") == "all")
+    if result is None:
+        return ("A profile is already running, try again when it ends.", 409)
+    samples, folded = result
+    return Response(folded, mimetype="text/plain", headers={
+        "Content-Disposition": f'attachment; filename="profile-{time.strftime("%Y%m%d-%H%M%S")}.folded"',
+        "X-Profile-Samples": str(samples),
+    })
+
+# ====== Admin ======
+@route("/admin", methods=["GET", "POST"])
+@login_required
+def admin():
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    error = None
+    if request.method == "POST":
+        line = routing()
+        names = [m for stage in topology.machine_stages(line) for m in stage.stations] \
+            + [stage.name for stage in line.stages.values() if stage.kind == "slots"] + ["lorry_capacity"]
+        conn = get_db(); c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            number = line_config.edit(c, current_app.extensions["routing"],
+                                      {n: request.form.get(n, "") for n in names}, session.get("username"),
+                                      int(request.form.get("version") or 0))
+        except ValueError as e:
+            conn.rollback(); conn.close()
+            error = str(e)
+        else:
+            conn.commit()
+            # Orders without dimensions count as a share of a lorry: re-plan with the new version
+            g.line_settings.pop(db_path(), None)
+            c.execute("BEGIN IMMEDIATE")
+            plan_loads(c)
+            conn.commit(); conn.close()
+            return redirect(url_for("admin", saved=number))
+    conn = get_read_db(); c = conn.cursor()
+    lorries = open_lorries(c)
+    c.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM lorries")
+    next_number = c.fetchone()[0]
+    conn.close()
+    settings, line = line_settings()
+    return render_template("admin.html", lorries=lorries, next_number=next_number, settings=settings, line=line,
+                           machine_stages=topology.machine_stages(line),
+                           slot_stages=[s for s in line.stages.values() if s.kind == "slots"],
+                           max_figure=line_config.MAX_FIGURE, error=error,
+                           saved=request.args.get("saved"))
+
+@route("/admin/backfill_history", methods=["GET", "POST"])
+@login_required
+def admin_backfill_history():
+    """
+    GET: the dry-run report of history that disagrees with orders (see
+    consistency.py). POST with confirm: adds the missing history rows.
+    """
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    back = url_for("admin")
+    if request.method == "POST" and request.form.get("confirm"):
+        conn = get_db()
+        added = consistency.repair(conn, transfers=TRANSFER_STATIONS)
+        conn.close()
+        return render_template("confirm.html",
+            title="History repaired",
+            message=f"Added {added['missing']} history row(s) for orders without history and "
+                    f"{added['stale']} for orders whose history was behind.",
+            confirm_name=None,
+            cancel_url=back,
+            post_url=None,
+            hidden_fields={}
+        )
+    conn = get_read_db()
+    report = consistency.check(conn.cursor())
+    conn.close()
+    labels = {"missing": "order(s) without history", "stale": "order(s) whose latest history is not where they are",
+              "orphaned": "order id(s) with history but no order (left as is)",
+              "unplaced": "order(s) without a station (left as is)"}
+    found = [f"{n} {labels[kind]}" + (f" (e.g. {', '.join(map(str, examples[:5]))})" if examples else "")
+             for kind, (n, examples) in report.items() if n]
+    fixable = sum(report[kind][0] for kind in consistency.REPAIRED)
+    return render_template("confirm.html",
+        title="History check",
+        message=("Found: " + "; ".join(found) + "." if found else "History agrees with every order.")
+                + (" Add the missing history rows?" if fixable else ""),
+        confirm_name="confirm" if fixable else None,
+        cancel_url=back,
+        post_url=url_for("admin_backfill_history") if fixable else None,
+        hidden_fields={}
+    )
+
+# ====== Station occupancy ======
+def occupancy_stations(value):
+    """Stations of a station code or a group (AREA_GROUPS, e.g. "edge"), [] if neither."""
+    if value in AREA_GROUPS:
+        return list(AREA_GROUPS[value])
+    return [value] if value in STAFFING_STATIONS else []
+
+def occupancy_spans(stations, t1, t2):
+    conn = get_read_db(); c = conn.cursor()
+    spans = occupancy.query(c, stations, t1, t2, final=(LOADING_STATION, "done"), transfers=TRANSFER_STATIONS)
+    conn.close()
+    return spans
+
+@route("/manager/history")
+@login_required
+def manager_history():
+    """
+    Which orders were at a station or group, and in what state, between two
+    local times (?station=, from=, to=; the last hour by default).
+    """
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    station = request.args.get("station") or next(iter(AREA_GROUPS))
+    now = datetime.now().replace(second=0, microsecond=0)
+    try:
+        start = datetime.fromisoformat(request.args.get("from") or (now - timedelta(hours=1)).isoformat())
+        end = datetime.fromisoformat(request.args.get("to") or now.isoformat())
+    except ValueError:
+        return ("from and to must be times, e.g. 2026-10-13T10:00", 400)
+    utc = lambda t: t.astimezone(timezone.utc).strftime(occupancy.TIME_FORMAT)
+    local = lambda ts: ts and datetime.strptime(ts, occupancy.TIME_FORMAT).replace(tzinfo=timezone.utc).astimezone()
+    t0 = time.perf_counter()
+    spans = occupancy_spans(occupancy_stations(station), utc(start), utc(end))
+    ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    # Each span as a bar across the window
+    window = max((end - start).total_seconds(), 1)
+    rows = []
+    for s in spans:
+        a, b = local(s.started_at).replace(tzinfo=None), local(s.ended_at)
+        b = b.replace(tzinfo=None) if b else None
+        left = max((a - start).total_seconds(), 0) / window
+        right = min(((b or now) - start).total_seconds(), window) / window
+        rows.append({"span": s, "from": a, "to": b, "left": round(left * 100, 2),
+                     "width": round(max(right - left, 0) * 100, 2)})
+    return render_template(
+        "history.html",
+        rows=rows,
+        orders=len({s.order_id for s in spans}),
+        truncated=len(spans) >= occupancy.MAX_SPANS,
+        station=station,
+        groups=list(AREA_GROUPS),
+        stations=STAFFING_STATIONS,
+        date_from=start.strftime("%Y-%m-%dT%H:%M"),
+        date_to=end.strftime("%Y-%m-%dT%H:%M"),
+        ms=ms,
+    )
+
+@route("/api/history/occupancy")
+@login_required
+def api_occupancy():
+    """
+    Spans at ?station= (a station or group) overlapping ?from= to ?to= (UTC,
+    to defaults to now): order, station, status, started_at, ended_at (null
+    while still there).
+    """
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    stations = occupancy_stations(request.args.get("station") or "")
+    if not stations:
+        return ("Unknown station or group", 400)
+    try:
+        t1 = occupancy.parse_time(request.args.get("from") or "")
+        t2 = occupancy.parse_time(request.args["to"]) if request.args.get("to") else \
+            datetime.now(timezone.utc).strftime(occupancy.TIME_FORMAT)
+    except ValueError:
+        return ("from and to must be UTC times, e.g. 2026-10-13 10:00", 400)
+    return jsonify([
+        {"order_number": s.order_number, "station": s.station, "status": s.status,
+         "started_at": s.started_at, "ended_at": s.ended_at}
+        for s in occupancy_spans(stations, t1, t2)
+    ])
+
+# ====== Exports ======
+@route("/manager/export/<dataset>")
+@login_required
+def export_data(dataset):
+    """
+    Streams one dataset (see export.DATASETS) as csv, parquet or arrow.
+    Query args: format, gzip=1, from, to (UTC), station, lorry (number).
+    """
+    if (session.get("area") or "").lower() != MANAGER_AREA:
+        return ("Forbidden: not Manager", 403)
+    if dataset not in DATASETS:
+        return ("Unknown dataset", 404)
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        return ("Unknown format", 400)
+    if fmt != "csv" and not arrow_available():
+        return (f"{fmt} export needs pyarrow installed on the server", 400)
+    lorry = request.args.get("lorry") or None
+    if lorry is not None and not lorry.isdigit():
+        return ("lorry must be a lorry number", 400)
+    gz = request.args.get("gzip") == "1"
+    chunks = export_stream(
+        db_path(), dataset, fmt, gz,
+        date_from=request.args.get("from") or None,
+        date_to=request.args.get("to") or None,
+        station=request.args.get("station") or None,
+        lorry=int(lorry) if lorry else None,
+    )
+    return Response(
+        chunks,
+        mimetype="application/gzip" if gz else FORMATS[fmt][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(dataset, fmt, gz)}"'}
     )
 
+# ====== ETA API ======
+@route("/api/eta")
+@login_required
+def api_eta():
+    """
+    ETA to loaded for every active order, or only ?q=<order number>.
+    Minutes are expected (mean) and pessimistic (sum of p90s) remaining time.
+    """
+    q = (request.args.get("q") or "").strip()
+    conn = get_read_db(); c = conn.cursor()
+    sql = f"""
+        SELECT order_number, current_station, status, {ELAPSED_SQL}
+        FROM orders
+        WHERE NOT (current_station='loading' AND status='Done')
+    """
+    if q:
+        c.execute(sql + " AND lower(order_number) = lower(?)", (q,))
+    else:
+        c.execute(sql + " ORDER BY id")
+    rows = c.fetchall()
+    model = eta_model(c)
+    conn.close()
+    clock = eta_clock()
+    return jsonify([
+        {"order_number": onum, "station": st, "status": status,
+         **(order_eta(model, st, status, el, clock) or {})}
+        for onum, st, status, el in rows
+    ])
+
+# ====== Lorry manifests ======
+@route("/api/lorries/<int:number>")
+@login_required
+def api_lorry(number):
+    """A lorry's manifest by number, open or closed: the lorry and its orders in loading order."""
+    conn = get_read_db(); c = conn.cursor()
+    manifest = lorry_manifest(c, number)
+    conn.close()
+    if manifest is None:
+        return ("Unknown lorry", 404)
+    return jsonify(manifest)
+
 if __name__ == "__main__":
     host = os.getenv("HOST", "127.0.0.1")
     port = int(os.getenv("PORT", "5050"))
     debug = os.getenv("FLASK_DEBUG", "1") == "1"
+    app = create_app()
     app.run(host=host, port=port, debug=debug)
@@ -0,0 +1,98 @@
+"""
+Load-balanced machine assignment for the CNC and edge bander lanes.
+
+For each candidate machine we predict when a job added now would start:
+
+    remaining time of the job in progress (cycle time minus elapsed, >= 0)
+  + jobs already queued x the machine's recent cycle time
+
+Machines with open downtime are only picked when every candidate is down,
+full machines never. The machine with the earliest predicted start wins,
+ties go to the machine listed first.
+
+choose_machine() works on a plain snapshot (see MachineState) and does no
+I/O, so a decision costs microseconds. choose_many() places several jobs
+from one snapshot, each counted as queued for the next. app.py builds the
+snapshot and logs the returned reasoning to assignment_log.
+"""
+from collections import namedtuple
+
+# Used until a machine has finished jobs in order_history
+DEFAULT_CYCLE_MINUTES = 15.0
+
+# How many recent jobs per machine feed the cycle time
+RECENT_JOBS = 20
+
+MachineState = namedtuple("MachineState", [
+    "machine",          # station code, e.g. "cnc2"
+    "queued",           # Pending jobs in the lane
+    "capacity",         # max Pending jobs, None for unlimited
+    "inprog_minutes",   # elapsed minutes of the job in progress, None if idle
+    "cycle_minutes",    # recent per-job cycle time, None if unknown
+    "down_minutes",     # minutes since open downtime started, None if running
+])
+
+Prediction = namedtuple("Prediction", ["machine", "start_minutes", "available", "reason"])
+
+def median(values):
+    vals = sorted(values)
+    if not vals:
+        return None
+    mid = len(vals) // 2
+    return vals[mid] if len(vals) % 2 else (vals[mid - 1] + vals[mid]) / 2
+
+def predict(state):
+    cycle = state.cycle_minutes or DEFAULT_CYCLE_MINUTES
+    remaining = 0.0
+    if state.inprog_minutes is not None:
+        remaining = max(0.0, cycle - state.inprog_minutes)
+    start = remaining + state.queued * cycle
+    full = state.capacity is not None and state.queued >= state.capacity
+    cap = "∞" if state.capacity is None else state.capacity
+    reason = (f"{state.machine}: start in {start:.1f} min "
+              f"({state.queued}/{cap} queued x {cycle:.1f} min"
+              f"{', %.1f min left on current job' % remaining if state.inprog_minutes is not None else ''})")
+    if full:
+        reason = f"{state.machine}: full ({state.queued}/{cap})"
+    elif state.down_minutes is not None:
+        reason += f", down for {state.down_minutes:.0f} min"
+    return Prediction(state.machine, start, not full, reason)
+
+def choose_machine(states):
+    """
+    Returns (chosen machine or None, [Prediction, ...] in candidate order).
+    None means every machine is full.
+    """
+    preds = [predict(s) for s in states]
+    down = {s.machine for s in states if s.down_minutes is not None}
+    best = None
+    for p in preds:
+        if not p.available:
+            continue
+        rank = (p.machine in down, p.start_minutes)
+        if best is None or rank < best[0]:
+            best = (rank, p.machine)
+    return (best[1] if best else None), preds
+
+def explain(chosen, preds):
+    """One line for the audit log and the confirm screen."""
+    if chosen is None:
+        return "all machines full; " + "; ".join(p.reason for p in preds)
+    first = next(p for p in preds if p.machine == chosen)
+    others = [p.reason for p in preds if p.machine != chosen]
+    return f"picked {first.reason}" + (f"; vs {'; '.join(others)}" if others else "")
+
+def choose_many(states, n):
+    """
+    Spreads n jobs over the machines, each to choose_machine()'s pick with
+    the jobs placed before it counted as queued. Returns [(machine, reasoning)]
+    in placement order, or None when they don't all fit.
+    """
+    states, picks = list(states), []
+    for _ in range(n):
+        chosen, preds = choose_machine(states)
+        if chosen is None:
+            return None
+        picks.append((chosen, explain(chosen, preds)))
+        states = [s._replace(queued=s.queued + 1) if s.machine == chosen else s for s in states]
+    return picks
@@ -0,0 +1,59 @@
+"""
+Cost of one automatic machine assignment.
+
+"decision" is assignment.choose_machine() on an in-memory snapshot, the part
+that must stay well under a millisecond. "with snapshot" adds building the
+snapshot from a database holding N orders (cycle times come from the worker
+cache after the first call).
+
+    python benchmarks/assignment.py [orders]
+"""
+import os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+from assignment import MachineState, choose_machine, explain
+
+def bench(label, fn, n):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    print(f"{label:<28}{(time.perf_counter() - t0) / n * 1e6:9.1f} µs/decision")
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rnd = random.Random(1)
+    snapshots = [
+        [MachineState(m, rnd.randint(0, cap), cap, rnd.choice([None, rnd.uniform(0, 30)]),
+                      rnd.uniform(5, 25), rnd.choice([None] * 5 + [12.0]))
+         for m, cap in A.EDGE_CAPACITY.items()]
+        for _ in range(1000)
+    ]
+    it = iter(snapshots * 100)
+    bench("decision (4 edge banders)", lambda: explain(*choose_machine(next(it))), 50000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        application = A.create_app({"DB_PATH": db_path})
+        conn = sqlite3.connect(db_path)
+        # mostly shipped history, plus a realistic WIP: full queues, one job running per machine
+        rows = [(f"B{i}", "Done", A.LOADING_STATION) for i in range(orders)]
+        for m in A.CNC_STATIONS + A.EDGE_STATIONS:
+            cap = A.EDGE_CAPACITY.get(m, A.QUEUE_CAPACITY_PREP)
+            rows += [(f"{m}-{i}", "Pending", m) for i in range(rnd.randint(0, cap))]
+            rows += [(f"{m}-run", "In progress", m), (f"{m}-done", "Done", m)]
+        conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)", rows)
+        conn.executemany(
+            "INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,datetime('now', ?))",
+            [(i, st, s, f"-{m} minutes") for i in range(1, orders + 1)
+             for st in [rnd.choice(A.EDGE_STATIONS)]
+             for s, m in (("in_progress", 20), ("done", rnd.randint(5, 19)))])
+        conn.commit(); conn.close()
+        with application.app_context():
+            c = A.get_db().cursor()
+            cap = lambda m: A.EDGE_CAPACITY.get(m, 0)
+            bench(f"with snapshot ({orders} orders)", lambda: A.auto_assign(c, A.EDGE_STATIONS, cap), 2000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Manager board with 5,000 and 50,000 orders: time to first byte and total
+time of a streamed render, on a cold worker (no cached rows, templates
+compiled from source), a cold worker with the templates' bytecode cached,
+and a warm one where only a few orders changed since the last refresh.
+Also the template load itself, compiled vs. from the bytecode cache.
+
+    python benchmarks/board.py [orders ...]
+"""
+import os, random, shutil, sqlite3, sys, tempfile, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+CHANGED = 50        # orders moved between the two warm refreshes
+STAGES = [("preparing", "preparing"), ("cnc", "cnc1"), ("tramming1", "tramming1"), ("edge", "edge2"),
+          ("tramming2", "tramming2"), ("wrapping", "wrapping"), ("loading", "loading")]
+
+def seed(path, orders):
+    rnd = random.Random(45)
+    conn = sqlite3.connect(path)
+    rows, history = [], []
+    for i in range(1, orders + 1):
+        reached = rnd.randint(1, len(STAGES))
+        station = STAGES[reached - 1][1]
+        status = rnd.choice(["Pending", "In progress", "Done"])
+        rows.append((i, f"B{i:06}", status, station))
+        t = datetime(2026, 9, 1) + timedelta(seconds=30 * i)
+        for k, (_, st) in enumerate(STAGES[:reached]):
+            history.append((i, st, "pending", str(t + timedelta(hours=2 * k))))
+            history.append((i, st, "done" if k < reached - 1 else status.lower().replace(" ", "_"),
+                            str(t + timedelta(hours=2 * k + 1))))
+    conn.executemany("INSERT INTO orders (id, order_number, status, current_station) VALUES (?,?,?,?)", rows)
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)", history)
+    conn.commit(); conn.close()
+
+def touch(path, n):
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)",
+                     [(i, "wrapping", "pending", "2026-12-01 10:00:00") for i in range(1, n + 1)])
+    conn.commit(); conn.close()
+
+def board(application):
+    """(ms to the first byte, ms to the last) of one GET /manager."""
+    client = application.test_client()
+    client.post("/login", data={"username": "manager", "password": "manager123"})
+    t0 = time.perf_counter()
+    resp = client.get("/manager?norefresh=1")
+    pieces = iter(resp.response)
+    next(pieces)
+    first = time.perf_counter() - t0
+    for _ in pieces:
+        pass
+    resp.close()
+    return first * 1000, (time.perf_counter() - t0) * 1000
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [5000, 50000]
+    for orders in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path, jinja = os.path.join(tmp, "bench.db"), os.path.join(tmp, "jinja")
+            config = {"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None,
+                      "TRACE_SLOW_MS": 0, "JINJA_CACHE_DIR": jinja}
+            os.makedirs(jinja)
+            A.create_app(config)
+            seed(path, orders)
+
+            A._board_rows.clear()
+            cold = board(A.create_app(config))
+            A._board_rows.clear()
+            cold_bytecode = board(A.create_app(config))
+            application = A.create_app(config)
+            board(application)
+            touch(path, CHANGED)
+            warm = board(application)
+
+            loads = {}
+            for label in ("compiled", "bytecode"):
+                if label == "compiled":
+                    shutil.rmtree(jinja); os.makedirs(jinja)
+                env = A.create_app(config).jinja_env
+                t0 = time.perf_counter()
+                env.get_template("manager.html"); env.get_template("_board_row.html")
+                loads[label] = (time.perf_counter() - t0) * 1000
+
+            print(f"{orders:6} orders: cold first byte {cold[0]:7.0f} ms, total {cold[1]:7.0f} ms | "
+                  f"cold, bytecode cached {cold_bytecode[0]:7.0f} / {cold_bytecode[1]:7.0f} ms | "
+                  f"warm, {CHANGED} changed {warm[0]:7.0f} / {warm[1]:7.0f} ms | "
+                  f"templates load {loads['compiled']:.1f} ms compiled, {loads['bytecode']:.1f} ms from bytecode")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Tramming 1 moving the finished jobs of a CNC lane on to the edge banders
+with "Auto": one at a time (a POST and its confirm per job) against one bulk
+move (a POST and one confirm for them all). Requests, server time and
+SQL statements, on a line with a busy history. 12 jobs fill most of the
+default edge capacity (15).
+
+    python benchmarks/bulk.py [jobs] [history rows]
+"""
+import os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+def seed_history(path, history):
+    rnd = random.Random(47)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,datetime('now', ?))",
+                     [(rnd.randint(1000, 100000), rnd.choice(A.STAFFING_STATIONS), rnd.choice(["pending", "done"]),
+                       f"-{rnd.randint(0, 525600)} minutes") for _ in range(history)])
+    conn.commit(); conn.close()
+
+def seed_lane(path, jobs):
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM orders")
+    conn.executemany("INSERT INTO orders (id, order_number, status, current_station, finished_at) "
+                     "VALUES (?,?,'Done','cnc1',datetime('now', ?))",
+                     [(i, f"T{i}", f"-{jobs - i} minutes") for i in range(1, jobs + 1)])
+    conn.commit(); conn.close()
+
+def moved(path):
+    conn = sqlite3.connect(path)
+    n = conn.execute("SELECT COUNT(*) FROM orders WHERE current_station LIKE 'edge%'").fetchone()[0]
+    conn.close()
+    return n
+
+class Counting(A.tracing.TracedConnection):
+    executed = 0
+    def cursor(self, factory=None):
+        return super().cursor(factory or CountingCursor)
+
+class CountingCursor(A.tracing.TracedCursor):
+    def execute(self, sql, params=()):
+        Counting.executed += 1
+        return super().execute(sql, params)
+    def executemany(self, sql, seq):
+        Counting.executed += 1
+        return super().executemany(sql, seq)
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    history = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        application = A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None,
+                                    "TRACE_SLOW_MS": 0})
+        seed_history(path, history)
+        client = application.test_client()
+        client.post("/login", data={"username": "tramming1", "password": "tram123"})
+        get_db = A.get_db
+        A.get_db = lambda: sqlite3.connect(A.db_path(), factory=Counting)
+        try:
+            for label in ("one by one", "bulk"):
+                seed_lane(path, jobs)
+                Counting.executed, requests = 0, 0
+                t0 = time.perf_counter()
+                if label == "one by one":
+                    for oid in range(1, jobs + 1):
+                        for confirm in ({}, {"confirm": "1"}):
+                            r = client.post("/tramming1", data={"action": "assign", "order_id": oid, "src": "cnc1",
+                                                                "target": "auto", **confirm})
+                            requests += 1
+                else:
+                    ids = ",".join(str(i) for i in range(1, jobs + 1))
+                    for confirm in ({}, {"confirm": "1"}):
+                        r = client.post("/tramming1", data={"action": "bulk", "order_ids": ids, "src": "cnc1",
+                                                            "target": "auto", **confirm})
+                        requests += 1
+                ms = (time.perf_counter() - t0) * 1000
+                assert r.status_code == 302 and moved(path) == jobs, r.data[:300]
+                print(f"{jobs} jobs {label:10}: {requests:3} requests, {ms:7.1f} ms, {Counting.executed:4} SQL statements")
+        finally:
+            A.get_db = get_db
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+History consistency checker with 1M orders (3 history rows each): the dry-run
+check, and the repair of 0.1% stale orders and 0.1% orders without history,
+in transactions of 50,000 orders, including the refresh of the KPI counters
+and occupancy bounds. Also the longest time a station write waits on it.
+
+    python benchmarks/consistency.py [orders]
+"""
+import os, random, sqlite3, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import consistency
+
+def seed(path, orders):
+    rnd = random.Random(49)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO orders (id, order_number, status, current_station, finished_at) "
+                     "VALUES (?,?,'Done','wrapping','2026-06-01 10:00:00')",
+                     ((i, f"R{i:07}") for i in range(1, orders + 1)))
+
+    def history():
+        for i in range(1, orders + 1):
+            r = rnd.random()
+            if r < 0.001:
+                continue                        # missing
+            yield (i, "edge1", "done", "2026-06-01 08:00:00")
+            yield (i, "wrapping", "pending", "2026-06-01 09:00:00")
+            if r >= 0.002:
+                yield (i, "wrapping", "done", "2026-06-01 10:00:00")
+            # else stale: the 'done' write was lost
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)", history())
+    conn.commit(); conn.close()
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+        seed(path, orders)
+        conn = sqlite3.connect(path, timeout=30)
+
+        t0 = time.perf_counter()
+        report = consistency.check(conn.cursor())
+        print(f"{orders} orders: check {time.perf_counter() - t0:.2f} s, "
+              + ", ".join(f"{kind} {n}" for kind, (n, _) in report.items()))
+
+        # A station writing once every 10 ms while the repair runs
+        waits, stop = [], threading.Event()
+        def station():
+            w = sqlite3.connect(path, timeout=30)
+            while not stop.is_set():
+                t = time.perf_counter()
+                w.execute("BEGIN IMMEDIATE")
+                w.execute("UPDATE settings SET value=value WHERE key='lorry1_num'")
+                w.commit()
+                waits.append(time.perf_counter() - t)
+                time.sleep(0.01)
+            w.close()
+        writer = threading.Thread(target=station)
+        writer.start()
+        t0 = time.perf_counter()
+        added = consistency.repair(conn, transfers=A.TRANSFER_STATIONS)
+        spent = time.perf_counter() - t0
+        stop.set(); writer.join()
+        print(f"  repair {spent:.2f} s: {added['missing']} missing, {added['stale']} stale rows added; "
+              f"station writes waited up to {max(waits) * 1000:.0f} ms ({len(waits)} writes)")
+        t0 = time.perf_counter()
+        report = consistency.check(conn.cursor())
+        assert not report["missing"][0] and not report["stale"][0], report
+        print(f"  check after repair {time.perf_counter() - t0:.2f} s, clean")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
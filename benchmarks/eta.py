@@ -0,0 +1,51 @@
+"""
+ETA cost for a whole Manager board, plus the per-transition cost of keeping
+the online statistics up to date.
+
+    python benchmarks/eta.py [active orders]
+"""
+import os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+def main():
+    active = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rnd = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        application = A.create_app({"DB_PATH": os.path.join(tmp, "bench.db")})
+        with application.app_context():
+            conn = A.get_db(); c = conn.cursor()
+            # Orders walking the line, logged through log_many so stats build up online
+            stations = A.CNC_STATIONS + A.EDGE_STATIONS
+            c.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)",
+                          [(f"E{i}", rnd.choice(["Pending", "In progress", "Done"]), rnd.choice(stations))
+                           for i in range(active)])
+            conn.commit()
+            hops = [(A.CNC_STATIONS[0], "pending"), (A.CNC_STATIONS[0], "in_progress"), (A.CNC_STATIONS[0], "done"),
+                    (A.TRAMMING1_STATION, "pending"), (A.TRAMMING1_STATION, "done"),
+                    (A.EDGE_STATIONS[0], "pending"), (A.EDGE_STATIONS[0], "in_progress"), (A.EDGE_STATIONS[0], "done"),
+                    (A.TRAMMING2_STATION, "pending"), (A.TRAMMING2_STATION, "done"),
+                    (A.WRAPPING_STATION, "pending"), (A.WRAPPING_STATION, "in_progress"), (A.WRAPPING_STATION, "done"),
+                    (A.LOADING_STATION, "in_progress"), (A.LOADING_STATION, "done")]
+            n = 0
+            t0 = time.perf_counter()
+            for oid in range(1, 201):
+                for st, status in hops:
+                    A.log_status(oid, st, status); n += 1
+            per_log = (time.perf_counter() - t0) / n
+            print(f"log_status with online stats: {per_log * 1000:.2f} ms/transition ({n} transitions)")
+
+            c.execute(f"SELECT id, current_station, status, {A.ELAPSED_SQL} FROM orders")
+            rows = c.fetchall()
+            runs = 20
+            t0 = time.perf_counter()
+            for _ in range(runs):
+                model, clock = A.eta_model(c), A.eta_clock()
+                etas = {oid: A.order_eta(model, st, status, el, clock) for oid, st, status, el in rows}
+            per_board = (time.perf_counter() - t0) / runs
+            print(f"ETAs for {len(etas)} active orders: {per_board * 1000:.2f} ms/board")
+            conn.close()
+
+if __name__ == "__main__":
+    main()
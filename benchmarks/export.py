@@ -0,0 +1,90 @@
+"""
+Streaming export of a large order_history: peak Python memory while the
+whole export is drained, and station write latency while it runs. First
+checks that every dataset pages to the same rows as a single page does.
+
+    python benchmarks/export.py [history rows]
+"""
+import os, random, sqlite3, sys, tempfile, threading, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import export
+
+def check_paging(db_path):
+    """Every dataset's rows over pages of a few rows, against one page."""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT id FROM lorries")
+    lorries = [r[0] for r in c.fetchall()]
+    c.executemany("""
+        INSERT INTO orders (order_number, status, current_station, lorry_id, finished_at)
+        VALUES (?, 'Done', 'loading', ?, ?)
+    """, [(f"P{i}", lorries[i % len(lorries)], f"2026-10-01 08:{i:02d}:00") for i in range(23)])
+    conn.commit()
+    conn.close()
+    page_rows = export.PAGE_ROWS
+    try:
+        for dataset in export.DATASETS:
+            export.PAGE_ROWS = 10**9
+            whole = [r for rows in export.iter_rows(db_path, dataset) for r in rows]
+            export.PAGE_ROWS = 4
+            paged = [r for rows in export.iter_rows(db_path, dataset) for r in rows]
+            assert paged == whole, f"{dataset}: {len(paged)} rows over pages, {len(whole)} in one"
+    finally:
+        export.PAGE_ROWS = page_rows
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rnd = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        application = A.create_app({"DB_PATH": db_path})
+        check_paging(db_path)
+        with application.app_context():
+            conn = A.get_db()
+            stations = A.CNC_STATIONS + A.EDGE_STATIONS
+            conn.executemany(
+                "INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)",
+                ((i // 10 + 1, rnd.choice(stations), rnd.choice(["pending", "in_progress", "done"]),
+                  f"2026-{1 + i * 12 // rows:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00")
+                 for i in range(rows)))
+            conn.commit()
+            conn.close()
+
+        # Writer on its own connection, logging transitions the way stations do
+        latencies, stop = [], threading.Event()
+        def writer():
+            with application.app_context():
+                oid = 1
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    A.log_status(oid, A.CNC_STATIONS[0], "pending")
+                    latencies.append(time.perf_counter() - t0)
+                    oid += 1
+                    time.sleep(0.005)
+        t = threading.Thread(target=writer)
+        t.start()
+
+        t0 = time.perf_counter()
+        size = 0
+        for chunk in export.export_stream(db_path, "history", "csv", gzip=True):
+            size += len(chunk)
+        took = time.perf_counter() - t0
+        stop.set(); t.join()
+
+        # Second pass under tracemalloc (slow) for the memory high-water mark
+        tracemalloc.start()
+        for chunk in export.export_stream(db_path, "history", "csv", gzip=True):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies.sort()
+        print(f"history export, {rows} rows: {took:.2f} s, {size / 1e6:.1f} MB gzip csv, "
+              f"peak {peak / 1e6:.1f} MB Python memory")
+        print(f"station writes during export: {len(latencies)}, "
+              f"p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
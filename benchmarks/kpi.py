@@ -0,0 +1,66 @@
+"""
+The manager board's KPI section with 100k and 1M history rows: the COUNT(*)
+queries it used to run on every render against the one read of the KPI
+counters (all time and this week), what a transition pays to keep them, and
+a full reconciliation.
+
+    python benchmarks/kpi.py [history rows ...]
+"""
+import os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import kpi
+
+def seed(path, rows):
+    rnd = random.Random(46)
+    conn = sqlite3.connect(path)
+    orders = rows // 8
+    conn.executemany("INSERT INTO orders (id, order_number, status, current_station, lorry_id, finished_at) "
+                     "VALUES (?,?,?,?,?,datetime('now', ?))",
+                     [(i, f"K{i}", "Done", "loading", 1 + i // 12, f"-{i} minutes") for i in range(1, orders + 1)])
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,datetime('now', ?))",
+                     [(rnd.randint(1, orders), rnd.choice(A.STAFFING_STATIONS), rnd.choice(["pending", "done"]),
+                       f"-{rnd.randint(0, 525600)} minutes") for _ in range(rows)])
+    kpi.reconcile(conn.cursor())
+    conn.commit(); conn.close()
+
+def old_kpis(c):
+    c.execute("SELECT COUNT(*) FROM lorries WHERE status='closed'"); c.fetchone()
+    c.execute("SELECT COUNT(*) FROM orders WHERE current_station='loading' AND status='Done'"); c.fetchone()
+    for st in A.STAFFING_STATIONS:
+        c.execute("SELECT COUNT(*) FROM order_history WHERE station=? AND status='done'", (st,)); c.fetchone()
+    for lorry_id in (1, 2):
+        c.execute("SELECT COUNT(*) FROM orders WHERE lorry_id=? AND status='Done' AND current_station='loading'",
+                  (lorry_id,)); c.fetchone()
+
+def ms(fn, n=20):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1000
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 1000000]
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+            seed(path, rows)
+            conn = sqlite3.connect(path); c = conn.cursor()
+            before = ms(lambda: old_kpis(c), 5)
+            total = ms(lambda: kpi.read(c, "all", [1, 2]))
+            week = ms(lambda: kpi.read(c, "week", [1, 2]))
+            c.execute("BEGIN IMMEDIATE")
+            bump = ms(lambda: kpi.count_transitions(c, [(1, "loading", "done")], "loading"), 1000)
+            conn.rollback()
+            c.execute("BEGIN IMMEDIATE")
+            t0 = time.perf_counter()
+            kpi.reconcile(c)
+            reconcile = (time.perf_counter() - t0) * 1000
+            conn.rollback(); conn.close()
+            print(f"{rows:8} history rows: KPI section {before:7.1f} ms with COUNT(*)s, counters {total:.2f} ms all time, "
+                  f"{week:.2f} ms this week; {bump * 1000:.0f} us per counted transition; reconcile {reconcile:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+What a request pays for the line settings (see line_config.py): the cached
+copy's version check, against reading and applying the whole set as it
+would on every request without the cache, and how soon a second worker
+sees a save.
+
+    python benchmarks/line_config.py [saved versions]
+"""
+import os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import line_config
+import readpool
+import topology
+
+def us(fn, n=20000):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+def main():
+    versions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+        conn = sqlite3.connect(path); c = conn.cursor()
+        s = line_config.load(c)
+        current = {"capacity": s.capacity, "slots": s.slots, "lorry_capacity": s.lorry_capacity}
+        for i in range(versions):
+            line_config.save(c, line_config.update(current, {"edge1": 1 + i % 9}), "bench")
+        conn.commit()
+        routing = topology.compile(A.TOPOLOGY)
+        reader = readpool.connect(path)
+        worker1, worker2 = line_config.Cache(), line_config.Cache()
+        worker1.get(reader, path, routing); worker2.get(reader, path, routing)
+        hit = us(lambda: worker1.get(reader, path, routing))
+
+        def reload():
+            settings = line_config.load(reader.cursor())
+            topology.configure(routing, settings.capacity, settings.slots)
+        full = us(reload)
+        line_config.save(c, line_config.update(current, {"edge1": 2}), "bench")
+        conn.commit()
+        t0 = time.perf_counter()
+        settings, line = worker2.get(reader, path, routing)
+        picked_up = (time.perf_counter() - t0) * 1e6
+        assert line.stages["edge"].capacity["edge1"] == 2
+        reader.close(); conn.close()
+        print(f"{versions + 1} versions saved: version check {hit:.1f} us per request, full reload {full:.1f} us; "
+              f"another worker picked up version {settings.version} on its next request in {picked_up:.0f} us")
+
+if __name__ == "__main__":
+    main()
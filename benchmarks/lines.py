@@ -0,0 +1,82 @@
+"""
+Write throughput with one database per line: 1, 2 and 4 lines, each with
+its three CNCs starting and finishing jobs as fast as they can, one worker
+process per CNC (as under a multi-process server), against the same writers
+sharing one database file. Reports jobs/s and the time writers spent
+waiting for the write lock, then the cross-line board fanned out to every
+line.
+
+    python benchmarks/lines.py [seconds per run]
+"""
+import multiprocessing, os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import session
+
+import app as A
+
+JOBS_PER_MACHINE = 20000
+
+def seed(path):
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,'Pending',?)",
+                     [(f"{m}-{i}", m) for m in A.CNC_STATIONS for i in range(JOBS_PER_MACHINE)])
+    conn.commit(); conn.close()
+
+def writer(paths, line, machine, seconds, results, start):
+    application = A.create_app({"LINES": paths, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+    with application.test_request_context():
+        session["line"] = line
+        conn = A.get_db(); c = conn.cursor()
+        start.wait()
+        n, waited, stop = 0, 0.0, time.perf_counter() + seconds
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            waited += time.perf_counter() - t0
+            c.execute(A.routing().sql["cnc"]["first_pending"], (machine,))
+            (oid,) = c.fetchone()
+            A.start_job(c, machine, oid)
+            A.finish_job(c, machine, oid)
+            conn.commit()
+            n += 1
+        conn.close()
+        results.put((n, waited))
+
+def run(tmp, lines, shared, seconds):
+    paths = {f"line{k}": os.path.join(tmp, "shared.db" if shared else f"line{k}.db") for k in range(lines)}
+    application = A.create_app({"LINES": paths, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+    for path in sorted(set(paths.values())):
+        seed(path)
+    ctx = multiprocessing.get_context("fork")
+    results, start = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=writer, args=(paths, line, m, seconds, results, start))
+             for line in paths for m in A.CNC_STATIONS]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)     # let every worker build its app
+    start.set()
+    done = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    jobs = sum(n for n, _ in done)
+    return jobs / seconds, sum(w for _, w in done) / max(jobs, 1) * 1000, application
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    for lines in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            sharded, sharded_wait, application = run(tmp, lines, False, seconds)
+            client = application.test_client()
+            client.post("/login", data={"username": "manager", "password": "manager123"})
+            t0 = time.perf_counter()
+            client.get("/lines?q=cnc1-1")
+            board_ms = (time.perf_counter() - t0) * 1000
+        with tempfile.TemporaryDirectory() as tmp:
+            shared, shared_wait, _ = run(tmp, lines, True, seconds)
+        print(f"{lines} line(s), {lines * len(A.CNC_STATIONS):2} writers: "
+              f"database per line {sharded:5.0f} jobs/s ({sharded_wait:.2f} ms lock wait per job), "
+              f"one file {shared:5.0f} jobs/s ({shared_wait:.2f} ms); cross-line board {board_ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
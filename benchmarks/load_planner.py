@@ -0,0 +1,45 @@
+"""
+Lorry load planning: cost of a full plan and of the incremental re-plan after
+each finished wrap, and how close first-fit decreasing gets to the exact
+solver on small sets.
+
+    python benchmarks/load_planner.py
+"""
+import os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import load_planner as P
+
+ROUTES = ["north", "south", "east", "west", "city"]
+
+def random_items(rnd, n, start=0):
+    return [P.Item(start + i, rnd.uniform(2, 25), rnd.uniform(200, 6000), rnd.choice(ROUTES)) for i in range(n)]
+
+def lorries():
+    return [P.Lorry(1, 80.0, 24000.0, []), P.Lorry(2, 80.0, 24000.0, [])]
+
+def timed(f, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - t0) / n * 1000
+
+def main():
+    rnd = random.Random(11)
+    for n in (8, 20, 50, 200):
+        items = random_items(rnd, n)
+        full = timed(lambda: P.plan(items, lorries()), 50)
+        previous = P.plan(items, lorries())
+        extra = random_items(rnd, 1, start=n)
+        incremental = timed(lambda: P.plan(items + extra, lorries(), previous), 50)
+        print(f"{n:4} ready orders: full plan {full:.3f} ms, re-plan after one more wrap {incremental:.3f} ms")
+
+    placed_ffd = placed_exact = 0
+    for _ in range(200):
+        items = random_items(rnd, P.EXACT_LIMIT)
+        placed_ffd += P.score(P.greedy(items, lorries()), items, lorries())[0]
+        placed_exact += P.score(P.exact(items, lorries()), items, lorries())[0]
+    print(f"200 sets of {P.EXACT_LIMIT}: first-fit decreasing places {placed_ffd} orders, exact {placed_exact}")
+
+if __name__ == "__main__":
+    main()
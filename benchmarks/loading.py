@@ -0,0 +1,46 @@
+"""
+Loading station page on a long-running line: time to render /loading with
+years of loaded orders behind the two open lorries, and a manifest lookup by
+lorry number.
+
+    python benchmarks/loading.py [closed lorries]
+"""
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+def timed(f, n=50):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - t0) / n * 1000
+
+def main():
+    closed = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        application = A.create_app({"DB_PATH": os.path.join(tmp, "bench.db")})
+        with application.app_context():
+            conn = A.get_db()
+            # closed lorries 3.., each with a full load
+            conn.executemany("INSERT INTO lorries (number, slot, capacity, status, closed_at) "
+                             "VALUES (?, ?, ?, 'closed', CURRENT_TIMESTAMP)",
+                             [(n, 1 + n % 2, A.LORRY_CAPACITY) for n in range(3, closed + 3)])
+            conn.execute("""
+                INSERT INTO orders (order_number, status, current_station, finished_at, lorry, lorry_id)
+                SELECT 'L' || l.id || '-' || k.value, 'Done', 'loading', CURRENT_TIMESTAMP, 'Lorry ' || l.number, l.id
+                FROM lorries l, json_each('[1,2,3,4,5,6,7,8,9,10,11,12]') k WHERE l.status='closed'
+            """)
+            conn.commit()
+            loaded = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            conn.close()
+
+        client = application.test_client()
+        client.post("/login", data={"username": "loading", "password": "load123"})
+        page = timed(lambda: client.get("/loading"))
+        manifest = timed(lambda: client.get(f"/api/lorries/{closed // 2}"))
+        print(f"{closed} closed lorries, {loaded} loaded orders: /loading {page:.2f} ms, "
+              f"manifest by number {manifest:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Station occupancy queries over a year of history (about 1M rows): which
+orders were at edge3, and at any edge bander, in a 90-minute window and in
+a whole day, against a plain LEAD() over the history; and what a
+transition pays to keep the span bounds. The last few orders are finished
+at edge3 but not moved on yet, and must still show there.
+
+    python benchmarks/occupancy.py [orders]
+"""
+import os, random, sqlite3, sys, tempfile, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import occupancy
+
+START = datetime(2025, 10, 1)
+FMT = occupancy.TIME_FORMAT
+
+WAITING = 3     # last orders left in edge3's Done lane
+
+def seed(path, orders):
+    """Orders spread over a year, each through the line with 16 history rows, the last WAITING done at edge3."""
+    rnd = random.Random(48)
+    conn = sqlite3.connect(path)
+    rows, history = [], []
+    for i in range(1, orders + 1):
+        t = START + timedelta(minutes=525600 * i / orders)
+        waiting = i > orders - WAITING
+        cnc, edge = rnd.choice(A.CNC_STATIONS), "edge3" if waiting else rnd.choice(A.EDGE_STATIONS)
+        # Finishing a machine job hands it to the transfer in the same instant, as finish_job() logs it
+        steps = [("preparing", "done"), (cnc, "pending"), (cnc, "in_progress"), (cnc, "done"),
+                 ("tramming1", "pending"), ("tramming1", "done"), (edge, "pending"), (edge, "in_progress"),
+                 (edge, "done"), ("tramming2", "pending"), ("tramming2", "done"), ("wrapping", "pending"),
+                 ("wrapping", "in_progress"), ("wrapping", "done"), ("loading", "in_progress"), ("loading", "done")]
+        for station, status in steps[:10] if waiting else steps:
+            if not (station in A.TRANSFER_STATIONS and status == "pending"):
+                t += timedelta(minutes=rnd.expovariate(1 / 20))
+            history.append((i, station, status, t.strftime(FMT)))
+        rows.append((i, f"Y{i:06}", "Done", "edge3" if waiting else "loading"))
+    conn.executemany("INSERT INTO orders (id, order_number, status, current_station) VALUES (?,?,?,?)", rows)
+    conn.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)", history)
+    conn.commit(); conn.close()
+    return len(history)
+
+def lead_scan(c, stations, t1, t2):
+    """The same spans from a window over the whole history, a hand-off to a transfer not ending one."""
+    marks = ",".join("?" * len(stations))
+    transfers = ",".join("?" * len(A.TRANSFER_STATIONS))
+    c.execute(f"""
+        SELECT * FROM (SELECT order_id, station, status, changed_at,
+                              CASE WHEN LEAD(moves) OVER w THEN LEAD(changed_at) OVER w
+                                   ELSE LEAD(changed_at, 2) OVER w END AS ended_at
+                       FROM (SELECT h.*, NOT (status = 'pending' AND station IN ({transfers})) AS moves
+                             FROM order_history h)
+                       WINDOW w AS (PARTITION BY order_id ORDER BY id))
+        WHERE station IN ({marks}) AND changed_at <= ? AND (ended_at IS NULL OR ended_at >= ?)
+    """, (*A.TRANSFER_STATIONS, *stations, t2, t1))
+    return c.fetchall()
+
+def ms(fn, n=20):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        result = fn()
+    return (time.perf_counter() - t0) / n * 1000, result
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 72000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+        rows = seed(path, orders)
+        conn = sqlite3.connect(path); c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        t0 = time.perf_counter()
+        occupancy.rebuild(c, A.TRANSFER_STATIONS)
+        conn.commit()
+        print(f"{rows} history rows, bounds rebuilt in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        day = START + timedelta(days=200)
+        for label, stations in (("edge3", ["edge3"]), ("edge group", A.AREA_GROUPS["edge"])):
+            for window, (t1, t2) in (("90 min", (day.replace(hour=10), day.replace(hour=11, minute=30))),
+                                      ("1 day", (day, day + timedelta(days=1)))):
+                t1, t2 = t1.strftime(FMT), t2.strftime(FMT)
+                spent, spans = ms(lambda: occupancy.query(c, stations, t1, t2, transfers=A.TRANSFER_STATIONS))
+                scan, rows_scan = ms(lambda: lead_scan(c, stations, t1, t2), 1)
+                assert len(spans) == len(rows_scan), (len(spans), len(rows_scan))
+                print(f"  {label:10} {window:6}: {len(spans):4} spans in {spent:6.2f} ms "
+                      f"(LEAD over the history: {scan:6.0f} ms)")
+
+        # Finished at edge3 a while ago and still in its Done lane
+        later = (START + timedelta(days=400)).strftime(FMT)
+        spans = occupancy.query(c, ["edge3"], later, later, transfers=A.TRANSFER_STATIONS)
+        waiting = [s.order_id for s in spans if s.status == "done" and s.ended_at is None]
+        assert waiting == list(range(orders - WAITING + 1, orders + 1)), spans
+
+        c.execute("BEGIN IMMEDIATE")
+        oids = [random.randint(1, orders) for _ in range(2000)]
+        spent, _ = ms(lambda: [occupancy.extend(c, [(oid, "edge1", "pending")], transfers=A.TRANSFER_STATIONS)
+                               for oid in oids], 1)
+        conn.rollback(); conn.close()
+        print(f"  extend(): {spent / len(oids) * 1000:.0f} us per transition")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Outbox dispatcher against a local stub ERP webhook that fails a share of
+requests: delivery throughput, lag from enqueue to delivery, and a check
+that every message arrived at least once.
+
+    python benchmarks/outbox.py [messages] [failure rate] [enqueues per second]
+"""
+import json, os, random, sqlite3, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import outbox
+
+def stub_server(failure_rate):
+    received = []
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if random.random() < failure_rate:
+                self.send_response(503); self.end_headers()
+                return
+            received.extend(json.loads(body)["messages"])
+            self.send_response(204); self.end_headers()
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    failure_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 2000.0
+    random.seed(5)
+    outbox.BASE_BACKOFF, outbox.MAX_BACKOFF = 0.05, 1.0   # keep retries short for the run
+    server, received = stub_server(failure_rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": db_path})
+        dispatcher = outbox.Dispatcher(db_path, outbox.WebhookSink(f"http://127.0.0.1:{server.server_port}/erp"),
+                                       poll_seconds=0.05).start()
+
+        # Producer: station transactions at a steady rate
+        conn = sqlite3.connect(db_path)
+        t0 = time.perf_counter()
+        for i in range(total):
+            ahead = t0 + i / rate - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            outbox.enqueue(c, "cnc_finished", f"cnc_finished:{i}", {"order_id": i})
+            conn.commit()
+        enqueue_s = time.perf_counter() - t0
+        while outbox.stats(conn)["pending"]:
+            time.sleep(0.05)
+        took = time.perf_counter() - t0
+        dispatcher.stop()
+
+        lags = sorted(dispatcher.lags)
+        keys = {m["key"] for m in received}
+        print(f"enqueued {total} at {total / enqueue_s:,.0f}/s")
+        print(f"delivered {total} messages in {took:.2f} s ({total / took:,.0f}/s), "
+              f"{dispatcher.failures} failed batches retried ({failure_rate:.0%} stub failures)")
+        print(f"lag p50 {lags[len(lags) // 2] * 1000:.0f} ms, p99 {lags[int(len(lags) * 0.99)] * 1000:.0f} ms "
+              f"(last {len(lags)} messages)")
+        print(f"all delivered: {len(keys) == total}, duplicates seen by the ERP: {len(received) - len(keys)}")
+        conn.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare queue disciplines on one machine lane.
+
+The same random job stream (arrivals, processing times, estimates, due dates,
+priorities) is replayed under each policy in queue_policy.QUEUE_POLICIES,
+using the same sort keys the station routes use in SQL. Reports tardiness,
+late share, flow time and jobs finished inside the shift window.
+
+    python benchmarks/queue_policy.py [jobs] [seed]
+"""
+import os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from queue_policy import QUEUE_POLICIES, sort_key
+
+SHIFT_MINUTES = 8 * 60
+
+def make_jobs(n, seed):
+    rnd = random.Random(seed)
+    jobs, t = [], 0.0
+    for i in range(n):
+        t += rnd.expovariate(1 / 11.0)             # ~11 min between arrivals
+        proc = rnd.lognormvariate(2.2, 0.5)         # ~10 min median, long tail
+        prio = rnd.choices([0, 1, 2], weights=[70, 20, 10])[0]
+        slack = rnd.uniform(20, 240) / (1 + prio)   # rush orders are due sooner
+        jobs.append({
+            "id": i,
+            "queued_at": t,
+            "proc": proc,
+            "est_minutes": proc * rnd.uniform(0.8, 1.2),
+            "priority": prio,
+            "due_at": t + proc + slack,
+        })
+    return jobs
+
+def simulate(jobs, policy):
+    key = sort_key(policy)
+    queue, done = [], []
+    clock, i = 0.0, 0
+    while i < len(jobs) or queue:
+        if not queue and jobs[i]["queued_at"] > clock:
+            clock = jobs[i]["queued_at"]
+        while i < len(jobs) and jobs[i]["queued_at"] <= clock:
+            queue.append(jobs[i]); i += 1
+        job = min(queue, key=key)
+        queue.remove(job)
+        clock += job["proc"]
+        done.append((job, clock))
+    return done
+
+def summarize(done):
+    tard = [max(0.0, end - j["due_at"]) for j, end in done]
+    rush = [max(0.0, end - j["due_at"]) for j, end in done if j["priority"] == 2]
+    flow = [end - j["queued_at"] for j, end in done]
+    horizon = (done[-1][1] // SHIFT_MINUTES) * SHIFT_MINUTES or done[-1][1]
+    shifts = horizon / SHIFT_MINUTES
+    in_window = sum(1 for _, end in done if end <= horizon)
+    return {
+        "mean_tardiness": sum(tard) / len(tard),
+        "late_pct": 100.0 * sum(1 for x in tard if x > 0) / len(tard),
+        "rush_tardiness": (sum(rush) / len(rush)) if rush else 0.0,
+        "mean_flow": sum(flow) / len(flow),
+        "per_shift": in_window / shifts if shifts else float(in_window),
+    }
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+    jobs = make_jobs(n, seed)
+    print(f"{n} jobs, one machine, ~93% utilisation, seed {seed}")
+    print(f"{'policy':<10}{'mean tard':>11}{'late %':>9}{'rush tard':>11}{'mean flow':>11}{'jobs/shift':>12}{'sim ms':>9}")
+    for policy in QUEUE_POLICIES:
+        t0 = time.perf_counter()
+        r = summarize(simulate(jobs, policy))
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"{policy:<10}{r['mean_tardiness']:>11.1f}{r['late_pct']:>9.1f}{r['rush_tardiness']:>11.1f}"
+              f"{r['mean_flow']:>11.1f}{r['per_shift']:>12.1f}{ms:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Station click latency while manager boards are being rendered: one station
+process starting and finishing CNC jobs at a steady rate, with 0 or 3 worker
+processes rendering /manager back to back on a line of 5,000 orders, the
+boards first on ordinary read-write connections, then on the read-only
+pool. Reports click latency and the part of it spent waiting for the write
+lock, and boards per second.
+
+    python benchmarks/readwrite.py [seconds per run]
+"""
+import multiprocessing, os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as A
+
+ORDERS = 5000
+CLICK_JOBS = 2000       # of them waiting at cnc1 for the station
+BOARD_WORKERS = 3
+CLICK_EVERY = 0.02      # seconds between station clicks
+
+def seed(path):
+    rnd = random.Random(43)
+    conn = sqlite3.connect(path)
+    lanes = [(m, st) for m in A.CNC_STATIONS + A.EDGE_STATIONS for st in ("Pending", "In progress", "Done")]
+    conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)",
+                     [(f"R{i}", *reversed(rnd.choice(lanes))) for i in range(ORDERS - CLICK_JOBS)])
+    conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,'Pending','cnc1')",
+                     [(f"C{i}",) for i in range(CLICK_JOBS)])
+    conn.execute("""
+        INSERT INTO order_history (order_id, station, status)
+        SELECT id, current_station, lower(replace(status, ' ', '_')) FROM orders
+    """)
+    conn.commit(); conn.close()
+
+def station(path, seconds, results, start):
+    application = A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+    with application.test_request_context():
+        conn = A.get_db(); c = conn.cursor()
+        start.wait()
+        clicks, waits, stop = [], [], time.perf_counter() + seconds
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            waits.append(time.perf_counter() - t0)
+            c.execute(A.routing().sql["cnc"]["first_pending"], ("cnc1",))
+            (oid,) = c.fetchone()
+            A.start_job(c, "cnc1", oid)
+            A.finish_job(c, "cnc1", oid)
+            conn.commit()
+            clicks.append(time.perf_counter() - t0)
+            time.sleep(CLICK_EVERY)
+        conn.close()
+        results.put(("station", clicks, waits))
+
+def boards(path, seconds, read_only, results, start):
+    if not read_only:
+        A.get_read_db = A.get_db        # the board as it was: read-write connections
+    client = A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None}).test_client()
+    client.post("/login", data={"username": "manager", "password": "manager123"})
+    start.wait()
+    n, stop = 0, time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        assert client.get("/manager").status_code == 200
+        n += 1
+    results.put(("boards", n, None))
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1000 if xs else 0.0
+
+def run(path, seconds, workers, read_only):
+    ctx = multiprocessing.get_context("fork")
+    results, start = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=station, args=(path, seconds, results, start))]
+    procs += [ctx.Process(target=boards, args=(path, seconds, read_only, results, start)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)     # let every worker build its app
+    start.set()
+    done = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    _, clicks, waits = next(r for r in done if r[0] == "station")
+    rendered = sum(r[1] for r in done if r[0] == "boards")
+    return clicks, waits, rendered / seconds
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": path, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+        seed(path)
+        for label, workers, read_only in [("no boards", 0, True),
+                                          ("boards on read-write connections", BOARD_WORKERS, False),
+                                          ("boards on the read-only pool", BOARD_WORKERS, True)]:
+            clicks, waits, per_s = run(path, seconds, workers, read_only)
+            print(f"{label:33} clicks p50 {pct(clicks, 0.5):6.2f} ms, p99 {pct(clicks, 0.99):6.2f} ms, "
+                  f"lock wait p99 {pct(waits, 0.99):5.2f} ms, max {max(waits) * 1000:5.2f} ms; "
+                  f"{per_s:5.1f} boards/s")
+
+if __name__ == "__main__":
+    main()
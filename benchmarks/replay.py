@@ -0,0 +1,64 @@
+"""
+Event store replay speed: rebuilding the orders projection from zero and
+from a snapshot, in events per second.
+
+    python benchmarks/replay.py [events]
+"""
+import json, os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import events
+
+HOPS = [("cnc1", "Pending", "created"), ("cnc1", "In progress", "started"), ("cnc1", "Done", "finished"),
+        ("edge2", "Pending", "queued"), ("edge2", "In progress", "started"), ("edge2", "Done", "finished"),
+        ("wrapping", "Pending", "queued"), ("wrapping", "In progress", "started"), ("wrapping", "Done", "finished"),
+        ("loading", "In progress", "started"), ("loading", "Done", "finished")]
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    orders = total // len(HOPS)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": db_path})
+        conn = sqlite3.connect(db_path)
+
+        def generate():
+            for oid in range(1, orders + 1):
+                row = dict.fromkeys(events.ORDER_COLUMNS)
+                row.update(id=oid, order_number=f"B{oid}", priority=0, queued_at="2026-10-01 06:00:00")
+                for station, status, kind in HOPS:
+                    row.update(current_station=station, status=status)
+                    if station == "loading":
+                        row.update(lorry=f"Lorry {oid // 12}")
+                    yield (oid, kind, station, "bench",
+                           json.dumps({"row": row, "history": [[station, status.lower()]]}))
+        conn.executemany("INSERT INTO order_events (order_id, kind, station, actor, payload) VALUES (?,?,?,?,?)",
+                         generate())
+        conn.commit()
+        n = conn.execute("SELECT COUNT(*) FROM order_events").fetchone()[0]
+
+        t0 = time.perf_counter()
+        state, _ = events.replay(conn.cursor(), from_zero=True)
+        took = time.perf_counter() - t0
+        print(f"replay from zero: {n} events, {len(state)} orders in {took:.2f} s ({n / took:,.0f} events/s)")
+
+        t0 = time.perf_counter()
+        print(f"rebuild orders from zero: {events.rebuild(conn)} orders in {time.perf_counter() - t0:.2f} s")
+
+        # Snapshot near the end, then replay only the tail
+        t0 = time.perf_counter()
+        seq = events.snapshot(conn)
+        print(f"snapshot of {len(state)} orders: {time.perf_counter() - t0:.2f} s")
+        tail = events.SNAPSHOT_EVERY
+        conn.executemany("INSERT INTO order_events (order_id, kind, station, actor, payload) VALUES (?,?,?,?,?)",
+                         (e for i, e in zip(range(tail), generate())))
+        conn.commit()
+        t0 = time.perf_counter()
+        state, last = events.replay(conn.cursor())
+        took = time.perf_counter() - t0
+        print(f"replay from snapshot at {seq} + {last - seq} events: {took:.2f} s")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
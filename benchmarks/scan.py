@@ -0,0 +1,56 @@
+"""
+Barcode scan fast path: server time per scan request on a busy line, for
+single scans and for bursts sent together.
+
+    python benchmarks/scan.py [orders on the line]
+"""
+import os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main():
+    active = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        application = A.create_app({"DB_PATH": os.path.join(tmp, "bench.db")})
+        with application.app_context():
+            conn = A.get_db()
+            stations = A.CNC_STATIONS + A.EDGE_STATIONS
+            conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)",
+                             [(f"L{i}", rnd.choice(["Pending", "Done"]), rnd.choice(stations)) for i in range(active)])
+            # cnc1's own lane, started and finished by scanning
+            conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,'Pending','cnc1')",
+                             [(f"S{i}",) for i in range(1000)])
+            conn.execute("DELETE FROM orders WHERE current_station='cnc1' AND order_number LIKE 'L%'")
+            conn.commit(); conn.close()
+
+        client = application.test_client()
+        client.post("/login", data={"username": "cnc1", "password": "cnc123"})
+
+        server, wall = [], []
+        for i in range(400):
+            for _ in range(2):      # start, then finish
+                t0 = time.perf_counter()
+                r = client.post("/scan", json={"order_numbers": [f"S{i}"]})
+                wall.append((time.perf_counter() - t0) * 1000)
+                assert r.json["results"][0]["ok"], r.json
+                server.append(r.json["ms"])
+        print(f"single scans ({len(server)}): server p50 {pct(server, .5):.2f} ms, p99 {pct(server, .99):.2f} ms; "
+              f"with Flask p50 {pct(wall, .5):.2f} ms, p99 {pct(wall, .99):.2f} ms")
+
+        # Burst: 10 scans in one request (start + finish of five jobs)
+        burst = []
+        for i in range(400, 600, 5):
+            nums = [n for k in range(i, i + 5) for n in (f"S{k}", f"S{k}")]
+            r = client.post("/scan", json={"order_numbers": nums})
+            assert all(x["ok"] for x in r.json["results"]), r.json
+            burst.append(r.json["ms"])
+        print(f"bursts of 10 scans ({len(burst)}): server p50 {pct(burst, .5):.2f} ms, p99 {pct(burst, .99):.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Weekly staffing optimiser at plant scale and at 100 employees x 50 stations.
+
+"week" solves all five days (two passes), "one cell" re-solves the single
+day touched by a changed pin or absence.
+
+    python benchmarks/staffing.py
+"""
+import os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from staffing_solver import StaffingProblem, hungarian
+
+DAYS = ["mon", "tue", "wed", "thu", "fri"]
+
+def random_problem(n_emp, n_st, seed):
+    rnd = random.Random(seed)
+    employees = [f"e{i}" for i in range(n_emp)]
+    stations = [f"s{i}" for i in range(n_st)]
+    training = {e: {s: rnd.choices(["full", "partial", "not_trained"], weights=[25, 25, 50])[0]
+                    for s in stations} for e in employees}
+    absent = {(e, d) for e in employees for d in DAYS if rnd.random() < 0.05}
+    return StaffingProblem(stations, employees, DAYS, training, absent=absent)
+
+def timed(fn, runs):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        out = fn()
+    return (time.perf_counter() - t0) / runs * 1000, out
+
+def check_optimal(seed=3, n=7):
+    """Hungarian vs brute force on small random matrices."""
+    from itertools import permutations
+    rnd = random.Random(seed)
+    for _ in range(50):
+        cost = [[rnd.randint(0, 20) for _ in range(n)] for _ in range(n - 2)]
+        best = min(sum(cost[i][p[i]] for i in range(len(cost))) for p in permutations(range(n), len(cost)))
+        match = hungarian(cost)
+        assert len(set(match)) == len(match)
+        assert sum(cost[i][match[i]] for i in range(len(cost))) == best
+    print("hungarian matches brute force on 50 random 5x7 problems")
+
+def main():
+    check_optimal()
+    for n_emp, n_st in [(10, 13), (100, 50)]:
+        prob = random_problem(n_emp, n_st, 1)
+        ms_week, plan = timed(prob.solve_week, 5)
+        prob.pins[(prob.stations[0], "wed")] = prob.employees[0]
+        prob.absent.add((prob.employees[1], "wed"))
+        ms_day, _ = timed(lambda: prob.resolve_day(plan, "wed"), 20)
+        full, partial, empty = prob.score(plan)
+        print(f"{n_emp:>3} employees x {n_st:>2} stations: week {ms_week:7.1f} ms, one cell {ms_day:6.1f} ms "
+              f"| full {full}, partial {partial}, empty {empty}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Worker boot time: import app.py and build an app with create_app().
+
+Each measurement runs in a fresh interpreter so nothing is cached.
+"first boot" starts from an empty database (schema + seeding, hashes every
+distinct demo password once), "warm boot" is every later worker start.
+
+    python benchmarks/startup.py
+"""
+import os, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+BOOT = (
+    "import time; t0 = time.perf_counter()\n"
+    "import app\n"
+    "t1 = time.perf_counter()\n"
+    "app.create_app({'DB_PATH': %r})\n"
+    "t2 = time.perf_counter()\n"
+    "print(t1 - t0, t2 - t1)\n"
+)
+
+def boot(db_path):
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", BOOT % db_path], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - t0
+    imp, factory = (float(x) for x in out.split())
+    return total, imp, factory
+
+def report(name, rows):
+    rows.sort()
+    total, imp, factory = rows[len(rows) // 2]
+    print(f"{name:<12} process {total*1000:7.1f} ms | import {imp*1000:6.1f} ms | create_app {factory*1000:7.1f} ms")
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        first = []
+        for i in range(RUNS):
+            first.append(boot(os.path.join(tmp, f"first{i}.db")))
+        db_path = os.path.join(tmp, "warm.db")
+        boot(db_path)
+        warm = [boot(db_path) for _ in range(RUNS)]
+    print(f"median of {RUNS} cold interpreter starts")
+    report("first boot", first)
+    report("warm boot", warm)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Stuck-order scan on a busy line: time per scan with 100k active orders, of
+which a few hundred are over their lane's threshold.
+
+    python benchmarks/stuck.py [active orders]
+"""
+import os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import stuck
+
+def main():
+    active = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rnd = random.Random(9)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        A.create_app({"DB_PATH": db, "STUCK_SCAN_SECONDS": 0})
+        conn = sqlite3.connect(db)
+        lanes = [(st, status) for st, status, _, _ in A.STUCK_LANES]
+        rows = []
+        for i in range(active):
+            station, status = rnd.choice(lanes)
+            # mostly recent, 0.3% far over any threshold
+            minutes = rnd.uniform(0, 10) if rnd.random() > 0.003 else rnd.uniform(300, 3000)
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - minutes * 60))
+            rows.append((f"B{i}", status, station, ts, ts, ts))
+        conn.executemany("INSERT INTO orders (order_number, status, current_station, queued_at, started_at, finished_at) "
+                         "VALUES (?,?,?,?,?,?)", rows)
+        conn.commit()
+
+        times = []
+        for i in range(20):
+            t0 = time.perf_counter()
+            new, resolved, _ = stuck.scan(conn, A.STUCK_LANES)
+            times.append((time.perf_counter() - t0) * 1000)
+            if i == 0:
+                print(f"{active} active orders: first scan raised {new} alerts in {times[0]:.1f} ms")
+        times = sorted(times[1:])
+        print(f"steady scans: median {times[len(times) // 2]:.1f} ms, max {times[-1]:.1f} ms")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
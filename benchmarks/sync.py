@@ -0,0 +1,52 @@
+"""
+Offline sync: server time to apply a station's queued actions in one /sync
+request, for batches of a few hundred start/finish taps on a busy line.
+
+    python benchmarks/sync.py [orders on the line]
+"""
+import os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+
+def main():
+    active = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        application = A.create_app({"DB_PATH": os.path.join(tmp, "bench.db")})
+        with application.app_context():
+            conn = A.get_db()
+            stations = A.CNC_STATIONS + A.EDGE_STATIONS
+            conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)",
+                             [(f"L{i}", rnd.choice(["Pending", "Done"]), rnd.choice(stations)) for i in range(active)])
+            conn.execute("DELETE FROM orders WHERE current_station='cnc1'")
+            conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,'Pending','cnc1')",
+                             [(f"S{i}",) for i in range(2000)])
+            conn.commit()
+            lane = [r[0] for r in conn.execute("SELECT id FROM orders WHERE current_station='cnc1' ORDER BY id")]
+            conn.close()
+
+        client = application.test_client()
+        client.post("/login", data={"username": "cnc1", "password": "cnc123"})
+
+        start = 0
+        for size in (50, 200, 500, 900):
+            oids = lane[start:start + size // 2]
+            start += len(oids)
+            now = time.time() * 1000
+            actions = []
+            for k, oid in enumerate(oids):   # start then finish each job, 20 s apart
+                at = now - (len(oids) - k) * 40000
+                actions.append({"id": f"{oid}s", "at": at, "fields": {"action": "start", "order_id": str(oid)}})
+                actions.append({"id": f"{oid}f", "at": at + 20000, "fields": {"action": "finish", "order_id": str(oid)}})
+            # a few taps a colleague already did online
+            actions += [dict(a, id=a["id"] + "again") for a in actions[:size // 20]]
+            t0 = time.perf_counter()
+            r = client.post("/sync", json={"sent_at": now, "actions": actions})
+            wall = (time.perf_counter() - t0) * 1000
+            assert r.json["conflict"] == 0, r.json
+            print(f"{len(actions):5} actions: server {r.json['ms']:7.1f} ms ({r.json['ms'] / len(actions):.2f} ms each), "
+                  f"with Flask {wall:7.1f} ms; applied {r.json['applied']}, already {r.json['already']}")
+
+if __name__ == "__main__":
+    main()
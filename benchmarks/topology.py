@@ -0,0 +1,96 @@
+"""
+Station engine overhead: what a request spends finding its stage and SQL,
+the old way (the home() if-chain, lane_order() and an f-string per query)
+against the compiled routing table, for the line as configured and for one
+with 4x the machines; then whole station page requests through the Flask
+test client on a line with 2,000 orders.
+
+    python benchmarks/topology.py [orders]
+"""
+import copy, os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A
+import topology
+from queue_policy import DEFAULT_POLICY, order_by
+
+def per_call_us(fn, args, n=20000):
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(args[i % len(args)])
+    return (time.perf_counter() - t0) / n * 1e6
+
+def old_dispatch(cnc, edge):
+    # what the copied views did per request: the if-chain, then lane_order() and an f-string
+    def handle(area):
+        if area == A.MANAGER_AREA:        return None
+        if area == A.PREPARING_STATION:   return None
+        if area in cnc:                   group = "cnc"
+        elif area == A.TRAMMING1_STATION: group = "tramming1"
+        elif area in edge:                group = "edge"
+        elif area == A.TRAMMING2_STATION: group = "tramming2"
+        else:                             return None
+        return f"""
+            SELECT id, order_number, datetime(queued_at,'localtime'),
+                   priority, datetime(due_at,'localtime')
+            FROM orders
+            WHERE current_station=? AND status='Pending'
+            ORDER BY {order_by(A.DEFAULT_CONFIG["QUEUE_POLICY"].get(group, DEFAULT_POLICY))}
+        """
+    return handle
+
+def new_dispatch(routing):
+    def handle(area):
+        stage = routing.by_station.get(area)
+        return stage and routing.sql[stage.name].get("pending")
+    return handle
+
+def scaled(factor):
+    topo = copy.deepcopy(A.TOPOLOGY)
+    for spec in topo:
+        if spec["kind"] == "machine":
+            base = list(spec["stations"])
+            spec["stations"] = [f"{s}_{k}" if k else s for k in range(factor) for s in base]
+            cap = spec["capacity"]
+            spec["capacity"] = {s: (cap if isinstance(cap, int) else cap[s.split("_")[0]]) for s in spec["stations"]}
+    return topo
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for factor in (1, 4):
+        topo = scaled(factor)
+        t0 = time.perf_counter()
+        routing = topology.compile(topo)
+        compile_ms = (time.perf_counter() - t0) * 1000
+        stations = [s for spec in topo for s in spec.get("stations", [spec["name"]])]
+        cnc = next(s for s in topo if s["name"] == "cnc")["stations"]
+        edge = next(s for s in topo if s["name"] == "edge")["stations"]
+        old = per_call_us(old_dispatch(cnc, edge), stations)
+        new = per_call_us(new_dispatch(routing), stations)
+        print(f"{len(stations):3} stations: compile {compile_ms:.2f} ms once, "
+              f"dispatch + SQL per request {old:.2f} us before vs. {new:.2f} us compiled")
+
+    rnd = random.Random(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        app = A.create_app({"DB_PATH": db, "STUCK_SCAN_SECONDS": 0})
+        conn = sqlite3.connect(db)
+        lanes = [(m, st) for m in A.CNC_STATIONS + A.EDGE_STATIONS for st in ("Pending", "In progress", "Done")]
+        conn.executemany("INSERT INTO orders (order_number, status, current_station) VALUES (?,?,?)",
+                         [(f"T{i}", *reversed(rnd.choice(lanes))) for i in range(orders)])
+        conn.commit(); conn.close()
+        for user, password, path in [("cnc1", "cnc123", "/cnc"), ("edge2", "edge123", "/edge"),
+                                     ("tramming1", "tram123", "/tramming1"), ("tramming2", "tram123", "/tramming2")]:
+            client = app.test_client()
+            client.post("/login", data={"username": user, "password": password})
+            client.get(path)
+            times = []
+            for _ in range(50):
+                t0 = time.perf_counter()
+                client.get(path)
+                times.append((time.perf_counter() - t0) * 1000)
+            times.sort()
+            print(f"GET {path:11} median {times[len(times) // 2]:.2f} ms, p90 {times[int(len(times) * 0.9)]:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Consistency of order_history with orders.
+
+orders is the projection of the event store (see events.py), so it is taken
+as right and order_history is checked against it:
+
+    missing     orders with no history row at all (imported before history
+                was kept)
+    stale       orders whose latest history row (highest id) is not their
+                current station and status, e.g. a transition whose history
+                write was lost
+    orphaned    history rows of orders that don't exist (reported only)
+    unplaced    orders without a current station (reported only)
+
+Every check is one SQL statement per range of BATCH_ORDERS order ids: the
+latest row is a seek on idx_history_order, the rest are anti-joins. repair()
+appends one history row per missing or stale order with the order's state,
+dated from its own queued/started/finished time but never before its last
+row, and counts it into the KPI counters and occupancy bounds the way a live
+transition would. Ranges are checked without a lock and repaired in one
+short transaction each, so station writes are not held up.
+
+    python consistency.py check [--repair] [--batch N]
+"""
+import argparse, json, os, sqlite3
+
+import kpi
+import occupancy
+
+BATCH_ORDERS = 50000    # orders per statement (and per repair transaction)
+SAMPLES = 20            # order numbers / ids listed per problem
+KINDS = ("missing", "stale", "orphaned", "unplaced")
+REPAIRED = ("missing", "stale")
+
+# Orders (by id range or list) whose latest history row is not their current state:
+# kind, order id, number, and the row that would say where they are
+# (station, status, changed_at)
+_DRIFT = """
+    SELECT CASE WHEN h.id IS NULL THEN 'missing' ELSE 'stale' END,
+           o.id, o.order_number, o.current_station, lower(replace(o.status, ' ', '_')),
+           max(COALESCE(CASE o.status WHEN 'Pending' THEN o.queued_at
+                                      WHEN 'In progress' THEN o.started_at
+                                      ELSE o.finished_at END, CURRENT_TIMESTAMP),
+               COALESCE(h.changed_at, ''))
+    FROM orders o
+    LEFT JOIN order_history h ON h.id = (SELECT MAX(id) FROM order_history WHERE order_id = o.id)
+    WHERE {orders} AND o.current_station IS NOT NULL
+      AND (h.id IS NULL OR h.station IS NOT o.current_station
+           OR h.status IS NOT lower(replace(o.status, ' ', '_')))
+"""
+
+def _ranges(c, batch):
+    c.execute("SELECT MIN(id), MAX(id) FROM orders")
+    lo, hi = c.fetchone()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, batch):
+        yield start, start + batch - 1
+
+def check(c, batch=BATCH_ORDERS, samples=SAMPLES):
+    """The dry-run report: {kind: (count, [examples])}, examples as order numbers (ids for orphaned rows)."""
+    report = {kind: [0, []] for kind in KINDS}
+
+    def add(kind, examples):
+        report[kind][0] += len(examples)
+        report[kind][1].extend(examples[:samples - len(report[kind][1])])
+
+    for lo, hi in _ranges(c, batch):
+        c.execute(_DRIFT.format(orders="o.id BETWEEN ? AND ?"), (lo, hi))
+        rows = c.fetchall()
+        for kind in REPAIRED:
+            add(kind, [r[2] for r in rows if r[0] == kind])
+    c.execute("""
+        SELECT order_id FROM (SELECT DISTINCT order_id FROM order_history) h
+        WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = h.order_id)
+    """)
+    add("orphaned", [r[0] for r in c.fetchall()])
+    c.execute("SELECT order_number FROM orders WHERE current_station IS NULL")
+    add("unplaced", [r[0] for r in c.fetchall()])
+    return {kind: tuple(v) for kind, v in report.items()}
+
+def repair(conn, batch=BATCH_ORDERS, transfers=()):
+    """
+    Appends the missing history rows and what is derived from them (KPI
+    counters, occupancy bounds). Each range of order ids is checked without
+    a lock; only one with problems takes the write lock, re-checks those
+    orders and repairs them in one transaction. transfers: the transfer
+    stations, see occupancy.py. Returns {kind: rows added}.
+    """
+    c = conn.cursor()
+    added = {kind: 0 for kind in REPAIRED}
+    for lo, hi in _ranges(c, batch):
+        c.execute(_DRIFT.format(orders="o.id BETWEEN ? AND ?"), (lo, hi))
+        ids = [r[1] for r in c.fetchall()]
+        if not ids:
+            continue
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(_DRIFT.format(orders="o.id IN (SELECT value FROM json_each(?))"), (json.dumps(ids),))
+        rows = c.fetchall()
+        c.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM order_history")
+        first = c.fetchone()[0]
+        c.executemany("INSERT INTO order_history (order_id, station, status, changed_at) VALUES (?,?,?,?)",
+                      [r[1:2] + r[3:] for r in rows])
+        occupancy.extend_since(c, first, transfers)
+        kpi.bump_many(c, "done", [(r[3], r[5]) for r in rows if r[4] == "done"])
+        conn.commit()
+        for r in rows:
+            added[r[0]] += 1
+    return added
+
+def main():
+    p = argparse.ArgumentParser(description="order_history against orders")
+    p.add_argument("command", choices=["check"])
+    p.add_argument("--repair", action="store_true", help="add the missing history rows (default: report only)")
+    p.add_argument("--batch", type=int, default=BATCH_ORDERS, help="orders per transaction")
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    a = p.parse_args()
+    conn = sqlite3.connect(a.db, timeout=30)
+    for kind, (count, examples) in check(conn.cursor(), a.batch).items():
+        print(f"  {kind:9} {count:8}" + (f"  e.g. {', '.join(map(str, examples))}" if examples else ""))
+    if a.repair:
+        from app import TRANSFER_STATIONS
+        added = repair(conn, a.batch, TRANSFER_STATIONS)
+        print(f"{sum(added.values())} history row(s) added: {added['missing']} missing, {added['stale']} stale")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Online cycle-time and queue-wait statistics, and ETAs built from them.
+
+Each station keeps one stat per metric ("wait": pending -> in progress, or
+pending -> done at the tramming stations; "cycle": in progress -> done).
+A stat is a small JSON-able dict updated one sample at a time:
+
+- count, mean and M2 with Welford's algorithm (variance = M2 / (n - 1))
+- p50 and p90 with the P-square streaming quantile estimator
+  (Jain & Chlamtac, 1985), five markers per quantile, no samples kept
+
+app.py updates them in the same transaction that logs a transition, so
+nothing ever rescans order_history.
+"""
+
+QUANTILES = (0.5, 0.9)
+
+# A machine's own stats are used once it has this many samples,
+# before that the whole group's (e.g. "cnc" for cnc2)
+MIN_SAMPLES = 5
+
+# ----- P-square quantile sketch -----
+def p2_new(p):
+    return {"p": p, "q": [], "n": [0, 1, 2, 3, 4],
+            "np": [0, 2 * p, 4 * p, 2 + 2 * p, 4],
+            "dn": [0, p / 2, p, (1 + p) / 2, 1]}
+
+def p2_add(s, x):
+    q, n, np_, dn = s["q"], s["n"], s["np"], s["dn"]
+    if len(q) < 5:
+        q.append(x); q.sort()
+        return
+    if x < q[0]:
+        q[0] = x; k = 0
+    elif x >= q[4]:
+        q[4] = x; k = 3
+    else:
+        k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+    for i in range(k + 1, 5):
+        n[i] += 1
+    for i in range(5):
+        np_[i] += dn[i]
+    # Move the three middle markers towards their desired positions
+    for i in range(1, 4):
+        d = np_[i] - n[i]
+        if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+            d = 1 if d > 0 else -1
+            qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            if not q[i - 1] < qp < q[i + 1]:
+                qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+            q[i] = qp
+            n[i] += d
+
+def p2_value(s):
+    q = s["q"]
+    if not q:
+        return None
+    if len(q) < 5:
+        return q[min(len(q) - 1, int(s["p"] * len(q)))]
+    return q[2]
+
+# ----- running stat -----
+def new_stat():
+    return {"n": 0, "mean": 0.0, "m2": 0.0,
+            "sketch": {str(p): p2_new(p) for p in QUANTILES}}
+
+def add_sample(stat, x):
+    stat["n"] += 1
+    d = x - stat["mean"]
+    stat["mean"] += d / stat["n"]
+    stat["m2"] += d * (x - stat["mean"])
+    for sk in stat["sketch"].values():
+        p2_add(sk, x)
+
+def summary(stat):
+    """{'n', 'mean', 'std', 'p50', 'p90'} for display and ETAs."""
+    n = stat["n"]
+    return {
+        "n": n,
+        "mean": stat["mean"] if n else None,
+        "std": (stat["m2"] / (n - 1)) ** 0.5 if n > 1 else None,
+        "p50": p2_value(stat["sketch"]["0.5"]),
+        "p90": p2_value(stat["sketch"]["0.9"]),
+    }
+
+# ----- ETA -----
+class EtaModel:
+    """
+    Remaining minutes to loaded for an order at (station, status).
+
+    segments is the downstream route as (group, metric) pairs, e.g.
+    [("cnc", "wait"), ("cnc", "cycle"), ("tramming1", "wait"), ...].
+    stats maps (station or group, metric) -> summary(). Suffix sums over the
+    segments are computed once, so each order costs a couple of dict lookups.
+    """
+    def __init__(self, segments, stats, group_of):
+        self.segments = segments
+        self.stats = stats
+        self.group_of = group_of
+        self.index = {seg: i for i, seg in enumerate(segments)}
+        self.after_mean, self.after_p90 = [0.0] * (len(segments) + 1), [0.0] * (len(segments) + 1)
+        for i in range(len(segments) - 1, -1, -1):
+            mean, p90 = self._expected(*segments[i])
+            self.after_mean[i] = self.after_mean[i + 1] + mean
+            self.after_p90[i] = self.after_p90[i + 1] + p90
+
+    def _expected(self, key, metric, group=None):
+        s = self.stats.get((key, metric))
+        if (not s or s["n"] < MIN_SAMPLES) and group:
+            s = self.stats.get((group, metric)) or s
+        if not s or not s["n"]:
+            return 0.0, 0.0
+        return s["mean"], (s["p90"] if s["p90"] is not None else s["mean"])
+
+    def remaining(self, station, status, elapsed):
+        """(mean minutes, p90 minutes), or None when the order is not on the route."""
+        group = self.group_of(station)
+        status = (status or "").lower()
+        if status == "pending":
+            seg = (group, "wait")
+        elif status == "in progress":
+            seg = (group, "cycle")
+        else:
+            # Done here, waiting for the next stage to pick it up
+            i = self.index.get((group, "cycle"), self.index.get((group, "wait")))
+            if i is None or i + 1 >= len(self.segments):
+                return None
+            seg = self.segments[i + 1]
+        i = self.index.get(seg)
+        if i is None:
+            return None
+        own = station if seg[0] == group else seg[0]
+        mean, p90 = self._expected(own, seg[1], seg[0])
+        elapsed = elapsed or 0.0
+        return (max(mean - elapsed, 0.0) + self.after_mean[i + 1],
+                max(p90 - elapsed, 0.0) + self.after_p90[i + 1])
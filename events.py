@@ -0,0 +1,205 @@
+"""
+Append-only order event store.
+
+Every transition logged by app.log_many appends one event per order to
+order_events, in the same transaction as the change to `orders`:
+
+    seq         global order of events
+    order_id
+    kind        created | started | finished | queued | imported
+    station     where it happened
+    actor       username at the terminal, NULL from scripts
+    payload     {"row": the orders row after the change, "history": [[station, status], ...],
+                 "at": when it happened if not at created_at (synced offline actions)}
+    created_at  UTC
+
+Triggers refuse UPDATE and DELETE on order_events. `orders` is a projection:
+replaying the events in seq order and keeping the latest row per order gives
+the table back. Every SNAPSHOT_EVERY events the whole projection is saved to
+order_snapshots (zlib-compressed JSON) by a background thread, so a rebuild
+or a look at a past moment starts from the nearest snapshot instead of from
+zero, and no operator waits for one.
+
+    python events.py state --at "2026-10-18 14:00"   # the line as it was then (UTC)
+    python events.py rebuild                         # orders <- snapshot + events
+    python events.py check                           # orders vs. replay, differences only
+    python events.py snapshot
+"""
+import argparse, json, os, sqlite3, threading, zlib
+from collections import Counter
+
+ORDER_COLUMNS = ["id", "order_number", "status", "current_station", "queued_at", "started_at",
+                 "finished_at", "lorry", "wrap_slot", "batch_id", "priority", "due_at", "est_minutes",
+                 "lorry_id", "volume_m3", "weight_kg", "route"]
+
+SNAPSHOT_EVERY = 10000
+
+KIND_OF_STATUS = {"pending": "queued", "in_progress": "started", "done": "finished"}
+
+# The orders row as a JSON object, built by SQLite
+ROW_JSON = "json_object(" + ", ".join(f"'{col}', {col}" for col in ORDER_COLUMNS) + ")"
+
+def append(c, pairs, kind=None, actor=None, at=None):
+    """
+    Appends one event per order in `pairs` [(order_id, station, status), ...],
+    reading each row as it is now. Runs in the caller's transaction, after
+    the orders change. `at` (when it happened, if not now) goes into the
+    payload. Returns True when a snapshot is due.
+    """
+    by_order = {}
+    for oid, station, status in pairs:
+        by_order.setdefault(oid, []).append([station, status])
+    for oid, hops in by_order.items():
+        c.execute(f"""
+            INSERT INTO order_events (order_id, kind, station, actor, payload)
+            SELECT id, ?, ?, ?, json_object('row', {ROW_JSON}, 'history', json(?), 'at', ?)
+            FROM orders WHERE id=?
+        """, (kind or KIND_OF_STATUS.get(hops[0][1], hops[0][1]), hops[0][0], actor,
+              json.dumps(hops), at, oid))
+    seq = c.execute("SELECT MAX(seq) FROM order_events").fetchone()[0] or 0
+    last_snap = c.execute("SELECT MAX(seq) FROM order_snapshots").fetchone()[0] or 0
+    return seq - last_snap >= SNAPSHOT_EVERY
+
+def import_orders(c):
+    """One 'imported' event per existing order, for databases older than the event store."""
+    c.execute(f"""
+        INSERT INTO order_events (order_id, kind, station, payload, created_at)
+        SELECT id, 'imported', current_station, json_object('row', {ROW_JSON}, 'history', json('[]')),
+               COALESCE(finished_at, started_at, queued_at, CURRENT_TIMESTAMP)
+        FROM orders ORDER BY id
+    """)
+
+def snapshot(conn):
+    """
+    Saves the projection at the latest seq and returns that seq. Events and
+    orders are read in one read transaction, so they agree; only the insert
+    takes the write lock.
+    """
+    c = conn.cursor()
+    c.execute("BEGIN")
+    row = c.execute("SELECT seq, created_at FROM order_events ORDER BY seq DESC LIMIT 1").fetchone()
+    c.execute(f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders")
+    rows = c.fetchall()
+    conn.commit()
+    if not row:
+        return 0
+    blob = zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+    c.execute("INSERT OR REPLACE INTO order_snapshots (seq, created_at, orders, state) VALUES (?,?,?,?)",
+              (row[0], row[1], len(rows), blob))
+    conn.commit()
+    return row[0]
+
+_snapshot_locks = {}    # db path -> lock, one snapshot at a time per database
+
+def snapshot_in_background(db_path):
+    """Starts a snapshot thread unless one is already running for this database."""
+    lock = _snapshot_locks.setdefault(db_path, threading.Lock())
+    def run():
+        try:
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                snapshot(conn)
+            finally:
+                conn.close()
+        finally:
+            lock.release()
+    if lock.acquire(blocking=False):
+        threading.Thread(target=run, daemon=True).start()
+
+def replay(c, at=None, from_zero=False):
+    """
+    ({order_id: row dict}, last seq) as of `at` (UTC text, None = now),
+    from the latest snapshot before then unless from_zero.
+    """
+    state, seq = {}, 0
+    if not from_zero:
+        if at is None:
+            c.execute("SELECT seq, state FROM order_snapshots ORDER BY seq DESC LIMIT 1")
+        else:
+            c.execute("SELECT seq, state FROM order_snapshots WHERE created_at <= ? ORDER BY seq DESC LIMIT 1",
+                      (at,))
+        snap = c.fetchone()
+        if snap:
+            seq = snap[0]
+            for values in json.loads(zlib.decompress(snap[1])):
+                state[values[0]] = dict(zip(ORDER_COLUMNS, values))
+    sql = "SELECT seq, order_id, payload FROM order_events WHERE seq > ?"
+    params = [seq]
+    if at is not None:
+        sql += " AND created_at <= ?"; params.append(at)
+    c.execute(sql + " ORDER BY seq", params)
+    loads = json.loads
+    while True:
+        chunk = c.fetchmany(5000)
+        if not chunk:
+            break
+        for seq, oid, payload in chunk:
+            state[oid] = loads(payload)["row"]
+    return state, seq
+
+def rebuild(conn):
+    """Replaces `orders` with the replayed projection. Returns the number of orders."""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    state, _ = replay(c)
+    c.execute("DELETE FROM orders")
+    c.executemany(
+        f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) VALUES ({', '.join('?' * len(ORDER_COLUMNS))})",
+        ([row.get(col) for col in ORDER_COLUMNS] for _, row in sorted(state.items())))
+    conn.commit()
+    return len(state)
+
+def check(conn):
+    """[(order_id, 'missing' | 'extra' | column names)] where orders and the replay disagree."""
+    c = conn.cursor()
+    state, _ = replay(c)
+    c.execute(f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders")
+    table = {r[0]: dict(zip(ORDER_COLUMNS, r)) for r in c.fetchall()}
+    problems = []
+    for oid in sorted(set(state) | set(table)):
+        if oid not in table:
+            problems.append((oid, "missing"))
+        elif oid not in state:
+            problems.append((oid, "extra"))
+        else:
+            cols = [col for col in ORDER_COLUMNS if state[oid].get(col) != table[oid][col]]
+            if cols:
+                problems.append((oid, ",".join(cols)))
+    return problems
+
+def line_summary(state):
+    """Counter of (current_station, status) over orders not yet loaded."""
+    return Counter((r["current_station"], r["status"]) for r in state.values()
+                   if not (r["current_station"] == "loading" and r["status"] == "Done"))
+
+def main():
+    p = argparse.ArgumentParser(description="Order event store tools")
+    p.add_argument("command", choices=["state", "rebuild", "check", "snapshot"])
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    p.add_argument("--at", help="UTC timestamp for 'state', e.g. '2026-10-18 14:00:00'")
+    p.add_argument("--station", help="list this station's orders for 'state'")
+    a = p.parse_args()
+    conn = sqlite3.connect(a.db)
+    if a.command == "state":
+        state, seq = replay(conn.cursor(), a.at)
+        print(f"line at {a.at or 'now'} (event {seq}), {len(state)} orders")
+        for (station, status), n in sorted(line_summary(state).items(), key=lambda kv: (kv[0][0] or "", kv[0][1])):
+            print(f"  {station or '-':10} {status:12} {n}")
+        if a.station:
+            for r in sorted(state.values(), key=lambda r: r["id"]):
+                if r["current_station"] == a.station:
+                    print(f"  #{r['id']} {r['order_number']} {r['status']}"
+                          + (f" {r['lorry']}" if r["lorry"] else ""))
+    elif a.command == "rebuild":
+        print(f"rebuilt {rebuild(conn)} orders")
+    elif a.command == "check":
+        problems = check(conn)
+        for oid, what in problems:
+            print(f"order {oid}: {what}")
+        print("projection matches the events" if not problems else f"{len(problems)} orders differ")
+    else:
+        print(f"snapshot at event {snapshot(conn)}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
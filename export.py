@@ -0,0 +1,242 @@
+"""
+Streaming exports of orders, history, lorry manifests, training and staffing.
+
+Rows are read in keyset-paginated pages (WHERE key > last key ORDER BY key
+LIMIT PAGE_ROWS), each page drained with fetchmany(). Every page is its own
+short read, so an export of any size runs in constant memory and never keeps
+a read transaction open long enough to hold up station writes (the database
+also runs in WAL mode, see app.init_db, and is opened read-only, see
+readpool.py).
+
+Formats: csv (optionally gzip), and parquet / arrow when pyarrow is installed.
+Timestamps are exported as stored, in UTC, and date filters are UTC too.
+
+Used by the /manager/export/<dataset> route and from the command line:
+
+    python export.py history --from 2026-10-01 --to 2026-10-08 --station edge3 --gzip -o history.csv.gz
+"""
+import argparse, csv, io, os, sys, zlib
+
+import readpool
+
+PAGE_ROWS = 5000
+FETCH_ROWS = 500
+
+# name -> table, exported columns (with their SQL where it isn't the column
+# name), keyset columns (indexed, unique together), fixed WHERE, the columns
+# the time/station filters apply to and the condition of the lorry filter
+# (a lorry number, see the lorries table)
+DATASETS = {
+    "orders": {
+        "table": "orders",
+        "columns": ["id", "order_number", "status", "current_station", "priority", "due_at",
+                    "est_minutes", "volume_m3", "weight_kg", "route", "queued_at", "started_at", "finished_at",
+                    "lorry", "lorry_id", "wrap_slot", "batch_id"],
+        "key": ["id"],
+        "time": "queued_at", "station": "current_station",
+        "lorry": "lorry_id = (SELECT id FROM lorries WHERE number = ?)",
+    },
+    "history": {
+        "table": "order_history",
+        "columns": ["id", "order_id", "station", "status", "changed_at"],
+        "key": ["changed_at", "id"],
+        "time": "changed_at", "station": "station",
+    },
+    "lorries": {
+        "table": "lorries l JOIN orders o ON o.lorry_id = l.id",
+        "columns": ["lorry_number", "lorry_status", "order_id", "order_number", "status", "batch_id",
+                    "started_at", "finished_at", "volume_m3", "weight_kg", "route"],
+        "sql": {"lorry_number": "l.number", "lorry_status": "l.status", "order_id": "o.id",
+                "order_number": "o.order_number", "status": "o.status", "batch_id": "o.batch_id",
+                "started_at": "o.started_at", "finished_at": "o.finished_at", "volume_m3": "o.volume_m3",
+                "weight_kg": "o.weight_kg", "route": "o.route"},
+        "key": ["order_id"],
+        "where": "o.current_station = 'loading'",
+        "time": "finished_at", "lorry": "l.number = ?",
+    },
+    "training": {
+        "table": "training",
+        "columns": ["employee", "station", "status"],
+        "key": ["id"],
+        "station": "station",
+    },
+    "staffing": {
+        "table": "staffing_plan",
+        "columns": ["station", "day_of_week", "employee", "pinned"],
+        "key": ["id"],
+        "station": "station",
+    },
+}
+
+# Column types for parquet / arrow; timestamps are exported as the stored text
+TYPES = {
+    "int":   ["id", "order_id", "priority", "lorry_id", "wrap_slot", "pinned", "lorry_number"],
+    "float": ["est_minutes", "volume_m3", "weight_kg"],
+}
+
+FORMATS = {
+    "csv":     ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow":   ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def column_types(dataset):
+    """{column: "int", "float" or "str"} of a dataset."""
+    types = {col: kind for kind, cols in TYPES.items() for col in cols}
+    return {col: types.get(col, "str") for col in DATASETS[dataset]["columns"]}
+
+def iter_rows(db_path, dataset, date_from=None, date_to=None, station=None, lorry=None):
+    """Yields lists of rows (at most FETCH_ROWS each) for one dataset. lorry: a lorry number."""
+    spec = DATASETS[dataset]
+    sql_of = lambda col: spec.get("sql", {}).get(col, col)
+    cols = list(spec["columns"])
+    key = spec["key"]
+    select = cols + [k for k in key if k not in cols]
+    key_pos = [select.index(k) for k in key]
+
+    where, params = [], []
+    if spec.get("where"):
+        where.append(spec["where"])
+    # When the time column leads the key, the keyset bound already implies
+    # date_from after the first page; keeping both makes SQLite seek from
+    # date_from on every page.
+    start, start_params = [], []
+    if date_from and spec.get("time"):
+        if key[0] == spec["time"]:
+            start.append(f"{sql_of(spec['time'])} >= ?"); start_params.append(date_from)
+        else:
+            where.append(f"{sql_of(spec['time'])} >= ?"); params.append(date_from)
+    if date_to and spec.get("time"):
+        where.append(f"{sql_of(spec['time'])} < ?"); params.append(date_to)
+    if station and spec.get("station"):
+        where.append(f"{sql_of(spec['station'])} = ?"); params.append(station)
+    if lorry is not None and spec.get("lorry"):
+        where.append(spec["lorry"]); params.append(int(lorry))
+
+    key_sql = ", ".join(sql_of(k) for k in key)
+    after_sql = f"({key_sql}) > ({', '.join('?' * len(key))})" if len(key) > 1 else f"{key_sql} > ?"
+    conn = readpool.connect(db_path)
+    try:
+        last = None
+        while True:
+            if last is None:
+                conds, args = where + start, params + start_params
+            else:
+                conds, args = where + [after_sql], params + list(last)
+            sql = (f"SELECT {', '.join(sql_of(col) for col in select)} FROM {spec['table']}"
+                   + (f" WHERE {' AND '.join(conds)}" if conds else "")
+                   + f" ORDER BY {key_sql} LIMIT {PAGE_ROWS}")
+            c = conn.execute(sql, args)
+            got = 0
+            while True:
+                chunk = c.fetchmany(FETCH_ROWS)
+                if not chunk:
+                    break
+                got += len(chunk)
+                last = [chunk[-1][i] for i in key_pos]
+                yield [r[:len(cols)] for r in chunk]
+            c.close()
+            if got < PAGE_ROWS:
+                break
+    finally:
+        conn.close()
+
+def csv_stream(columns, batches):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for rows in batches:
+        w.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0); buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def gzip_stream(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose contents are handed out and dropped after each batch."""
+    def __init__(self):
+        self.parts = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+    def take(self):
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+def arrow_stream(types, batches, fmt):
+    """
+    One Parquet row group / Arrow record batch per fetched batch, all with
+    the schema of `types` ({column: "int", "float" or "str"}), so a column
+    that is all NULL in one batch keeps its type.
+    """
+    import pyarrow as pa
+    arrow_type = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+    schema = pa.schema([(col, arrow_type[kind]) for col, kind in types.items()])
+    sink = _Drain()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for rows in batches:
+        table = pa.Table.from_pydict({c: [r[i] for r in rows] for i, c in enumerate(types)}, schema=schema)
+        writer.write_table(table)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+def export_stream(db_path, dataset, fmt="csv", gzip=False, **filters):
+    """Byte chunks of the whole export."""
+    columns = DATASETS[dataset]["columns"]
+    batches = iter_rows(db_path, dataset, **filters)
+    if fmt == "csv":
+        chunks = csv_stream(columns, batches)
+    else:
+        chunks = arrow_stream(column_types(dataset), batches, fmt)
+    return gzip_stream(chunks) if gzip else chunks
+
+def filename(dataset, fmt="csv", gzip=False):
+    return f"{dataset}.{FORMATS[fmt][1]}" + (".gz" if gzip else "")
+
+def main():
+    p = argparse.ArgumentParser(description="Export production data")
+    p.add_argument("dataset", choices=list(DATASETS))
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    p.add_argument("--format", choices=list(FORMATS), default="csv")
+    p.add_argument("--gzip", action="store_true")
+    p.add_argument("--from", dest="date_from", help="UTC, e.g. 2026-10-01 or '2026-10-01 06:00:00'")
+    p.add_argument("--to", dest="date_to", help="UTC, exclusive")
+    p.add_argument("--station")
+    p.add_argument("--lorry", type=int, help="lorry number, e.g. 12")
+    p.add_argument("-o", "--output", help="file to write, default stdout")
+    a = p.parse_args()
+    if a.format != "csv" and not arrow_available():
+        p.error(f"--format {a.format} needs pyarrow (pip install pyarrow)")
+    out = open(a.output, "wb") if a.output else sys.stdout.buffer
+    try:
+        for chunk in export_stream(a.db, a.dataset, a.format, a.gzip, date_from=a.date_from,
+                                   date_to=a.date_to, station=a.station, lorry=a.lorry):
+            out.write(chunk)
+    finally:
+        if a.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
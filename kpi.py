@@ -0,0 +1,168 @@
+"""
+KPI counters.
+
+The manager board's figures are kept as counters in kpi_counters, bumped in
+the same transaction as the change they count, instead of being counted
+from order_history and orders on every render:
+
+    done     key = station     history rows logged 'done' at the station
+                               (loading: orders fully done)
+    lorry    key = lorry id    orders loaded onto the lorry
+    closed   key = ''          lorries completed
+
+Each event adds 1 to its metric's row for the UTC hour it happened in and
+to the 'total' row, so the all-time figures are one row each and any window
+(today, this shift, this week) is a range over at most 168 hourly rows per
+key, all on the table's primary key.
+
+The counters are derived data: reconcile() rebuilds them from order_history,
+orders and lorries in one transaction and reports what had drifted.
+
+    python kpi.py reconcile [--dry-run]
+"""
+import argparse, os, sqlite3
+from datetime import datetime, timedelta, timezone
+
+TOTAL = "total"
+HOUR_SQL = "strftime('%Y-%m-%d %H', {})"
+UNDATED = "0000-00-00 00"       # hour bucket of source rows without a timestamp
+SHIFT_STARTS = (6, 14, 22)      # local hours the shifts start
+WINDOWS = ("all", "today", "shift", "week")
+
+_BUMP = f"""
+    INSERT INTO kpi_counters (hour, metric, key, n)
+    VALUES ({HOUR_SQL.format("COALESCE(?, CURRENT_TIMESTAMP)")}, ?, ?, 1), ('{TOTAL}', ?, ?, 1)
+    ON CONFLICT(hour, metric, key) DO UPDATE SET n = n + 1
+"""
+
+def create(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS kpi_counters (
+        hour TEXT NOT NULL,         -- UTC 'YYYY-MM-DD HH', or 'total'
+        metric TEXT NOT NULL,
+        key TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, metric, key)
+    ) WITHOUT ROWID
+    """)
+
+def bump(c, metric, key, at=None):
+    c.execute(_BUMP, (at, metric, str(key), metric, str(key)))
+
+def bump_many(c, metric, events):
+    """bump() for each (key, at) of `events`."""
+    c.executemany(_BUMP, [(at, metric, str(key), metric, str(key)) for key, at in events])
+
+def count_transitions(c, pairs, loading_station, at=None):
+    """Counts logged (order id, station, status) transitions, in the caller's transaction."""
+    done = [(oid, station) for oid, station, status in pairs if status == "done"]
+    if not done:
+        return
+    bump_many(c, "done", [(station, at) for _, station in done])
+    for oid, station in done:
+        if station == loading_station:
+            c.execute("SELECT lorry_id FROM orders WHERE id=?", (oid,))
+            row = c.fetchone()
+            if row and row[0] is not None:
+                bump(c, "lorry", row[0], at)
+
+def window_start(window, now=None):
+    """First UTC hour bucket of a window ('today', 'shift', 'week' in local time), None for 'all'."""
+    if window not in WINDOWS or window == "all":
+        return None
+    now = (now or datetime.now()).astimezone()
+    start = now.replace(minute=0, second=0, microsecond=0)
+    if window == "today":
+        start = start.replace(hour=0)
+    elif window == "week":
+        start = start.replace(hour=0) - timedelta(days=now.weekday())
+    else:
+        past = [h for h in SHIFT_STARTS if h <= now.hour]
+        start = start.replace(hour=past[-1]) if past else start.replace(hour=SHIFT_STARTS[-1]) - timedelta(days=1)
+    return start.astimezone(timezone.utc).strftime("%Y-%m-%d %H")
+
+def read(c, window="all", lorries=()):
+    """
+    {metric: {key: n}} for the window, plus the all-time count of each of
+    `lorries` (ids) under "lorry", in one read.
+    """
+    since = window_start(window)
+    lo, hi = (since, "9999") if since else (TOTAL, TOTAL)
+    ids = [str(i) for i in lorries]
+    c.execute(f"""
+        SELECT metric, key, SUM(n) FROM kpi_counters
+        WHERE hour BETWEEN ? AND ? AND metric IN ('done', 'closed')
+           OR hour = '{TOTAL}' AND metric = 'lorry' AND key IN ({",".join("?" * len(ids)) or "NULL"})
+        GROUP BY metric, key
+    """, (lo, hi, *ids))
+    counts = {"done": {}, "closed": {}, "lorry": {}}
+    for metric, key, n in c.fetchall():
+        counts[metric][key] = n
+    return counts
+
+def _source(c):
+    """
+    The counters as they should be, recounted from order_history, orders
+    and lorries. Loading's 'done' and 'lorry' both count loaded orders.
+    """
+    hour = lambda col: f"COALESCE({HOUR_SQL.format(col)}, '{UNDATED}')"
+    c.execute(f"""
+        SELECT {hour("changed_at")} AS hour, 'done', station, COUNT(*)
+        FROM order_history WHERE status='done' AND station != 'loading' GROUP BY hour, station
+        UNION ALL
+        -- 'done' at loading is an order fully done: loaded orders, as for 'lorry'
+        SELECT {hour("finished_at")} AS hour, 'done', 'loading', COUNT(*)
+        FROM orders WHERE current_station='loading' AND status='Done'
+        GROUP BY hour
+        UNION ALL
+        SELECT {hour("finished_at")} AS hour, 'lorry', CAST(lorry_id AS TEXT), COUNT(*)
+        FROM orders WHERE current_station='loading' AND status='Done' AND lorry_id IS NOT NULL
+        GROUP BY hour, lorry_id
+        UNION ALL
+        SELECT {hour("closed_at")} AS hour, 'closed', '', COUNT(*)
+        FROM lorries WHERE status='closed' GROUP BY hour
+    """)
+    rows = {}
+    for hour, metric, key, n in c.fetchall():
+        rows[(hour, metric, key)] = n
+        total = (TOTAL, metric, key)
+        rows[total] = rows.get(total, 0) + n
+    return rows
+
+def reconcile(c, dry_run=False):
+    """
+    Rebuilds kpi_counters from source in the caller's transaction (rolled
+    back by the caller for a dry run) and returns the drift:
+    [(hour, metric, key, counted, actual)] for every row that differed.
+    """
+    c.execute("SELECT hour, metric, key, n FROM kpi_counters")
+    counted = {(h, m, k): n for h, m, k, n in c.fetchall()}
+    actual = _source(c)
+    drift = sorted((*key, counted.get(key, 0), actual.get(key, 0))
+                   for key in counted.keys() | actual.keys() if counted.get(key, 0) != actual.get(key, 0))
+    if drift and not dry_run:
+        c.execute("DELETE FROM kpi_counters")
+        c.executemany("INSERT INTO kpi_counters (hour, metric, key, n) VALUES (?,?,?,?)",
+                      [(*key, n) for key, n in actual.items()])
+    return drift
+
+def main():
+    p = argparse.ArgumentParser(description="KPI counters")
+    p.add_argument("command", choices=["reconcile"])
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    p.add_argument("--dry-run", action="store_true", help="report the drift, change nothing")
+    a = p.parse_args()
+    conn = sqlite3.connect(a.db, timeout=30); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    drift = reconcile(c, a.dry_run)
+    if a.dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    conn.close()
+    for hour, metric, key, was, now in drift:
+        print(f"  {hour:13} {metric:6} {key or '-':12} {was:8} -> {now}")
+    print(f"{len(drift)} counter(s) {'to correct' if a.dry_run else 'corrected'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Line settings an admin can change while the line runs: the Pending lane
+capacity of each machine (CNC, edge), the number of wrapping slots and the
+orders per lorry.
+
+The defaults are app.TOPOLOGY's and app.LORRY_CAPACITY. A save adds a row
+to line_config with the next version number and the whole set as JSON; the
+highest version is in force and the older rows are the change log.
+
+Each worker keeps the set it last read per database in a Cache. A request
+checks the cached version against MAX(version), a seek to the last row of
+the table, and only when that moved reads the new row and applies it to
+the compiled line (topology.configure()). A save reaches every worker on
+its next request, without a restart, and no request reads the full set
+unless it changed. The admin page and `set` below both save through edit(),
+which refuses to remove an occupied slot and resizes the open lorries.
+
+    python line_config.py show
+    python line_config.py set edge3=4 wrapping=4 lorry_capacity=14
+"""
+import argparse, json, os, sqlite3
+from collections import namedtuple
+
+import topology
+
+MAX_FIGURE = 50         # largest lane, slot count and lorry that can be set
+
+Settings = namedtuple("Settings", [
+    "version",
+    "capacity",         # {machine station: Pending lane size}
+    "slots",            # {slots stage: number of slots}
+    "lorry_capacity",   # orders per lorry
+    "saved_at",         # UTC
+    "saved_by",         # username, 'defaults' for version 1
+])
+
+def create(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS line_config (
+        version INTEGER PRIMARY KEY,
+        settings TEXT NOT NULL,         -- JSON: capacity, slots, lorry_capacity
+        saved_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        saved_by TEXT
+    )
+    """)
+
+def values(routing, lorry_capacity):
+    """The settings a compiled line carries, as stored: {capacity, slots, lorry_capacity}."""
+    return {
+        "capacity": {s: n for stage in topology.machine_stages(routing) for s, n in stage.capacity.items()},
+        "slots": {stage.name: len(stage.slots) for stage in routing.stages.values() if stage.kind == "slots"},
+        "lorry_capacity": lorry_capacity,
+    }
+
+def seed(c, defaults):
+    """Version 1 from `defaults` (values()) when nothing has been saved yet."""
+    c.execute("""
+        INSERT INTO line_config (version, settings, saved_by)
+        SELECT 1, ?, 'defaults' WHERE NOT EXISTS (SELECT 1 FROM line_config)
+    """, (json.dumps(defaults),))
+
+def version(c):
+    c.execute("SELECT MAX(version) FROM line_config")
+    return c.fetchone()[0]
+
+def load(c, number=None):
+    """Settings of a version, the one in force by default; None if there is none."""
+    c.execute("""
+        SELECT version, settings, saved_at, saved_by FROM line_config
+        WHERE version = COALESCE(?, (SELECT MAX(version) FROM line_config))
+    """, (number,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    number, text, saved_at, saved_by = row
+    stored = json.loads(text)
+    return Settings(number, stored["capacity"], stored["slots"], stored["lorry_capacity"], saved_at, saved_by)
+
+def update(current, changes):
+    """
+    `current` (values()) with `changes` applied: {name: figure}, name a
+    machine station, a slots stage or "lorry_capacity". ValueError naming
+    the first bad one. A lane may be 0 (closed to new jobs).
+    """
+    new = {"capacity": dict(current["capacity"]), "slots": dict(current["slots"]),
+           "lorry_capacity": current["lorry_capacity"]}
+    for name, text in changes.items():
+        try:
+            n = int(str(text).strip())
+        except ValueError:
+            raise ValueError(f"{name}: {text!r} is not a whole number") from None
+        low = 0 if name in new["capacity"] else 1
+        if not low <= n <= MAX_FIGURE:
+            raise ValueError(f"{name}: must be {low} to {MAX_FIGURE}")
+        if name in new["capacity"]:
+            new["capacity"][name] = n
+        elif name in new["slots"]:
+            new["slots"][name] = n
+        elif name == "lorry_capacity":
+            new["lorry_capacity"] = n
+        else:
+            raise ValueError(f"{name}: not a machine, slots stage or lorry_capacity")
+    return new
+
+def save(c, new, by=None, expected=None):
+    """
+    Stores `new` (values()) as the next version in the caller's transaction
+    and returns its number. expected: the version the edit started from;
+    ValueError if another save came in between.
+    """
+    current = version(c) or 0
+    if expected is not None and expected != current:
+        raise ValueError(f"The settings were changed meanwhile (now version {current}), please check them again.")
+    c.execute("INSERT INTO line_config (version, settings, saved_by) VALUES (?,?,?)",
+              (current + 1, json.dumps(new), by))
+    return current + 1
+
+def edit(c, routing, changes, by=None, expected=None):
+    """
+    Saves `changes` (see update()) to the settings in force as the next
+    version, in the caller's transaction, with what follows from them: a
+    slot with a job in it can't be removed, and the open lorries take a new
+    lorry capacity at once. routing: the compiled line (app.LINE), for the
+    stations of each stage. Returns the version, ValueError if refused.
+    """
+    current = load(c)
+    line = topology.configure(routing, current.capacity, current.slots)
+    new = update(values(line, current.lorry_capacity), changes)
+    for stage in line.stages.values():
+        if stage.kind == "slots" and new["slots"][stage.name] < len(stage.slots):
+            c.execute("""
+                SELECT DISTINCT wrap_slot FROM orders
+                WHERE current_station=? AND wrap_slot > ? AND status IN ('Pending','In progress')
+                ORDER BY wrap_slot
+            """, (stage.stations[0], new["slots"][stage.name]))
+            taken = [r[0] for r in c.fetchall()]
+            if taken:
+                raise ValueError(f"{stage.label} slot {', '.join(map(str, taken))} has a job in it; "
+                                 f"finish or move it before removing the slot.")
+    number = save(c, new, by, expected)
+    if new["lorry_capacity"] != current.lorry_capacity:
+        c.execute("UPDATE lorries SET capacity=? WHERE status='open'", (new["lorry_capacity"],))
+    return number
+
+class Cache:
+    """The settings in force per database, as one worker last read them."""
+
+    def __init__(self):
+        self._entries = {}      # db path -> (Settings, Routing)
+
+    def get(self, conn, path, routing):
+        """
+        (Settings, `routing` with them applied) for the database `conn` is
+        open on (`path`): one version read, and the settings themselves
+        only when another version is in force than the cached one.
+        """
+        c = conn.cursor()
+        number = version(c)
+        entry = self._entries.get(path)
+        if entry is None or entry[0].version != number:
+            settings = load(c, number)
+            entry = (settings, topology.configure(routing, settings.capacity, settings.slots))
+            self._entries[path] = entry
+        return entry
+
+def main():
+    p = argparse.ArgumentParser(description="Line settings")
+    p.add_argument("command", choices=["show", "set"])
+    p.add_argument("changes", nargs="*", help="name=figure, e.g. edge3=4 wrapping=4 lorry_capacity=14 (set)")
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    a = p.parse_args()
+    conn = sqlite3.connect(a.db, timeout=30); c = conn.cursor()
+    if a.command == "set":
+        if not a.changes or not all("=" in ch for ch in a.changes):
+            p.error("set needs name=figure changes")
+        import app
+        line = app.create_app({"DB_PATH": a.db, "STUCK_SCAN_SECONDS": 0, "OUTBOX_SINK": None})
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            edit(c, line.extensions["routing"], dict(ch.split("=", 1) for ch in a.changes), by=os.getenv("USER"))
+        except ValueError as e:
+            conn.rollback(); conn.close()
+            p.error(str(e))
+        conn.commit()
+        # Re-plan the loads with the new version, as the admin page does
+        with line.app_context():
+            c.execute("BEGIN IMMEDIATE")
+            app.plan_loads(c)
+            conn.commit()
+    s = load(c)
+    conn.close()
+    print(f"version {s.version}, saved {s.saved_at} by {s.saved_by or '-'}")
+    for name, n in {**s.capacity, **s.slots, "lorry_capacity": s.lorry_capacity}.items():
+        print(f"  {name:14} {n}")
+
+if __name__ == "__main__":
+    main()
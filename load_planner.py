@@ -0,0 +1,161 @@
+"""
+Lorry load planning by volume and weight.
+
+Orders ready from Wrapping are assigned to the two open lorries so that
+neither lorry's remaining volume or weight is exceeded and each delivery
+route stays on one lorry where possible:
+
+- plans of up to EXACT_LIMIT orders are solved exactly (branch and bound over
+  lorry 1 / lorry 2 / wait), maximising orders placed, then fewest routes
+  split over both lorries, then volume placed
+- larger sets use first-fit decreasing: biggest orders first, each onto the
+  lorry that already carries its route, else the tighter fit
+- plan() keeps a previous plan while it still fits and only places the new
+  orders, so a re-plan after each finished wrap costs microseconds and the
+  suggestions on the Loading screen don't jump around
+
+plan() works on plain tuples and does no I/O; app.py builds them (orders
+without dimensions count as 1/LORRY_CAPACITY of a lorry, the old "12 orders
+per lorry") and keeps the result in the load_plan table.
+"""
+from collections import namedtuple
+
+EXACT_LIMIT = 8
+
+Item = namedtuple("Item", [
+    "order_id",
+    "volume",       # m3
+    "weight",       # kg
+    "route",        # delivery route, None if not known
+])
+
+Lorry = namedtuple("Lorry", [
+    "slot",         # 1 or 2
+    "volume",       # m3 still free
+    "weight",       # kg still free
+    "routes",       # routes already loaded or being loaded
+])
+
+def size(item, scale):
+    """How much of a lorry the item takes, by its tighter dimension."""
+    return max(item.volume / scale[0], item.weight / scale[1])
+
+def _scale(lorries):
+    return (max([l.volume for l in lorries] + [1e-9]), max([l.weight for l in lorries] + [1e-9]))
+
+def _routes_split(placement, items, lorries):
+    on = {l.slot: {r for r in l.routes if r} for l in lorries}
+    for it in items:
+        slot = placement.get(it.order_id)
+        if slot is not None and it.route:
+            on[slot].add(it.route)
+    sets = list(on.values())
+    return len(sets[0] & sets[1]) if len(sets) == 2 else 0
+
+def score(placement, items, lorries):
+    """(orders placed, -routes split, volume placed), higher is better."""
+    placed = [it for it in items if placement.get(it.order_id) is not None]
+    return len(placed), -_routes_split(placement, items, lorries), sum(it.volume for it in placed)
+
+def greedy(items, lorries, placement=None):
+    """
+    First-fit decreasing with route affinity, on top of `placement`
+    ({order_id: slot}) whose items are already taken out of the lorries.
+    """
+    placement = dict(placement or {})
+    free = {l.slot: [l.volume, l.weight] for l in lorries}
+    routes = {l.slot: {r for r in l.routes if r} for l in lorries}
+    by_id = {it.order_id: it for it in items}
+    for oid, slot in placement.items():
+        if slot is not None:
+            free[slot][0] -= by_id[oid].volume
+            free[slot][1] -= by_id[oid].weight
+            if by_id[oid].route:
+                routes[slot].add(by_id[oid].route)
+    scale = _scale(lorries)
+    for it in sorted((it for it in items if it.order_id not in placement),
+                     key=lambda it: (-size(it, scale), it.order_id)):
+        best = None
+        for l in lorries:
+            v, w = free[l.slot]
+            if it.volume > v + 1e-9 or it.weight > w + 1e-9:
+                continue
+            other_has_route = it.route and any(it.route in routes[s] for s in routes if s != l.slot)
+            rank = (not (it.route and it.route in routes[l.slot]), bool(other_has_route),
+                    max((v - it.volume) / scale[0], (w - it.weight) / scale[1]), l.slot)
+            if best is None or rank < best[0]:
+                best = (rank, l.slot)
+        slot = best[1] if best else None
+        placement[it.order_id] = slot
+        if slot is not None:
+            free[slot][0] -= it.volume
+            free[slot][1] -= it.weight
+            if it.route:
+                routes[slot].add(it.route)
+    return placement
+
+def exact(items, lorries):
+    """Best placement by score(), exhaustive with pruning on the orders-placed bound."""
+    scale = _scale(lorries)
+    order = sorted(items, key=lambda it: (-size(it, scale), it.order_id))
+    slots = [l.slot for l in lorries]
+    free = {l.slot: [l.volume, l.weight] for l in lorries}
+    best = [None, None]
+    current = {}
+
+    def visit(i, placed):
+        if best[1] is not None and placed + len(order) - i < best[1][0]:
+            return
+        if i == len(order):
+            s = score(current, items, lorries)
+            if best[1] is None or s > best[1]:
+                best[0], best[1] = dict(current), s
+            return
+        it = order[i]
+        for slot in slots:
+            v, w = free[slot]
+            if it.volume <= v + 1e-9 and it.weight <= w + 1e-9:
+                free[slot][0] -= it.volume; free[slot][1] -= it.weight
+                current[it.order_id] = slot
+                visit(i + 1, placed + 1)
+                free[slot][0] += it.volume; free[slot][1] += it.weight
+        current[it.order_id] = None
+        visit(i + 1, placed)
+
+    visit(0, 0)
+    return best[0]
+
+def plan(items, lorries, previous=None):
+    """
+    {order_id: slot or None (waits for the next lorry)} for the ready `items`.
+    Entries of `previous` are kept while they still fit, in their order.
+    """
+    previous = previous or {}
+    free = {l.slot: [l.volume, l.weight] for l in lorries}
+    kept = {}
+    for it in items:
+        slot = previous.get(it.order_id)
+        if slot in free and it.volume <= free[slot][0] + 1e-9 and it.weight <= free[slot][1] + 1e-9:
+            free[slot][0] -= it.volume
+            free[slot][1] -= it.weight
+            kept[it.order_id] = slot
+    placement = greedy(items, lorries, kept)
+    if len(items) <= EXACT_LIMIT and None in placement.values():
+        best = exact(items, lorries)
+        if score(best, items, lorries) > score(placement, items, lorries):
+            return best
+    return placement
+
+def next_pair(placement, items, slot):
+    """
+    Up to two order ids to load next onto `slot`: the biggest planned order,
+    and with it the next one on the same route if there is one.
+    """
+    mine = [it for it in items if placement.get(it.order_id) == slot]
+    if not mine:
+        return []
+    scale = (max(it.volume for it in mine) or 1.0, max(it.weight for it in mine) or 1.0)
+    mine.sort(key=lambda it: (-size(it, scale), it.order_id))
+    first = mine[0]
+    partner = next((it for it in mine[1:] if it.route == first.route), None)
+    return [first.order_id] + ([partner.order_id] if partner else [])
@@ -0,0 +1,196 @@
+"""
+Station occupancy from order history: which orders were at a station, and
+in what state, between two moments.
+
+Every order_history row opens a span: the order is <status> at <station>
+from changed_at until the order's next history row (or until now, when
+there is none yet). A span overlaps [t1, t2] when it starts before t2 and
+ends after t1.
+
+The one exception is the hand-off to a transfer: finishing a machine job
+logs (machine, done) and (transfer, pending) together, but the order stays
+in the machine's Done lane until the transfer moves it. A 'pending' row at
+one of the `transfers` stations therefore doesn't end the span before it;
+the machine's done span ends at the transfer's own 'done' row.
+
+"Starts before t2" alone is an open-ended range, so the longest span that
+has ever closed at each station is kept in span_bounds, raised in the same
+transaction as the transition that closes it (extend()). A span that ended
+after t1 then started after t1 - that bound, and the overlap query is one
+range of idx_history_station_changed per station:
+
+    station = ? AND changed_at BETWEEN t1 - bound AND t2
+
+plus the spans still open, found from the orders at those stations now. The
+last step of the line ('done' at loading) is a point, not a span: the order
+has left.
+
+    python occupancy.py query edge3 --from "2026-10-13 10:00" --to "2026-10-13 11:30"
+    python occupancy.py rebuild
+"""
+import argparse, os, sqlite3
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_SPANS = 5000        # spans returned by one query, earliest first
+
+Span = namedtuple("Span", [
+    "order_id", "order_number", "station", "status",
+    "started_at",       # UTC
+    "ended_at",         # UTC, None while the order is still there
+])
+
+def create(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS span_bounds (
+        station TEXT PRIMARY KEY,
+        max_minutes REAL NOT NULL       -- longest closed span at the station
+    ) WITHOUT ROWID
+    """)
+
+def _moves(alias, transfers):
+    """SQL true for a history row that ends the span before it (not a hand-off to a transfer), and its parameters."""
+    if not transfers:
+        return "1", []
+    return (f"NOT ({alias}.status = 'pending' AND {alias}.station IN ({','.join('?' * len(transfers))}))",
+            list(transfers))
+
+def extend(c, pairs, at=None, transfers=()):
+    """
+    Raises the bounds for the spans about to be closed by logging `pairs`
+    ((order id, station, status)), in the caller's transaction. Call before
+    they are inserted; later pairs of the same order close spans of no length.
+    """
+    moves, params = _moves("k", transfers)
+    closing = [oid for oid, station, status in pairs if not (status == "pending" and station in transfers)]
+    for oid in dict.fromkeys(closing):
+        # The last row that ended a span, and any hand-off after it
+        c.execute(f"""
+            SELECT station, MAX((julianday(COALESCE(?, 'now')) - julianday(changed_at)) * 1440)
+            FROM order_history
+            WHERE order_id = ?
+              AND id >= COALESCE((SELECT MAX(id) FROM order_history k WHERE k.order_id = ? AND {moves}), 0)
+            GROUP BY station
+        """, (at, oid, oid, *params))
+        c.executemany("""
+            INSERT INTO span_bounds (station, max_minutes) VALUES (?, ?)
+            ON CONFLICT(station) DO UPDATE SET max_minutes = excluded.max_minutes
+            WHERE excluded.max_minutes > span_bounds.max_minutes
+        """, [(station, max(minutes, 0.0)) for station, minutes in c.fetchall() if minutes is not None])
+
+def extend_since(c, first_id, transfers=()):
+    """Raises the bounds for the spans closed by history rows from id first_id on, e.g. a bulk backfill."""
+    moves_k, params_k = _moves("k", transfers)
+    moves_r, params_r = _moves("r", transfers)
+    c.execute(f"""
+        INSERT INTO span_bounds (station, max_minutes)
+        SELECT p.station, MAX(MAX((julianday(r.changed_at) - julianday(p.changed_at)) * 1440, 0.0))
+        FROM order_history r
+        JOIN order_history p ON p.order_id = r.order_id AND p.id < r.id
+         AND p.id >= (SELECT MAX(id) FROM order_history k WHERE k.order_id = r.order_id AND k.id < r.id AND {moves_k})
+        WHERE r.id >= ? AND {moves_r}
+        GROUP BY p.station
+        ON CONFLICT(station) DO UPDATE SET max_minutes = excluded.max_minutes
+        WHERE excluded.max_minutes > span_bounds.max_minutes
+    """, (*params_k, first_id, *params_r))
+
+def rebuild(c, transfers=()):
+    """Recomputes span_bounds from the whole history, in the caller's transaction. Returns them."""
+    moves, params = _moves("h", transfers)
+    # A hand-off is never followed by another, so a span ends at the next row or the one after
+    c.execute(f"""
+        SELECT station, MAX((julianday(next_at) - julianday(changed_at)) * 1440)
+        FROM (SELECT station, changed_at,
+                     CASE WHEN LEAD(moves) OVER w THEN LEAD(changed_at) OVER w
+                          ELSE LEAD(changed_at, 2) OVER w END AS next_at
+              FROM (SELECT h.*, {moves} AS moves FROM order_history h)
+              WINDOW w AS (PARTITION BY order_id ORDER BY id))
+        WHERE next_at IS NOT NULL
+        GROUP BY station
+    """, params)
+    bounds = {station: max(minutes or 0.0, 0.0) for station, minutes in c.fetchall()}
+    c.execute("DELETE FROM span_bounds")
+    c.executemany("INSERT INTO span_bounds (station, max_minutes) VALUES (?, ?)", bounds.items())
+    return bounds
+
+def parse_time(text):
+    """'2026-10-13 10:00', '2026-10-13T10:00:30' or '2026-10-13' as TIME_FORMAT, ValueError if not a time."""
+    return datetime.fromisoformat(text.strip()).strftime(TIME_FORMAT)
+
+def _span_columns(final, transfers):
+    """A span from history row h (and its order o), and its parameters."""
+    moves, params = _moves("n", transfers)
+    return f"""
+        h.order_id, o.order_number, h.station, h.status, h.changed_at AS started_at,
+        CASE WHEN h.station = ? AND h.status = ? THEN h.changed_at
+             ELSE (SELECT n.changed_at FROM order_history n
+                   WHERE n.order_id = h.order_id AND n.id > h.id AND {moves} ORDER BY n.id LIMIT 1) END AS ended_at
+    """, [*final, *params]
+
+def query(c, stations, t1, t2, final=("loading", "done"), limit=MAX_SPANS, transfers=()):
+    """
+    Spans at any of `stations` overlapping [t1, t2] (UTC 'YYYY-MM-DD HH:MM:SS'),
+    earliest first, at most `limit`. final: the (station, status) an order
+    leaves the line with; transfers: the transfer stations (see above).
+    """
+    stations = list(stations)
+    if not stations or t2 < t1:
+        return []
+    marks = ",".join("?" * len(stations))
+    c.execute(f"SELECT MAX(max_minutes) FROM span_bounds WHERE station IN ({marks})", stations)
+    bound = c.fetchone()[0] or 0.0
+    lookback = (datetime.strptime(t1, TIME_FORMAT) - timedelta(minutes=bound)).strftime(TIME_FORMAT)
+    columns, column_params = _span_columns(final, transfers)
+    moves, moves_params = _moves("k", transfers)
+    c.execute(f"""
+        WITH spans AS MATERIALIZED (
+            SELECT {columns}
+            FROM order_history h LEFT JOIN orders o ON o.id = h.order_id
+            WHERE h.station IN ({marks}) AND h.changed_at BETWEEN ? AND ?
+            UNION ALL
+            -- Still open since before the lookback: orders at the stations now, by their last row
+            -- that wasn't a hand-off
+            SELECT {columns}
+            FROM orders o CROSS JOIN order_history h
+            WHERE o.current_station IN ({marks}) AND NOT (o.current_station = ? AND o.status = 'Done')
+              AND h.id = (SELECT MAX(id) FROM order_history k WHERE k.order_id = o.id AND {moves})
+              AND h.station = o.current_station AND h.changed_at < ?
+        )
+        SELECT * FROM spans
+        WHERE ended_at IS NULL OR ended_at >= ?
+        ORDER BY started_at, order_id
+        LIMIT ?
+    """, (*column_params, *stations, lookback, t2, *column_params, *stations, final[0], *moves_params,
+          lookback, t1, limit))
+    return [Span(*r) for r in c.fetchall()]
+
+def main():
+    p = argparse.ArgumentParser(description="Station occupancy from order history")
+    p.add_argument("command", choices=["query", "rebuild"])
+    p.add_argument("stations", nargs="*", help="station codes, e.g. edge3 (query)")
+    p.add_argument("--from", dest="date_from", help="UTC, e.g. 2026-10-13 10:00")
+    p.add_argument("--to", dest="date_to", help="UTC, default now")
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    a = p.parse_args()
+    from app import LOADING_STATION, TRANSFER_STATIONS
+    conn = sqlite3.connect(a.db, timeout=30); c = conn.cursor()
+    if a.command == "rebuild":
+        c.execute("BEGIN IMMEDIATE")
+        bounds = rebuild(c, TRANSFER_STATIONS)
+        conn.commit(); conn.close()
+        for station, minutes in sorted(bounds.items()):
+            print(f"  {station:12} {minutes:10.1f} min")
+        return
+    if not a.stations or not a.date_from:
+        p.error("query needs stations and --from")
+    t2 = parse_time(a.date_to) if a.date_to else datetime.utcnow().strftime(TIME_FORMAT)
+    spans = query(c, a.stations, parse_time(a.date_from), t2, final=(LOADING_STATION, "done"),
+                  transfers=TRANSFER_STATIONS)
+    conn.close()
+    for s in spans:
+        print(f"  {s.order_number or s.order_id:14} {s.station:10} {s.status:12} {s.started_at} -> {s.ended_at or 'now'}")
+    print(f"{len(spans)} span(s)")
+
+if __name__ == "__main__":
+    main()
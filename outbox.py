@@ -0,0 +1,205 @@
+"""
+Transactional outbox for ERP notifications: cnc_finished, wrapping_finished
+and lorry_completed.
+
+Station routes call enqueue() / enqueue_order() with the cursor of the
+transaction that changes the order or lorry, so a notification exists if and
+only if the change was committed. Nothing is sent in the operator's request:
+a Dispatcher polls the table, and it
+
+- takes up to batch_size due messages and leases them for LEASE_SECONDS, so
+  several dispatchers (workers, a standalone process) don't send the same rows
+- collapses messages with the same key into one (e.g. a double-submitted finish)
+- hands the batch to a sink in one call, and marks it delivered only after
+  the sink returns: delivery is at-least-once, receivers dedupe on "key"
+- on failure retries with exponential backoff and jitter, up to MAX_BACKOFF
+
+Sinks are any object with send(messages); see WebhookSink, FileSink and
+QueueSink, or sink_from_spec() for "http://...", "file:path" and "queue".
+
+    python outbox.py run --sink http://erp.local/hooks/production
+    python outbox.py stats
+"""
+import argparse, json, os, queue, random, sqlite3, threading, time
+import urllib.request
+
+BATCH_SIZE = 100
+POLL_SECONDS = 0.5
+LEASE_SECONDS = 30
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+
+# outbox timestamps are unix seconds (REAL), for sub-second lag and backoff
+def enqueue(c, topic, key, payload):
+    now = time.time()
+    c.execute("INSERT INTO outbox (topic, key, payload, created_at, next_attempt_at) VALUES (?,?,?,?,?)",
+              (topic, key, json.dumps(payload), now, now))
+
+def enqueue_order(c, topic, order_id):
+    """Notification with the order as it is in this transaction, keyed topic:order id."""
+    now = time.time()
+    c.execute("""
+        INSERT INTO outbox (topic, key, payload, created_at, next_attempt_at)
+        SELECT ?, ? || ':' || id,
+               json_object('order_id', id, 'order_number', order_number, 'station', current_station,
+                           'status', status, 'finished_at', finished_at),
+               ?, ?
+        FROM orders WHERE id=?
+    """, (topic, topic, now, now, order_id))
+
+# ----- sinks -----
+class WebhookSink:
+    """POSTs {"messages": [...]} as JSON, any 2xx is success."""
+    def __init__(self, url, timeout=10.0):
+        self.url, self.timeout = url, timeout
+    def send(self, messages):
+        body = json.dumps({"messages": messages}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+class FileSink:
+    """Appends one JSON line per message."""
+    def __init__(self, path):
+        self.path = path
+    def send(self, messages):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for m in messages:
+                f.write(json.dumps(m) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class QueueSink:
+    """Puts each message on a queue.Queue, for an in-process consumer."""
+    def __init__(self, q=None):
+        self.queue = q if q is not None else queue.Queue()
+    def send(self, messages):
+        for m in messages:
+            self.queue.put(m)
+
+def sink_from_spec(spec):
+    if spec.startswith(("http://", "https://")):
+        return WebhookSink(spec)
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec == "queue":
+        return QueueSink()
+    raise ValueError(f"unknown outbox sink {spec!r}, expected http(s)://..., file:path or queue")
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, with +-50% jitter."""
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+# ----- dispatcher -----
+class Dispatcher:
+    def __init__(self, db_path, sink, batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS):
+        self.db_path, self.sink = db_path, sink
+        self.batch_size, self.poll_seconds = batch_size, poll_seconds
+        self.delivered = 0
+        self.failures = 0
+        self.lags = []          # seconds from enqueue to delivery, last 10k
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim(self, conn):
+        """Due messages, leased to this dispatcher."""
+        now = time.time()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            SELECT id, topic, key, payload, created_at, attempts FROM outbox
+            WHERE delivered_at IS NULL AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id LIMIT ?
+        """, (now, self.batch_size))
+        rows = c.fetchall()
+        if rows:
+            c.executemany("UPDATE outbox SET next_attempt_at=? WHERE id=?",
+                          [(now + LEASE_SECONDS, r[0]) for r in rows])
+        conn.commit()
+        return rows
+
+    def run_once(self):
+        """Sends one batch. Returns how many outbox rows it settled (0 = idle or failed)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            rows = self.claim(conn)
+            if not rows:
+                return 0
+            latest = {}
+            for r in rows:
+                latest[r[2]] = r        # same key: keep the newest
+            messages = [{"id": r[0], "topic": r[1], "key": r[2], "payload": json.loads(r[3]),
+                         "created_at": r[4]} for r in sorted(latest.values())]
+            try:
+                self.sink.send(messages)
+            except Exception as e:
+                self.failures += 1
+                now = time.time()
+                conn.executemany("UPDATE outbox SET attempts=attempts+1, next_attempt_at=?, last_error=? WHERE id=?",
+                                 [(now + backoff(r[5] + 1), str(e)[:500], r[0]) for r in rows])
+                conn.commit()
+                return 0
+            now = time.time()
+            conn.executemany("UPDATE outbox SET delivered_at=? WHERE id=?", [(now, r[0]) for r in rows])
+            conn.commit()
+            self.delivered += len(rows)
+            self.lags.extend(now - r[4] for r in rows)
+            del self.lags[:-10000]
+            return len(rows)
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except sqlite3.Error:
+                busy = 0
+            if not busy:
+                self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+def stats(conn, now=None):
+    """Pending, retrying and delivered counts, age of the oldest pending message in seconds."""
+    now = now or time.time()
+    pending, retrying, oldest = conn.execute("""
+        SELECT COUNT(*), SUM(attempts > 0), MIN(created_at) FROM outbox WHERE delivered_at IS NULL
+    """).fetchone()
+    delivered, avg_lag = conn.execute(
+        "SELECT COUNT(*), AVG(delivered_at - created_at) FROM outbox WHERE delivered_at IS NOT NULL"
+    ).fetchone()
+    return {"pending": pending, "retrying": retrying or 0, "delivered": delivered,
+            "oldest_pending_seconds": now - oldest if oldest else None, "avg_lag_seconds": avg_lag}
+
+def main():
+    p = argparse.ArgumentParser(description="ERP outbox dispatcher")
+    p.add_argument("command", choices=["run", "stats"])
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    p.add_argument("--sink", default=os.getenv("OUTBOX_SINK"), help="http(s)://url, file:path or queue")
+    a = p.parse_args()
+    if a.command == "stats":
+        conn = sqlite3.connect(a.db)
+        print(json.dumps(stats(conn), indent=2))
+        conn.close()
+        return
+    if not a.sink:
+        p.error("--sink (or OUTBOX_SINK) is required")
+    d = Dispatcher(a.db, sink_from_spec(a.sink))
+    try:
+        d.run()
+    except KeyboardInterrupt:
+        pass
+    print(f"delivered {d.delivered}, failed batches {d.failures}")
+
+if __name__ == "__main__":
+    main()
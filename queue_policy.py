@@ -0,0 +1,70 @@
+"""
+Queue disciplines for station lanes.
+
+A lane is the set of orders waiting at one machine: Pending jobs at a CNC or
+edge bander, or Done jobs waiting for Tramming 1/2 to move them on. The policy
+decides which job is "first" in the lane, which is the only one an operator
+may start or move.
+
+Every policy exists twice, as an SQL ORDER BY (used by the station routes,
+backed by an idx_orders_lane_* index per policy in use, see index_columns())
+and as a Python sort key over plain dicts (used by the simulators), so both
+always agree on the order.
+"""
+
+# Policy name -> (label, ORDER BY template). {arrival} is the column that
+# holds the time the job entered the lane: queued_at for Pending lanes,
+# finished_at for Done lanes.
+QUEUE_POLICIES = {
+    "fifo":     ("First in, first out",
+                 "{arrival} ASC, id ASC"),
+    "priority": ("Highest priority first",
+                 "priority DESC, {arrival} ASC, id ASC"),
+    "edd":      ("Earliest due date first",
+                 "due_at IS NULL, due_at ASC, {arrival} ASC, id ASC"),
+    "spt":      ("Shortest processing time first",
+                 "est_minutes IS NULL, est_minutes ASC, {arrival} ASC, id ASC"),
+}
+
+DEFAULT_POLICY = "fifo"
+
+# Order priorities shown at Preparing, higher goes first under "priority"
+PRIORITIES = [
+    (0, "Normal"),
+    (1, "High"),
+    (2, "Rush"),
+]
+
+def policy_names():
+    return list(QUEUE_POLICIES)
+
+def order_by(policy, arrival="queued_at"):
+    """ORDER BY clause for a lane. Unknown policies fall back to FIFO."""
+    _, template = QUEUE_POLICIES.get(policy) or QUEUE_POLICIES[DEFAULT_POLICY]
+    return template.format(arrival=arrival)
+
+def index_columns(policy, arrival="queued_at"):
+    """
+    Columns of the lane index that serves order_by() as an index walk, after
+    (current_station, status): its terms without the final id, which every
+    index holds anyway.
+    """
+    return order_by(policy, arrival).replace(" ASC", "").rsplit(", id", 1)[0]
+
+def sort_key(policy, arrival="queued_at"):
+    """
+    Python equivalent of order_by() for dicts with the same keys as the
+    orders columns. Missing due dates / estimates sort last, like the SQL.
+    """
+    def fifo(j):
+        return (j[arrival], j["id"])
+    def priority(j):
+        return (-(j.get("priority") or 0), j[arrival], j["id"])
+    def edd(j):
+        due = j.get("due_at")
+        return (due is None, due or 0, j[arrival], j["id"])
+    def spt(j):
+        est = j.get("est_minutes")
+        return (est is None, est or 0, j[arrival], j["id"])
+    keys = {"fifo": fifo, "priority": priority, "edd": edd, "spt": spt}
+    return keys.get(policy, fifo)
@@ -0,0 +1,81 @@
+"""
+Read-only database connections for the pages that only read.
+
+The manager board, the cross-line board, the APIs and the exports open the
+database as file:<path>?mode=ro with PRAGMA query_only, so they can never
+take the write lock. Under WAL a reader doesn't wait for writers and a
+writer doesn't wait for readers: a heavy board render can't delay a station
+click, and a bug in a read-only page can't write.
+
+Connections are kept in a small pool per database file (pool(path)). A pooled
+connection's close() ends its read transaction and puts it back, so a view
+uses it like any other connection:
+
+    conn = pool(path).get()
+    conn.execute("BEGIN")       # optional: everything read until close() is one snapshot
+    ...
+    conn.close()
+"""
+import os, queue, sqlite3, threading, urllib.request
+
+import tracing
+
+POOL_SIZE = 8       # idle connections kept per database file
+TIMEOUT = 30
+
+def uri(path):
+    return "file:" + urllib.request.pathname2url(os.path.abspath(path)) + "?mode=ro"
+
+def connect(path, factory=sqlite3.Connection):
+    """A new read-only connection, not pooled (e.g. for a streamed export that outlives its request)."""
+    conn = sqlite3.connect(uri(path), uri=True, timeout=TIMEOUT, factory=factory, check_same_thread=False)
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+class PooledConnection(tracing.TracedConnection):
+    pool = None
+
+    def close(self):
+        if self.pool is None or not self.pool.put(self):
+            super().close()
+
+class ReadPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(size)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path, PooledConnection)
+            conn.pool = self
+            return conn
+
+    def put(self, conn):
+        """Back to the idle list after ending its transaction; False when the pool is full or it is broken."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            self._idle.put_nowait(conn)
+            return True
+        except (queue.Full, sqlite3.Error):
+            return False
+
+    def clear(self):
+        while True:
+            try:
+                sqlite3.Connection.close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def pool(path):
+    """The read pool of a database file, created on first use."""
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ReadPool(path)
+        return _pools[path]
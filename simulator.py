@@ -0,0 +1,381 @@
+"""
+Discrete-event simulator of the line for capacity what-ifs.
+
+Models the same flow and rules as the station routes in app.py:
+
+    Preparing -> CNC -> Tramming 1 -> Edge -> Tramming 2 -> Wrapping -> Loading
+
+- Preparing releases an order onto a CNC whose Pending queue has room,
+  and waits when every CNC is full.
+- CNCs and edge banders run one job at a time from their Pending queue;
+  finished jobs wait in the machine's Done lane.
+- Tramming 1 moves the oldest finished CNC job to an edge bander with room
+  (jobs in transit count), Tramming 2 moves the oldest finished edge job
+  into a free wrapping slot.
+- Loading loads a batch of the wrapped orders that fit on one of the two
+  lorries together, oldest first: up to the lorry capacity in orders and
+  within the lorry's free volume and weight (LORRY_VOLUME_M3,
+  LORRY_WEIGHT_KG), onto the fuller lorry they fit on. A lorry leaves once
+  full (the lorry capacity in orders, or LORRY_FULL_FRACTION of its volume
+  or weight), or when nothing waiting fits on either lorry, and is replaced
+  after a swap time.
+
+The lane capacities, slots and lorry capacity are the line settings in
+force in the database (line_config.py, as set on the admin page), or
+app.py's defaults without one, unless overridden on the command line.
+
+Service times are lognormal, fitted per station group from the
+in_progress -> done spans in order_history (fit_cycle_times), with
+DEFAULT_CYCLES for groups without enough history; a loading batch takes a
+draw per order. Order volumes and weights are drawn from the latest orders
+in the database (fit_order_sizes), an order without them counting as an
+equal share of a lorry as on the Loading screen. Replications run in a
+process pool.
+
+    python simulator.py --db orders.db --shifts 1000 --cnc 4 --lorry-capacity 14
+"""
+import argparse, heapq, math, os, random, sqlite3, time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import app as line
+from line_config import load as load_settings
+
+SHIFT_MINUTES = 8 * 60
+
+GROUPS = ["preparing", "cnc", "tramming1", "edge", "tramming2", "wrapping", "loading"]
+
+# Lognormal (median minutes, sigma) used when a group has too little history
+DEFAULT_CYCLES = {
+    "preparing":  (4.0, 0.3),
+    "cnc":        (12.0, 0.4),
+    "tramming1":  (2.0, 0.3),
+    "edge":       (9.0, 0.4),
+    "tramming2":  (2.0, 0.3),
+    "wrapping":   (6.0, 0.3),
+    "loading":    (3.0, 0.3),
+    "lorry_swap": (20.0, 0.2),
+}
+MIN_SAMPLES = 5
+SIZE_SAMPLES = 2000     # latest orders whose volume and weight are drawn from
+
+def station_group(station):
+    for group, machines in line.AREA_GROUPS.items():
+        if station in machines:
+            return group
+    return station
+
+def fit_cycle_times(db_path):
+    """
+    Lognormal (mu, sigma) per station group from order_history.
+    Only groups with at least MIN_SAMPLES spans are returned.
+    """
+    conn = sqlite3.connect(db_path); c = conn.cursor()
+    # A loading batch is started and finished together: its span is shared by its orders
+    c.execute("""
+        SELECT d.station, (julianday(d.changed_at) - julianday(s.changed_at)) * 1440
+               / CASE WHEN d.station = 'loading' AND o.batch_id IS NOT NULL
+                      THEN (SELECT COUNT(*) FROM orders b WHERE b.batch_id = o.batch_id) ELSE 1 END
+        FROM order_history d
+        JOIN order_history s
+          ON s.order_id = d.order_id AND s.station = d.station AND s.status = 'in_progress'
+        LEFT JOIN orders o ON o.id = d.order_id
+        WHERE d.status = 'done'
+    """)
+    samples = {}
+    for station, minutes in c.fetchall():
+        if minutes and minutes > 0:
+            samples.setdefault(station_group(station), []).append(math.log(minutes))
+    conn.close()
+    fitted = {}
+    for group, logs in samples.items():
+        if len(logs) < MIN_SAMPLES:
+            continue
+        mu = sum(logs) / len(logs)
+        sigma = math.sqrt(sum((x - mu) ** 2 for x in logs) / (len(logs) - 1))
+        fitted[group] = (mu, sigma)
+    return fitted
+
+def fit_order_sizes(db_path):
+    """(volume m³, weight kg) of the latest SIZE_SAMPLES orders, None where not known."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT volume_m3, weight_kg FROM orders ORDER BY id DESC LIMIT ?",
+                            (SIZE_SAMPLES,)).fetchall()
+    finally:
+        conn.close()
+
+def stored_settings(db_path):
+    """The line settings in force in a database (line_config.Settings), None without any."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return load_settings(conn.cursor())
+    except sqlite3.OperationalError:     # no line_config table yet
+        return None
+    finally:
+        conn.close()
+
+def line_config(cnc=None, prep_capacity=None, edge_capacity=None, wrap_slots=None, lorry_capacity=None,
+                settings=None):
+    """
+    Line layout: `settings` (stored_settings()) or app.py's defaults,
+    unless overridden. cnc may be a machine count, e.g. 4 adds a cnc4 with
+    the fitted CNC cycle time and the largest CNC lane; prep_capacity sets
+    every CNC's lane.
+    """
+    capacity = {**line.CNC_CAPACITY, **line.EDGE_CAPACITY, **(settings.capacity if settings else {})}
+    if isinstance(cnc, int):
+        cnc = [f"cnc{i}" for i in range(1, cnc + 1)]
+    cnc = list(cnc or line.CNC_STATIONS)
+    if isinstance(wrap_slots, int):
+        wrap_slots = list(range(1, wrap_slots + 1))
+    if not wrap_slots and settings and line.WRAPPING_STATION in settings.slots:
+        wrap_slots = list(range(1, settings.slots[line.WRAPPING_STATION] + 1))
+    largest = max(capacity[m] for m in line.CNC_STATIONS)
+    return {
+        "cnc": cnc,
+        "cnc_capacity": {m: prep_capacity or capacity.get(m, largest) for m in cnc},
+        "edge_capacity": dict(edge_capacity or {m: capacity[m] for m in line.EDGE_STATIONS}),
+        "wrap_slots": list(wrap_slots or line.WRAP_SLOTS),
+        "lorry_capacity": lorry_capacity or (settings.lorry_capacity if settings else line.LORRY_CAPACITY),
+    }
+
+def simulate_shift(cfg, cycles, seed, minutes=SHIFT_MINUTES, sizes=()):
+    """One shift from an empty line. sizes: fit_order_sizes(). Returns a dict of metrics."""
+    rnd = random.Random(seed)
+    params = {g: cycles.get(g) or (math.log(m), s) for g, (m, s) in DEFAULT_CYCLES.items()}
+    def draw(group):
+        mu, sigma = params[group]
+        return rnd.lognormvariate(mu, sigma)
+
+    capacity, max_volume, max_weight = cfg["lorry_capacity"], line.LORRY_VOLUME_M3, line.LORRY_WEIGHT_KG
+    def draw_size():
+        volume, weight = rnd.choice(sizes) if sizes else (None, None)
+        return (max_volume / capacity if volume is None else volume,
+                max_weight / capacity if weight is None else weight)
+
+    cncs, edge_cap = cfg["cnc"], cfg["edge_capacity"]
+    edges = list(edge_cap)
+    machines = cncs + edges
+    pending = {m: deque() for m in machines}
+    finished = {m: deque() for m in machines}     # (finished at, released at)
+    reserved = {m: 0 for m in machines}           # jobs on their way into the queue
+    running = {m: False for m in machines}
+    servers = {"preparing": 1, "cnc": len(cncs), "tramming1": 1, "edge": len(edges),
+               "tramming2": 1, "wrapping": len(cfg["wrap_slots"]), "loading": 1}
+    busy_time = dict.fromkeys(servers, 0.0)
+    idle = {"preparing": True, "tramming1": True, "tramming2": True, "loading": True}
+    wrap_free = len(cfg["wrap_slots"])
+    ready = []                                    # (released at, volume, weight), oldest first
+    lorries = [{"count": 0, "loading": 0, "volume": 0.0, "weight": 0.0, "opened": 0.0, "open": True}
+               for _ in range(2)]
+    fill_times, flow_times = [], []
+    events, seq = [], 0
+    clock, wip, wip_area, shipped = 0.0, 0, 0.0, 0
+
+    def schedule(group, duration, kind, *args):
+        nonlocal seq
+        busy_time[group] += min(clock + duration, minutes) - min(clock, minutes)
+        seq += 1
+        heapq.heappush(events, (clock + duration, seq, kind, args))
+
+    def oldest_finished(lanes):
+        heads = [(finished[m][0][0], m) for m in lanes if finished[m]]
+        return min(heads)[1] if heads else None
+
+    def fitting(lorry):
+        """The ready jobs that fit on the lorry together, oldest first."""
+        room = capacity - lorry["count"] - lorry["loading"]
+        volume, weight, batch = lorry["volume"], lorry["weight"], []
+        for job in ready:
+            if len(batch) == room:
+                break
+            if volume + job[1] <= max_volume and weight + job[2] <= max_weight:
+                batch.append(job); volume += job[1]; weight += job[2]
+        return batch
+
+    def full(lorry):
+        return (lorry["count"] >= capacity or lorry["volume"] >= line.LORRY_FULL_FRACTION * max_volume
+                or lorry["weight"] >= line.LORRY_FULL_FRACTION * max_weight)
+
+    def leave(lorry):
+        nonlocal seq
+        fill_times.append(clock - lorry["opened"])
+        lorry["open"] = False
+        seq += 1
+        heapq.heappush(events, (clock + draw("lorry_swap"), seq, "lorry_back", (lorry,)))
+
+    def dispatch():
+        nonlocal wrap_free
+        if idle["preparing"] and clock < minutes:
+            open_cncs = [m for m in cncs if len(pending[m]) + reserved[m] < cfg["cnc_capacity"][m]]
+            if open_cncs:
+                m = min(open_cncs, key=lambda x: len(pending[x]) + reserved[x] + running[x])
+                reserved[m] += 1; idle["preparing"] = False
+                schedule("preparing", draw("preparing"), "released", m)
+        for m in machines:
+            if not running[m] and pending[m]:
+                running[m] = True
+                schedule("cnc" if m in cncs else "edge", draw("cnc" if m in cncs else "edge"),
+                         "machined", m, pending[m].popleft())
+        if idle["tramming1"]:
+            src = oldest_finished(cncs)
+            room = [e for e in edges if len(pending[e]) + reserved[e] < edge_cap[e]]
+            if src and room:
+                e = min(room, key=lambda x: len(pending[x]) + reserved[x] + running[x])
+                reserved[e] += 1; idle["tramming1"] = False
+                schedule("tramming1", draw("tramming1"), "to_edge", e, finished[src].popleft()[1])
+        if idle["tramming2"] and wrap_free:
+            src = oldest_finished(edges)
+            if src:
+                wrap_free -= 1; idle["tramming2"] = False
+                move = draw("tramming2")
+                busy_time["wrapping"] += min(clock + move, minutes) - min(clock, minutes)
+                schedule("tramming2", move, "to_wrap", finished[src].popleft()[1])
+        if idle["loading"] and ready:
+            open_lorries = sorted((l for l in lorries if l["open"]), key=lambda l: -l["volume"])
+            for lorry in open_lorries:
+                batch = fitting(lorry)
+                if batch:
+                    for job in batch:
+                        ready.remove(job)
+                    lorry["loading"] += len(batch); idle["loading"] = False
+                    lorry["volume"] += sum(job[1] for job in batch)
+                    lorry["weight"] += sum(job[2] for job in batch)
+                    schedule("loading", sum(draw("loading") for _ in batch), "loaded", lorry, batch)
+                    break
+            else:
+                # Nothing waiting fits: the fuller lorry is completed as it is
+                loaded = [l for l in open_lorries if l["count"]]
+                if loaded:
+                    leave(loaded[0])
+
+    dispatch()
+    while events and events[0][0] <= minutes:
+        t, _, kind, args = heapq.heappop(events)
+        wip_area += wip * (t - clock)
+        clock = t
+        if kind == "released":
+            (m,) = args
+            reserved[m] -= 1; pending[m].append(clock)
+            idle["preparing"] = True; wip += 1
+        elif kind == "machined":
+            m, job = args
+            running[m] = False; finished[m].append((clock, job))
+        elif kind == "to_edge":
+            e, job = args
+            reserved[e] -= 1; pending[e].append(job)
+            idle["tramming1"] = True
+        elif kind == "to_wrap":
+            (job,) = args
+            idle["tramming2"] = True
+            schedule("wrapping", draw("wrapping"), "wrapped", job)
+        elif kind == "wrapped":
+            (job,) = args
+            wrap_free += 1; ready.append((job, *draw_size()))
+        elif kind == "loaded":
+            lorry, batch = args
+            idle["loading"] = True
+            lorry["loading"] -= len(batch); lorry["count"] += len(batch)
+            wip -= len(batch); shipped += len(batch)
+            flow_times.extend(clock - job[0] for job in batch)
+            if full(lorry):
+                leave(lorry)
+        elif kind == "lorry_back":
+            (lorry,) = args
+            lorry.update(count=0, volume=0.0, weight=0.0, opened=clock, open=True)
+        dispatch()
+    wip_area += wip * (minutes - clock)
+
+    util = {g: busy_time[g] / (servers[g] * minutes) for g in servers if servers[g]}
+    return {
+        "throughput": shipped,
+        "wip": wip_area / minutes,
+        "flow_minutes": (sum(flow_times) / len(flow_times)) if flow_times else None,
+        "utilisation": util,
+        "bottleneck": max(util, key=util.get),
+        "lorries": len(fill_times),
+        "lorry_fill_minutes": fill_times,
+    }
+
+def _run_chunk(args):
+    cfg, cycles, seeds, minutes, sizes = args
+    return [simulate_shift(cfg, cycles, s, minutes, sizes) for s in seeds]
+
+def percentile(values, q):
+    vals = sorted(values)
+    return vals[min(len(vals) - 1, int(q * len(vals)))] if vals else None
+
+def run(cfg, cycles, shifts=1000, seed=0, minutes=SHIFT_MINUTES, workers=None, sizes=()):
+    """Monte Carlo over `shifts` independent shifts, spread over a process pool."""
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + shifts))
+    chunks = [(cfg, cycles, seeds[i::workers], minutes, sizes) for i in range(workers)]
+    if workers == 1:
+        results = _run_chunk(chunks[0])
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = [r for chunk in pool.map(_run_chunk, chunks) for r in chunk]
+    tput = [r["throughput"] for r in results]
+    fills = [f for r in results for f in r["lorry_fill_minutes"]]
+    flows = [r["flow_minutes"] for r in results if r["flow_minutes"] is not None]
+    return {
+        "shifts": len(results),
+        "throughput_mean": sum(tput) / len(tput),
+        "throughput_p10": percentile(tput, 0.10),
+        "throughput_p90": percentile(tput, 0.90),
+        "wip_mean": sum(r["wip"] for r in results) / len(results),
+        "flow_minutes": (sum(flows) / len(flows)) if flows else None,
+        "utilisation": {g: sum(r["utilisation"][g] for r in results) / len(results)
+                        for g in results[0]["utilisation"]},
+        "bottlenecks": Counter(r["bottleneck"] for r in results),
+        "lorries_per_shift": sum(r["lorries"] for r in results) / len(results),
+        "lorry_fill_minutes": (sum(fills) / len(fills)) if fills else None,
+    }
+
+def report(cfg, summary, elapsed):
+    print(f"Line: {len(cfg['cnc'])} CNC (queue {cfg['cnc_capacity']}), "
+          f"edge {cfg['edge_capacity']}, {len(cfg['wrap_slots'])} wrap slots, lorry {cfg['lorry_capacity']}")
+    print(f"{summary['shifts']} shifts in {elapsed:.1f} s")
+    print(f"  throughput   {summary['throughput_mean']:.1f} orders/shift "
+          f"(p10 {summary['throughput_p10']}, p90 {summary['throughput_p90']})")
+    print(f"  WIP          {summary['wip_mean']:.1f} orders on average")
+    if summary["flow_minutes"] is not None:
+        print(f"  lead time    {summary['flow_minutes']:.0f} min preparing -> loaded")
+    fill = summary["lorry_fill_minutes"]
+    print(f"  lorries      {summary['lorries_per_shift']:.2f}/shift, "
+          f"fill time {'%.0f min' % fill if fill is not None else '—'}")
+    print("  utilisation  " + ", ".join(f"{g} {u:.0%}" for g, u in summary["utilisation"].items()))
+    print("  bottleneck   " + ", ".join(f"{g} ({n / summary['shifts']:.0%})"
+                                        for g, n in summary["bottlenecks"].most_common()))
+
+def main():
+    p = argparse.ArgumentParser(description="Monte Carlo what-ifs for the production line")
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"), help="fit cycle times and read the line settings from this database")
+    p.add_argument("--shifts", type=int, default=1000)
+    p.add_argument("--minutes", type=float, default=SHIFT_MINUTES)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--cnc", type=int, help="number of CNC machines")
+    p.add_argument("--prep-capacity", type=int, help="Pending queue per CNC")
+    p.add_argument("--edge", help="edge capacities, e.g. edge1=5,edge2=4,edge3=3,edge4=3,edge5=3")
+    p.add_argument("--wrap-slots", type=int)
+    p.add_argument("--lorry-capacity", type=int)
+    a = p.parse_args()
+
+    edge = None
+    if a.edge:
+        edge = {k.strip(): int(v) for k, v in (pair.split("=") for pair in a.edge.split(","))}
+    settings = stored_settings(a.db) if os.path.exists(a.db) else None
+    cfg = line_config(a.cnc, a.prep_capacity, edge, a.wrap_slots, a.lorry_capacity, settings)
+    cycles = fit_cycle_times(a.db) if os.path.exists(a.db) else {}
+    sizes = fit_order_sizes(a.db) if os.path.exists(a.db) else []
+    print("Cycle times: " + ", ".join(
+        f"{g} {math.exp(cycles[g][0]) if g in cycles else DEFAULT_CYCLES[g][0]:.1f} min"
+        f"{'' if g in cycles else ' (default)'}" for g in GROUPS))
+    t0 = time.perf_counter()
+    summary = run(cfg, cycles, a.shifts, a.seed, a.minutes, a.workers, sizes)
+    report(cfg, summary, time.perf_counter() - t0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Weekly staffing optimiser.
+
+Each weekday is an assignment problem between stations and employees, solved
+exactly with the Hungarian algorithm (shortest augmenting paths with
+potentials, O(n^2 m)). The costs are:
+
+    full training      COST_FULL
+    partial training   COST_PARTIAL
+    left unstaffed     COST_EMPTY      (one dummy column per station)
+    not trained        never assigned
+
+plus SPREAD_COST for every other day of the week the same person already
+works that station, so cross-training is spread out over the week. The
+penalty is kept below the full/partial gap, so it never trades a fully
+trained operator for a partially trained one.
+
+Pinned cells are kept as they are and take their employee out of that day's
+pool. Absent employees are left out for the day. Days only depend on each
+other through the spread penalty, so one changed cell or absence re-solves a
+single day (StaffingProblem.resolve_day).
+"""
+
+COST_FULL = 0.0
+COST_PARTIAL = 10.0
+COST_EMPTY = 100.0
+SPREAD_COST = 1.0
+FORBIDDEN = float("inf")
+
+def hungarian(cost):
+    """
+    Minimum-cost assignment of every row to a distinct column, len(rows) <= len(cols).
+    Returns the column index for each row.
+    """
+    n, m = len(cost), len(cost[0])
+    INF = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)        # p[j] = row matched to column j (1-based), 0 = free
+    way = [0] * (m + 1)
+    cols = range(1, m + 1)
+    # Warm start: row minima as potentials, then match each row to a free
+    # cheapest column. Matched edges are tight, so only the rows that lost
+    # out need an augmenting path search.
+    unmatched = []
+    for i in range(1, n + 1):
+        row = cost[i - 1]
+        u[i] = best = min(row)
+        for j in cols:
+            if row[j - 1] == best and not p[j]:
+                p[j] = i
+                break
+        else:
+            unmatched.append(i)
+    for i in unmatched:
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta, j1 = INF, 0
+            for j in cols:
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            if delta == INF:
+                raise ValueError("no feasible assignment")
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    match = [0] * n
+    for j in cols:
+        if p[j]:
+            match[p[j] - 1] = j - 1
+    return match
+
+class StaffingProblem:
+    """
+    stations: station codes; employees: employee keys; days: day codes.
+    training: {employee: {station: 'full' | 'partial' | 'not_trained'}}
+    pins: {(station, day): employee}; absent: {(employee, day)}
+    """
+    def __init__(self, stations, employees, days, training, pins=None, absent=None):
+        self.stations = list(stations)
+        self.employees = list(employees)
+        self.days = list(days)
+        self.training = training
+        self.pins = dict(pins or {})
+        self.absent = set(absent or ())
+        level = {"full": COST_FULL, "partial": COST_PARTIAL}
+        self.base = [[level.get(training.get(e, {}).get(st), FORBIDDEN) for e in self.employees]
+                     for st in self.stations]
+
+    def conflicts(self):
+        """Pins that put one person on two stations, or on a day they are absent."""
+        seen, problems = {}, []
+        for (st, day), emp in sorted(self.pins.items()):
+            if (emp, day) in self.absent:
+                problems.append(f"{emp} is pinned to {st} on {day} but absent")
+            if (emp, day) in seen:
+                problems.append(f"{emp} is pinned to {seen[(emp, day)]} and {st} on {day}")
+            seen[(emp, day)] = st
+        return problems
+
+    def resolve_day(self, plan, day):
+        """
+        Re-solve one day, keeping the rest of `plan` ({(station, day): employee})
+        as context for the spread penalty. Returns a new plan.
+        """
+        pinned = {st: emp for (st, d), emp in self.pins.items() if d == day}
+        busy = set(pinned.values())
+        rows = [i for i, st in enumerate(self.stations) if st not in pinned]
+        cols = [j for j, e in enumerate(self.employees)
+                if e not in busy and (e, day) not in self.absent]
+        repeats = {}
+        for (st, d), emp in plan.items():
+            if d != day and emp:
+                repeats[(st, emp)] = repeats.get((st, emp), 0) + 1
+
+        new_plan = {k: v for k, v in plan.items() if k[1] != day}
+        for st, emp in pinned.items():
+            new_plan[(st, day)] = emp
+        if not rows:
+            return new_plan
+
+        # Dummy "nobody" column per row keeps the problem feasible
+        width = len(cols) + len(rows)
+        cost = []
+        for i in rows:
+            st = self.stations[i]
+            base = self.base[i]
+            row = [base[j] + SPREAD_COST * repeats.get((st, self.employees[j]), 0) for j in cols]
+            row += [COST_EMPTY] * len(rows)
+            cost.append([c if c != FORBIDDEN else COST_EMPTY * width for c in row])
+        for r, c in zip(rows, hungarian(cost)):
+            st = self.stations[r]
+            if c < len(cols) and self.base[r][cols[c]] != FORBIDDEN:
+                new_plan[(st, day)] = self.employees[cols[c]]
+        return new_plan
+
+    def solve_week(self, plan=None, passes=2):
+        """
+        Solve every day. Later passes re-solve each day against the others,
+        so the spread penalty sees the whole week.
+        """
+        plan = dict(plan or {})
+        for _ in range(passes):
+            for day in self.days:
+                plan = self.resolve_day(plan, day)
+        return plan
+
+    def score(self, plan):
+        """(fully trained cells, partially trained cells, empty cells)."""
+        full = partial = 0
+        for (st, day), emp in plan.items():
+            status = self.training.get(emp, {}).get(st)
+            full += status == "full"
+            partial += status == "partial"
+        cells = len(self.stations) * len(self.days)
+        return full, partial, cells - full - partial
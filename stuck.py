@@ -0,0 +1,188 @@
+"""
+Stuck-order scanner.
+
+Every SCAN_SECONDS the scanner looks at each lane, i.e. (station, status),
+for orders that have been in it longer than the lane's threshold:
+
+    Pending       since queued_at     the station's "wait"
+    In progress   since started_at    the station's "cycle"
+    Done          since finished_at   the next stage's "wait" (e.g. CNC done -> Tramming 1)
+
+A threshold is FACTOR x the p90 in station_stats (the machine's own once it
+has MIN_SAMPLES, else its group's), at least MIN_MINUTES, DEFAULT_MINUTES
+while nothing has been measured. Each lane is one range query on a
+(current_station, status, timestamp) index, so a scan only reads the stuck
+rows.
+
+Alerts go to stuck_alerts, one per order and stay (order, station, status,
+since): an order that stays stuck is reported once, and its alert is
+resolved when the order moves on. New alerts are shown on the manager board
+and handed to a notifier, any object with send(messages) such as the outbox
+sinks (see outbox.sink_from_spec); failed notifications are retried on the
+next scan. Every worker runs a scanner: a scan claims the alerts it notifies
+by setting notified_at in its write transaction, so another scanner doing
+the same scan does not send them again.
+
+    python stuck.py scan
+    python stuck.py run --notify http://chat.local/hooks/production
+"""
+import argparse, calendar, json, os, sqlite3, threading, time
+
+from cycle_stats import MIN_SAMPLES, summary
+
+SCAN_SECONDS = 30
+FACTOR = 2.0
+MIN_MINUTES = 15.0
+DEFAULT_MINUTES = 120.0
+
+TIME_COLUMN = {"Pending": "queued_at", "In progress": "started_at", "Done": "finished_at"}
+
+def thresholds(conn, lanes):
+    """{(station, status): minutes} for lanes [(station, status, stat key, stat group), ...]."""
+    stats = {(st, m): summary(json.loads(state))
+             for st, m, state in conn.execute("SELECT station, metric, state FROM station_stats")}
+    out = {}
+    for station, status, key, group in lanes:
+        metric = "cycle" if status == "In progress" else "wait"
+        s = stats.get((key, metric))
+        if (not s or s["n"] < MIN_SAMPLES) and group:
+            s = stats.get((group, metric)) or s
+        p90 = s and (s["p90"] if s["p90"] is not None else s["mean"])
+        out[(station, status)] = max(MIN_MINUTES, FACTOR * p90) if p90 else DEFAULT_MINUTES
+    return out
+
+def find_stuck(conn, lanes, limits, now=None):
+    """[(order_id, order_number, station, status, since, minutes, threshold)], oldest first per lane."""
+    now = now or time.time()
+    found = []
+    for station, status, _, _ in lanes:
+        col = TIME_COLUMN[status]
+        limit = limits[(station, status)]
+        cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - limit * 60))
+        for oid, number, since in conn.execute(f"""
+            SELECT id, order_number, {col} FROM orders
+            WHERE current_station=? AND status=? AND {col} < ?
+            ORDER BY {col}
+        """, (station, status, cutoff)):
+            minutes = (now - calendar.timegm(time.strptime(since[:19], "%Y-%m-%d %H:%M:%S"))) / 60
+            found.append((oid, number, station, status, since, round(minutes, 1), round(limit, 1)))
+    return found
+
+def scan(conn, lanes, notifier=None, now=None):
+    """
+    One scan: records new alerts, resolves the ones whose order moved on and
+    notifies the pending ones. Returns (new alerts, resolved, notified).
+    """
+    now = now or time.time()
+    stuck = find_stuck(conn, lanes, thresholds(conn, lanes), now)
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("SELECT id, order_id, station, status, since FROM stuck_alerts WHERE resolved_at IS NULL")
+    open_alerts = {tuple(r[1:]): r[0] for r in c.fetchall()}
+    current = {(oid, station, status, since): (number, minutes, limit)
+               for oid, number, station, status, since, minutes, limit in stuck}
+    new = [k for k in current if k not in open_alerts]
+    c.executemany("""
+        INSERT INTO stuck_alerts (order_id, order_number, station, status, since, threshold_minutes, raised_at)
+        VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT(order_id, station, status, since)
+        DO UPDATE SET raised_at=excluded.raised_at, notified_at=NULL, resolved_at=NULL
+    """, [(k[0], current[k][0], k[1], k[2], k[3], current[k][2], now) for k in new])
+    gone = [aid for k, aid in open_alerts.items() if k not in current]
+    c.executemany("UPDATE stuck_alerts SET resolved_at=? WHERE id=?", [(now, aid) for aid in gone])
+    rows = []
+    if notifier is not None:
+        # Claim the alerts to notify before sending, released again if the send fails
+        c.execute("""
+            SELECT id, order_id, order_number, station, status, since, threshold_minutes FROM stuck_alerts
+            WHERE resolved_at IS NULL AND notified_at IS NULL ORDER BY id
+        """)
+        rows = c.fetchall()
+        c.executemany("UPDATE stuck_alerts SET notified_at=? WHERE id=?", [(now, r[0]) for r in rows])
+    conn.commit()
+
+    if rows:
+        messages = [{"topic": "order_stuck", "key": f"order_stuck:{r[0]}",
+                     "payload": {"order_id": r[1], "order_number": r[2], "station": r[3], "status": r[4],
+                                 "since": r[5], "threshold_minutes": r[6]}} for r in rows]
+        try:
+            notifier.send(messages)
+        except Exception:
+            conn.executemany("UPDATE stuck_alerts SET notified_at=NULL WHERE id=? AND notified_at=?",
+                             [(r[0], now) for r in rows])
+            conn.commit()
+            return len(new), len(gone), 0
+    return len(new), len(gone), len(rows)
+
+def open_alerts(conn, limit=50):
+    """Unresolved alerts, longest stuck first: (order_number, station, status, since, threshold_minutes, minutes)."""
+    return conn.execute("""
+        SELECT order_number, station, status, since, threshold_minutes,
+               round((julianday('now') - julianday(since)) * 1440, 1)
+        FROM stuck_alerts WHERE resolved_at IS NULL
+        ORDER BY since LIMIT ?
+    """, (limit,)).fetchall()
+
+class Scanner:
+    """Runs scan() every `seconds` on a daemon thread."""
+    def __init__(self, db_path, lanes, notifier=None, seconds=SCAN_SECONDS):
+        self.db_path, self.lanes, self.notifier, self.seconds = db_path, lanes, notifier, seconds
+        self.scans = 0
+        self.last_ms = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            t0 = time.perf_counter()
+            result = scan(conn, self.lanes, self.notifier)
+            self.last_ms = (time.perf_counter() - t0) * 1000
+            self.scans += 1
+            return result
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except sqlite3.Error:
+                pass
+            self._stop.wait(self.seconds)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="stuck-scanner", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+def main():
+    from outbox import sink_from_spec
+    import app
+    p = argparse.ArgumentParser(description="Stuck-order scanner")
+    p.add_argument("command", choices=["scan", "run"])
+    p.add_argument("--db", default=os.getenv("DB_PATH", "orders.db"))
+    p.add_argument("--notify", default=os.getenv("STUCK_NOTIFIER"), help="http(s)://url, file:path or queue")
+    a = p.parse_args()
+    notifier = sink_from_spec(a.notify) if a.notify else None
+    scanner = Scanner(a.db, app.STUCK_LANES, notifier)
+    if a.command == "scan":
+        new, resolved, notified = scanner.run_once()
+        conn = sqlite3.connect(a.db)
+        for number, station, status, since, limit, minutes in open_alerts(conn):
+            print(f"  {number:12} {station:10} {status:12} {minutes:7.0f} min (threshold {limit:.0f})")
+        conn.close()
+        print(f"{new} new, {resolved} resolved, {notified} notified in {scanner.last_ms:.1f} ms")
+        return
+    try:
+        scanner.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Line topology.
+
+The production line is declared once, as a list of stages in line order
+(app.TOPOLOGY). Each stage has a kind, its stations (the login areas) and
+the stage its jobs go to next:
+
+    intake     creates orders into the next stage's lanes (Preparing)
+    machine    stations that start and finish one job at a time from their own
+               Pending lane (CNC, edge banders); `capacity` caps each lane,
+               `topic` is the outbox message sent when a job is finished
+    transfer   moves the first Done job of each `source` machine lane on to
+               the next stage (Tramming 1 and 2)
+    slots      numbered slots instead of a lane (Wrapping)
+    loading    the end of the line
+
+compile() checks the declaration and turns it into a Routing table: station
+-> stage and stage -> next stage are dict lookups, and each stage's lane
+queries are built once with the queue policy's ORDER BY filled in, so a
+request formats no SQL. app.py compiles it at import for its module
+constants and again in create_app() with the app's QUEUE_POLICY.
+
+A fifth edge bander is one more station and capacity in the edge stage;
+another machine group is one more machine stage with a transfer before
+and after it.
+"""
+from collections import namedtuple
+
+from queue_policy import DEFAULT_POLICY, order_by
+
+KINDS = ("intake", "machine", "transfer", "slots", "loading")
+
+Stage = namedtuple("Stage", [
+    "name",         # stage and queue policy group, e.g. "edge"
+    "kind",         # one of KINDS
+    "label",        # shown on screens, e.g. "Edge"
+    "stations",     # login areas, in screen order
+    "capacity",     # {station: Pending lane size} for machine stages, else {}
+    "source",       # machine stage a transfer takes from, else None
+    "next",         # stage name jobs go to, None at the end of the line
+    "topic",        # outbox topic on finish, or None
+    "slots",        # slot numbers of a slots stage, else []
+    "endpoint",     # Flask endpoint of the station screen
+])
+
+Routing = namedtuple("Routing", [
+    "stages",       # {name: Stage}, in line order
+    "by_station",   # {station: Stage}
+    "sql",          # {stage name: {statement name: SQL}}
+])
+
+def _stage(spec):
+    kind = spec["kind"]
+    if kind not in KINDS:
+        raise ValueError(f"stage {spec.get('name')!r}: unknown kind {kind!r}")
+    stations = list(spec.get("stations") or [spec["name"]])
+    capacity = spec.get("capacity", {})
+    if not isinstance(capacity, dict):
+        capacity = {s: capacity for s in stations}
+    if kind == "machine" and set(capacity) != set(stations):
+        raise ValueError(f"stage {spec['name']!r}: capacity needed for each of {stations}")
+    return Stage(spec["name"], kind, spec.get("label", spec["name"].title()), stations, capacity,
+                 spec.get("source"), spec.get("next"), spec.get("topic"), list(spec.get("slots", [])),
+                 spec.get("endpoint", f"{spec['name']}_station"))
+
+def _statements(stage, policies):
+    policy = policies.get(stage.name, DEFAULT_POLICY)
+    if stage.kind == "machine":
+        pending = order_by(policy)
+        return {
+            "pending": f"""
+                SELECT id, order_number, datetime(queued_at,'localtime'),
+                       priority, datetime(due_at,'localtime')
+                FROM orders
+                WHERE current_station=? AND status='Pending'
+                ORDER BY {pending}""",
+            "in_progress": """
+                SELECT id, order_number, datetime(queued_at,'localtime'), datetime(started_at,'localtime')
+                FROM orders
+                WHERE current_station=? AND status='In progress'
+                ORDER BY started_at ASC NULLS LAST, queued_at ASC""",
+            "done": """
+                SELECT id, order_number, datetime(queued_at,'localtime'), datetime(finished_at,'localtime')
+                FROM orders
+                WHERE current_station=? AND status='Done'
+                ORDER BY finished_at ASC NULLS LAST, queued_at ASC""",
+            "first_pending": f"""
+                SELECT id FROM orders
+                WHERE current_station=? AND status='Pending'
+                ORDER BY {pending} LIMIT 1""",
+            "busy": "SELECT 1 FROM orders WHERE current_station=? AND status='In progress' LIMIT 1",
+            "pending_count": "SELECT COUNT(*) FROM orders WHERE current_station=? AND status='Pending'",
+        }
+    if stage.kind == "transfer":
+        done = order_by(policy, "finished_at")
+        return {
+            "source_done": f"""
+                SELECT id, order_number, datetime(finished_at,'localtime'), datetime(queued_at,'localtime'),
+                       priority, datetime(due_at,'localtime')
+                FROM orders
+                WHERE current_station=? AND status='Done'
+                ORDER BY {done}""",
+            "first_done": f"""
+                SELECT id FROM orders
+                WHERE current_station=? AND status='Done'
+                ORDER BY {done} LIMIT 1""",
+        }
+    return {}
+
+def compile(topology, policies=None):
+    """Routing for a list of stage dicts, raising ValueError for a broken line."""
+    stages = {}
+    for spec in topology:
+        stage = _stage(spec)
+        if stage.name in stages:
+            raise ValueError(f"stage {stage.name!r} declared twice")
+        stages[stage.name] = stage
+    by_station = {}
+    for stage in stages.values():
+        if stage.next is not None and stage.next not in stages:
+            raise ValueError(f"stage {stage.name!r}: next stage {stage.next!r} is not declared")
+        if stage.kind == "transfer":
+            if len(stage.stations) != 1:
+                raise ValueError(f"stage {stage.name!r}: a transfer stage is one station")
+            if stages.get(stage.source, stage).kind != "machine":
+                raise ValueError(f"stage {stage.name!r}: source must be a machine stage")
+            if stages[stage.source].next != stage.name:
+                raise ValueError(f"stage {stage.name!r}: {stage.source!r} does not go to it")
+            if stage.next is None or stages[stage.next].kind not in ("machine", "slots"):
+                raise ValueError(f"stage {stage.name!r}: next must be a machine or slots stage")
+        if stage.kind == "machine" and (stage.next is None or stages[stage.next].kind != "transfer"):
+            raise ValueError(f"stage {stage.name!r}: a machine stage goes to a transfer stage")
+        for station in stage.stations:
+            if station in by_station or station in stages and stages[station] is not stage:
+                raise ValueError(f"station {station!r} declared twice")
+            by_station[station] = stage
+    sql = {name: _statements(stage, policies or {}) for name, stage in stages.items()}
+    return Routing(stages, by_station, sql)
+
+def configure(routing, capacity, slots):
+    """
+    The routing with other lane capacities ({station: n}) and slot counts
+    ({slots stage: n}, numbered from 1), e.g. the admin page's; lanes and
+    stages not given keep theirs. The lane queries are shared.
+    """
+    stages = {}
+    for name, stage in routing.stages.items():
+        if stage.kind == "machine":
+            stage = stage._replace(capacity={s: capacity.get(s, n) for s, n in stage.capacity.items()})
+        elif stage.kind == "slots" and name in slots:
+            stage = stage._replace(slots=list(range(1, slots[name] + 1)))
+        stages[name] = stage
+    by_station = {station: stages[stage.name] for station, stage in routing.by_station.items()}
+    return Routing(stages, by_station, routing.sql)
+
+def machine_stages(routing):
+    return [s for s in routing.stages.values() if s.kind == "machine"]
+
+def next_station(routing, stage):
+    """The single station a job goes to from a machine or slots stage, e.g. cnc -> tramming1."""
+    return routing.stages[stage.next].stations[0] if stage.next else None
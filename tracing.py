@@ -0,0 +1,194 @@
+"""
+Request tracing and the sampling profiler.
+
+A traced request records spans: every SQL statement (its execute and each
+fetch), each template rendered, and the view-model steps a view marks with
+span(). Requests slower than the app's TRACE_SLOW_MS are appended to a
+rotating trace file (TraceFile) in the Chrome trace event format, one JSON
+event per line, which chrome://tracing, Perfetto and speedscope open as is.
+A request is one row of the timeline, with its SQL, view and render spans
+nested under it.
+
+Connections made with factory=TracedConnection record their statements while
+a trace is active on the thread; with no trace each call costs one
+thread-local lookup.
+
+profile() is the on-demand sampler behind /manager/profile: it reads the
+stacks of the threads serving requests every SAMPLE_SECONDS for a given
+time and returns them folded, one "frame;frame;frame count" line per
+distinct stack, for flamegraph.pl or speedscope.
+"""
+import collections, json, os, sqlite3, sys, threading, time
+from contextlib import contextmanager
+
+MAX_BYTES = 20 * 1024 * 1024    # per trace file before it rotates
+BACKUPS = 3                     # rotated files kept: trace.json.1 .. .3
+SAMPLE_SECONDS = 0.005
+LABEL_CHARS = 80                # of a statement's SQL, as its span name
+
+_local = threading.local()
+_requests = set()               # ids of the threads inside a traced request
+_labels = {}
+
+class Trace:
+    def __init__(self, name, args):
+        self.name, self.args = name, args
+        self.wall, self.start = time.time(), time.perf_counter()
+        self.end = None
+        self.spans = []             # (category, name, start, end) in perf_counter seconds
+        self.templates = []         # render start times, see app.trace_template_*
+
+    @property
+    def ms(self):
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def add(self, cat, name, t0, t1):
+        self.spans.append((cat, name, t0, t1))
+
+    def events(self):
+        """Chrome trace "complete" events, the request first."""
+        pid, tid = os.getpid(), threading.get_native_id()
+        us = lambda t: round((self.wall + t - self.start) * 1e6)
+        events = [{"name": self.name, "cat": "request", "ph": "X", "ts": us(self.start),
+                   "dur": round(self.ms * 1000), "pid": pid, "tid": tid, "args": self.args}]
+        events += [{"name": name, "cat": cat, "ph": "X", "ts": us(t0), "dur": round((t1 - t0) * 1e6),
+                    "pid": pid, "tid": tid} for cat, name, t0, t1 in self.spans]
+        return events
+
+def begin(name, **args):
+    """Starts tracing this thread's request."""
+    _local.trace = Trace(name, args)
+    _requests.add(threading.get_ident())
+    return _local.trace
+
+def end():
+    """Stops tracing this thread and returns its Trace, or None."""
+    trace, _local.trace = current(), None
+    _requests.discard(threading.get_ident())
+    if trace:
+        trace.end = time.perf_counter()
+    return trace
+
+def current():
+    return getattr(_local, "trace", None)
+
+@contextmanager
+def span(name, cat="view"):
+    trace = current()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(cat, name, t0, time.perf_counter())
+
+def _label(sql):
+    label = _labels.get(sql)
+    if label is None:
+        if len(_labels) > 1000:
+            _labels.clear()
+        label = _labels[sql] = " ".join(sql.split())[:LABEL_CHARS]
+    return label
+
+class TracedCursor(sqlite3.Cursor):
+    def _timed(self, name, call, *args):
+        trace = current()
+        if trace is None:
+            return call(*args)
+        t0 = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            trace.add("sql", name, t0, time.perf_counter())
+
+    def execute(self, sql, params=()):
+        return self._timed(_label(sql), super().execute, sql, params)
+
+    def executemany(self, sql, seq):
+        return self._timed(_label(sql), super().executemany, sql, seq)
+
+    def fetchone(self):
+        return self._timed("fetch", super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed("fetch", super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed("fetch", super().fetchall)
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or TracedCursor)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+class TraceFile:
+    """
+    Appends traces to a Chrome trace file, "[" and then one event per line.
+    The closing "]" is optional in that format, so the file is valid at any
+    moment. Past max_bytes it is renamed to .1 (.1 to .2 and so on).
+    """
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path, self.max_bytes, self.backups = path, max_bytes, backups
+        self._lock = threading.Lock()
+
+    def write(self, trace):
+        data = "".join(json.dumps(e, separators=(",", ":")) + ",\n" for e in trace.events())
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size and size + len(data) > self.max_bytes:
+                self._rotate()
+                size = 0
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(("" if size else "[\n") + data)
+
+    def _rotate(self):
+        for k in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{k}"):
+                os.replace(f"{self.path}.{k}", f"{self.path}.{k + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+_profiling = threading.Lock()
+
+def _frame(code, names={}):
+    name = names.get(code)
+    if name is None:
+        name = names[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name
+
+def profile(seconds, interval=SAMPLE_SECONDS, all_threads=False):
+    """
+    Samples for `seconds` and returns (samples taken, folded stacks as text),
+    or None when a profile is already running. Only threads inside a traced
+    request are sampled unless all_threads.
+    """
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        counts = collections.Counter()
+        samples, stop = 0, time.perf_counter() + seconds
+        while time.perf_counter() < stop:
+            for tid, frame in sys._current_frames().items():
+                if tid == me or not (all_threads or tid in _requests):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame(frame.f_code))
+                    frame = frame.f_back
+                counts[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+        return samples, "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+    finally:
+        _profiling.release()